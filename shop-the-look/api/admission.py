@@ -0,0 +1,145 @@
+import asyncio
+import math
+import time
+from collections import deque
+from starlette.responses import JSONResponse
+from api.config import settings
+from api.metrics import metrics, modality_for_path
+
+# Weight of the latest request in the moving average of the service time
+SERVICE_TIME_ALPHA = 0.2
+MAX_RETRY_AFTER_SEC = 60
+
+
+class Overloaded(Exception):
+    def __init__(self, reason, retry_after_sec):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after_sec = retry_after_sec
+
+
+class AdmissionLimiter:
+    """
+    Bounds the concurrent requests of one modality, with a bounded FIFO queue in front.
+
+    A request beyond `max_concurrent` waits for a slot, unless `max_queue` requests are waiting
+    already, or it would wait longer than `queue_timeout_sec`: then Overloaded is raised, with a
+    retry delay estimated from the recent service time and the queue ahead. A finished request
+    hands its slot straight to the next one waiting. `max_concurrent` 0 disables the limit.
+    """
+
+    def __init__(self, modality, max_concurrent, max_queue, queue_timeout_sec=10):
+        self.modality = modality
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout_sec = queue_timeout_sec
+        self.active = 0
+        self._waiters = deque()
+        self._service_sec = None
+
+    def retry_after_sec(self):
+        if self._service_sec is None or self.max_concurrent <= 0:
+            return 1
+        wait = self._service_sec * (len(self._waiters) + 1) / self.max_concurrent
+        return max(1, min(MAX_RETRY_AFTER_SEC, math.ceil(wait)))
+
+    def _report(self):
+        metrics.set_admission(self.modality, self.active, len(self._waiters))
+
+    async def acquire(self):
+        if self.max_concurrent <= 0 or (self.active < self.max_concurrent and not self._waiters):
+            self.active += 1
+            self._report()
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise Overloaded('queue_full', self.retry_after_sec())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._report()
+        try:
+            await asyncio.wait((waiter,), timeout=self.queue_timeout_sec or None)
+        except asyncio.CancelledError:
+            # The client went away, pass on a slot that was handed over in the meantime
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._leave(waiter)
+            raise
+        if not waiter.done():
+            self._leave(waiter)
+            raise Overloaded('timeout', self.retry_after_sec())
+
+    def _leave(self, waiter):
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._report()
+
+    def release(self, service_sec=None):
+        if service_sec is not None:
+            self._service_sec = service_sec if self._service_sec is None else \
+                (1 - SERVICE_TIME_ALPHA) * self._service_sec + SERVICE_TIME_ALPHA * service_sec
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot goes to the next request without being freed
+                waiter.set_result(None)
+                self._report()
+                return
+        self.active -= 1
+        self._report()
+
+    def stats(self):
+        return {"active": self.active, "queued": len(self._waiters), "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue}
+
+
+class AdmissionMiddleware:
+    """
+    Admits search requests through the limiter of their modality before their body is read.
+
+    `modalities` maps request paths to modalities as for TimingMiddleware. A request its limiter
+    sheds gets a 429 with a Retry-After header straight away, so a burst of uploads neither queues
+    without bound nor buffers its bodies, and each modality has slots of its own, so video uploads
+    cannot take the place of text searches.
+    """
+
+    def __init__(self, app, modalities, limiters):
+        self.app = app
+        self.modalities = modalities
+        self.limiters = limiters
+
+    async def __call__(self, scope, receive, send):
+        limiter = None
+        if scope["type"] == "http":
+            limiter = self.limiters.get(modality_for_path(self.modalities, scope.get("path", "")))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            await limiter.acquire()
+        except Overloaded as e:
+            metrics.record_shed(limiter.modality, e.reason)
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": f"Too many {limiter.modality} searches at the moment, please retry in {e.retry_after_sec} seconds."},
+                headers={"Retry-After": str(e.retry_after_sec)},
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - start)
+
+
+admission_limiters = {
+    modality: AdmissionLimiter(modality, max_concurrent, max_queue, settings.admission_queue_timeout_sec)
+    for modality, (max_concurrent, max_queue) in settings.admission_limits.items()
+}
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+from google.auth.transport.requests import Request
+from starlette.concurrency import run_in_threadpool
+from api.config import settings
+from api.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def utcnow():
+    # google-auth reports credential expiry as a naive UTC datetime
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class TokenManager:
+    """
+    Keeps a Google access token fresh for the Vertex AI calls.
+
+    The token is refreshed in the background `refresh_margin_sec` before the expiry reported by
+    the credentials (or halfway through its lifetime, for short-lived tokens), so requests are
+    served from the current token and never wait on a refresh while it is still valid. When there
+    is no valid token at all, concurrent callers share a single in-flight refresh. Refreshes run in
+    a worker thread, so they never block the event loop.
+    """
+
+    def __init__(self, credentials_provider, refresh_margin_sec=300, retry_interval_sec=5, default_lifetime_sec=3600):
+        self.credentials_provider = credentials_provider
+        self.refresh_margin = timedelta(seconds=refresh_margin_sec)
+        self.retry_interval_sec = retry_interval_sec
+        self.default_lifetime = timedelta(seconds=default_lifetime_sec)
+        self._token = None
+        self._expiry = None
+        self._refresh_at = None
+        self._refresh_task = None
+        self._background_task = None
+        self._request = None
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def _is_valid(self, now):
+        return self._token is not None and self._expiry is not None and now < self._expiry
+
+    async def get_token(self):
+        """Returns a valid access token, refreshing it only if there is none."""
+        now = utcnow()
+        if self._is_valid(now):
+            if now >= self._refresh_at:
+                # Still valid, so refresh without making this request wait for it
+                self._start_refresh()
+            return self._token
+
+        await asyncio.shield(self._start_refresh())
+        if not self._is_valid(utcnow()):
+            raise RuntimeError("Could not obtain a Google Cloud access token")
+        return self._token
+
+    def _start_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+            # Failures are logged in _refresh, background refreshes may have nobody awaiting them
+            self._refresh_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._refresh_task
+
+    async def _refresh(self):
+        try:
+            credentials = await run_in_threadpool(self.credentials_provider)
+            if self._request is None:
+                self._request = Request()
+            await run_in_threadpool(credentials.refresh, self._request)
+        except Exception as e:
+            self.refresh_failures += 1
+            metrics.record_token_refresh(False)
+            logger.error("Error refreshing access token: %s", e)
+            raise
+
+        now = utcnow()
+        self._token = credentials.token
+        self._expiry = credentials.expiry or now + self.default_lifetime
+        # Short-lived tokens are refreshed halfway through their lifetime at the latest
+        lifetime = self._expiry - now
+        self._refresh_at = now + max(lifetime - self.refresh_margin, lifetime / 2)
+        self.refreshes += 1
+        metrics.record_token_refresh(True)
+        logger.info("Access token refreshed, expires at %sZ", self._expiry.isoformat())
+
+    async def _run(self):
+        while True:
+            try:
+                if self._is_valid(utcnow()):
+                    wait = (self._refresh_at - utcnow()).total_seconds()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                await asyncio.shield(self._start_refresh())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await asyncio.sleep(self.retry_interval_sec)
+
+    def start(self):
+        """Starts refreshing the token in the background ahead of its expiry."""
+        if self._background_task is None or self._background_task.done():
+            self._background_task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._background_task is not None:
+            self._background_task.cancel()
+            try:
+                await self._background_task
+            except asyncio.CancelledError:
+                pass
+            self._background_task = None
+
+    def stats(self):
+        return {
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "expires_at": self._expiry.isoformat() + "Z" if self._expiry else None,
+        }
+
+
+token_manager = TokenManager(settings.get_credentials, refresh_margin_sec=settings.token_refresh_margin_sec)
@@ -0,0 +1,178 @@
+import asyncio
+import time
+import httpx
+from api.auth import token_manager
+from api.config import settings
+from api.deadlines import bounded, current_deadline, set_deadline
+from api.embeddings import embedding_client, extract_embedding
+
+
+class BatchStats:
+    """Counters for the embedding batcher, including how long requests waited for their batch."""
+
+    def __init__(self):
+        self.requests = 0
+        self.batches = 0
+        self.errors = 0
+        self.total_wait_sec = 0.0
+        self.max_wait_sec = 0.0
+
+    def record_batch(self, waits):
+        self.batches += 1
+        self.requests += len(waits)
+        self.total_wait_sec += sum(waits)
+        self.max_wait_sec = max(self.max_wait_sec, *waits)
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "errors": self.errors,
+            "avg_batch_size": round(self.requests / self.batches, 2) if self.batches else 0.0,
+            "avg_wait_ms": round(self.total_wait_sec / self.requests * 1000, 3) if self.requests else 0.0,
+            "max_wait_ms": round(self.max_wait_sec * 1000, 3),
+        }
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into multi-instance predict calls.
+
+    Requests of the same content type that arrive within `window_ms` of the first one are sent
+    together, up to `max_batch_size` instances per call, and each caller gets its own prediction
+    back. With `max_batch_size` of 1 (or no window) every request is sent on its own.
+    `get_access_token` is a coroutine function returning the current access token.
+
+    A batch is sent with the latest deadline of its requests, and each request waits for its own
+    prediction only until its own deadline.
+    """
+
+    def __init__(self, client, window_ms, max_batch_size, get_access_token):
+        self.client = client
+        self.window_sec = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.get_access_token = get_access_token
+        self._pending = {}
+        self._timers = {}
+        # The event loop only keeps weak references to tasks, so batches in flight are kept here
+        self._tasks = set()
+        self.stats = BatchStats()
+
+    @property
+    def enabled(self):
+        return self.max_batch_size > 1 and self.window_sec > 0
+
+    async def _access_token(self):
+        return await bounded(self.get_access_token(), settings.token_timeout, 'Google auth')
+
+    async def embed(self, content_type, content):
+        """Returns the embedding vector for `content`, possibly computed as part of a larger batch."""
+        if not self.enabled:
+            vector = await self.client.embed(await self._access_token(), content_type, content)
+            self.stats.record_batch([0.0])
+            return vector
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(content_type, [])
+        pending.append((content, future, time.perf_counter(), current_deadline()))
+
+        if len(pending) >= self.max_batch_size:
+            self._flush(content_type)
+        elif len(pending) == 1:
+            self._timers[content_type] = loop.call_later(self.window_sec, self._flush, content_type)
+
+        return await bounded(future, upstream='Vertex AI')
+
+    async def embed_many(self, content_type, contents):
+        """
+        Embeds a list of contents in as few predict calls as `max_batch_size` allows, sent concurrently.
+
+        :return: A list with the embedding vector, or the exception that prevented it, for each content
+        """
+        size = max(1, self.max_batch_size)
+        chunks = [contents[i:i + size] for i in range(0, len(contents), size)]
+        results = await asyncio.gather(*(self._embed_chunk(content_type, chunk) for chunk in chunks))
+        return [result for chunk_results in results for result in chunk_results]
+
+    async def _embed_chunk(self, content_type, chunk):
+        self.stats.record_batch([0.0] * len(chunk))
+        try:
+            access_token = await self._access_token()
+            predictions = await self.client.predict_batch(access_token, content_type, chunk)
+        except Exception as e:
+            self.stats.errors += 1
+            rejected = isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 400
+            if len(chunk) > 1 and rejected:
+                # One invalid instance fails the whole call, so the others are retried on their own
+                results = await asyncio.gather(*(self._embed_chunk(content_type, [content]) for content in chunk))
+                return [result for chunk_results in results for result in chunk_results]
+            return [e] * len(chunk)
+
+        results = []
+        for prediction in predictions:
+            try:
+                results.append(extract_embedding(content_type, prediction))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _flush(self, content_type):
+        timer = self._timers.pop(content_type, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(content_type, [])
+        if batch:
+            task = asyncio.ensure_future(self._send(content_type, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def stop(self):
+        """Cancels the batches waiting for their window and the ones in flight."""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for batch in self._pending.values():
+            for _, future, _, _ in batch:
+                future.cancel()
+        self._pending.clear()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _send(self, content_type, batch):
+        sent_at = time.perf_counter()
+        self.stats.record_batch([sent_at - enqueued_at for _, _, enqueued_at, _ in batch])
+        # Runs in a task of its own, so this only applies to the batch
+        deadlines = [deadline for _, _, _, deadline in batch]
+        set_deadline(None if None in deadlines else max(deadlines))
+        try:
+            access_token = await self._access_token()
+            predictions = await self.client.predict_batch(access_token, content_type, [content for content, _, _, _ in batch])
+        except asyncio.CancelledError:
+            for _, future, _, _ in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            self.stats.errors += 1
+            for _, future, _, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _, _), prediction in zip(batch, predictions):
+            if future.done():
+                continue
+            try:
+                future.set_result(extract_embedding(content_type, prediction))
+            except Exception as e:
+                future.set_exception(e)
+
+
+embedding_batcher = EmbeddingBatcher(
+    embedding_client,
+    settings.embedding_batch_window_ms,
+    settings.embedding_batch_max_size,
+    token_manager.get_token,
+)
@@ -0,0 +1,268 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from api.config import settings
+from api.images import cache_tag as image_cache_tag
+
+logger = logging.getLogger(__name__)
+
+
+def pack_vector(vector):
+    """Packs a vector into compact float32 bytes."""
+    return array('f', vector).tobytes()
+
+
+def unpack_vector(data):
+    """Unpacks float32 bytes written by `pack_vector` back into a list of floats."""
+    vector = array('f')
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+def normalize_query(text):
+    """Normalizes query text so trivially different spellings share a cache entry."""
+    return ' '.join(text.lower().split())
+
+
+class RedisBackend:
+    """
+    Shared cache backend so several workers can reuse each other's embeddings.
+
+    Requires the optional `redis` package (`pip install redis`).
+    """
+
+    def __init__(self, url, ttl_sec, prefix='stl:embedding:'):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise ImportError("The shared embedding cache requires the `redis` package, install it with `pip install redis`.") from e
+        self.client = redis.from_url(url)
+        self.ttl_sec = ttl_sec
+        self.prefix = prefix
+
+    def _key(self, key):
+        return self.prefix + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    async def get(self, key):
+        data = await self.client.get(self._key(key))
+        return unpack_vector(data) if data is not None else None
+
+    async def set(self, key, vector):
+        await self.client.set(self._key(key), pack_vector(vector), ex=int(self.ttl_sec) or None)
+
+
+class EmbeddingCache:
+    """
+    In-process LRU cache of embedding vectors with a size bound and TTL.
+
+    When a shared backend is configured, local misses fall through to it and entries found there
+    are promoted into the local LRU. Failures of the shared backend are counted and treated as misses.
+    """
+
+    def __init__(self, max_size, ttl_sec, backend=None):
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self.backend = backend
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.backend_errors = 0
+
+    def _get_local(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, vector = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return vector
+
+    def _set_local(self, key, vector):
+        if self.max_size <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_sec, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def get(self, key):
+        vector = self._get_local(key)
+        if vector is not None:
+            self.hits += 1
+            return vector
+
+        if self.backend is not None:
+            try:
+                vector = await self.backend.get(key)
+            except Exception as e:
+                self.backend_errors += 1
+                logger.warning("Shared embedding cache lookup failed: %s", e)
+                vector = None
+            if vector is not None:
+                self.shared_hits += 1
+                self._set_local(key, vector)
+                return vector
+
+        self.misses += 1
+        return None
+
+    async def set(self, key, vector):
+        self._set_local(key, vector)
+        if self.backend is not None:
+            try:
+                await self.backend.set(key, vector)
+            except Exception as e:
+                self.backend_errors += 1
+                logger.warning("Shared embedding cache write failed: %s", e)
+
+    def stats(self):
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            "backend_errors": self.backend_errors,
+        }
+
+
+class DiskVectorCache:
+    """
+    Content-addressed, size-bounded cache of upload embeddings on local disk.
+
+    Keys are content hashes of the raw upload, each vector is stored as a raw float32 file, and the
+    least recently used files are evicted once the directory grows past `max_bytes`. Methods do
+    blocking file I/O, so call them from a worker thread.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key.replace(':', '-') + '.f32')
+
+    def _scan(self):
+        """Returns (path, size, mtime) for every cached vector file."""
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith('.f32'):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _ensure_directory(self):
+        if self._total_bytes is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._total_bytes = sum(size for _, size, _ in self._scan())
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            # Bump the mtime so eviction treats this entry as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return unpack_vector(data)
+
+    def set(self, key, vector):
+        if not self.enabled:
+            return
+        data = pack_vector(vector)
+        with self._lock:
+            self._ensure_directory()
+            # Write to a temporary file first so concurrent readers never see a partial vector
+            path = self._path(key)
+            try:
+                # Rewriting an entry replaces its file, so only the difference in size is added
+                previous_size = os.stat(path).st_size
+            except FileNotFoundError:
+                previous_size = 0
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self._total_bytes += len(data) - previous_size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        self._total_bytes = total
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "bytes": self._total_bytes or 0,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+def content_key(content_type, contents):
+    """Cache key for an upload, derived from the SHA-256 of its raw bytes."""
+    return digest_key(content_type, hashlib.sha256(contents).hexdigest())
+
+
+def image_key(contents):
+    """Cache key for an uploaded image, which also depends on how images are preprocessed before embedding."""
+    tag = image_cache_tag(settings.image_max_edge, settings.image_jpeg_quality, settings.image_preprocess)
+    return content_key(f"image:{tag}", contents)
+
+
+def digest_key(content_type, hexdigest):
+    """Cache key for an upload whose SHA-256 was computed while it was streamed."""
+    return f"{content_type}:{hexdigest}"
+
+
+def create_text_embedding_cache(settings):
+    backend = None
+    if settings.embedding_cache_redis_url:
+        backend = RedisBackend(settings.embedding_cache_redis_url, settings.text_cache_ttl_sec, prefix='stl:embedding:text:')
+    return EmbeddingCache(settings.text_cache_max_size, settings.text_cache_ttl_sec, backend=backend)
+
+
+text_embedding_cache = create_text_embedding_cache(settings)
+upload_embedding_cache = DiskVectorCache(settings.upload_cache_dir, settings.upload_cache_max_bytes)
@@ -1,8 +1,11 @@
 import os
 import base64
-from datetime import datetime, timedelta
+import json
+import logging
+import tempfile
 from google.oauth2 import service_account
-from google.auth.transport.requests import Request
+
+logger = logging.getLogger(__name__)
 
 class Settings:
     def __init__(self):
@@ -11,44 +14,135 @@ class Settings:
         self.location = os.getenv('GOOGLE_CLOUD_PROJECT_LOCATION')
         self.gcs_bucket_name = os.getenv('GOOGLE_CLOUD_STORAGE_BUCKET_NAME')
         self.google_credentials_base64 = os.getenv('GOOGLE_CREDENTIALS_BASE64')
-        self.credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS') or '/tmp/google-credentials.json'
-        self.access_token = None
-        self.token_expiry = None
+        self.credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
         self.credentials = None
+        self.token_refresh_margin_sec = float(os.getenv('TOKEN_REFRESH_MARGIN_SEC', '300'))
+        self.token_timeout = float(os.getenv('TOKEN_TIMEOUT_SEC', '10'))
+
+        # Start-up warm-up, the backend reports ready on /api/ready once it has finished
+        self.warmup = os.getenv('WARMUP', 'true').lower() == 'true'
+        self.warmup_query = os.getenv('WARMUP_QUERY', '')
+        self.warmup_timeout_sec = float(os.getenv('WARMUP_TIMEOUT_SEC', '30'))
 
         # Pinecone services
         self.api_key = os.getenv('PINECONE_API_KEY')
         self.index_name = os.getenv('PINECONE_INDEX_NAME')
         self.k = int(os.getenv('PINECONE_TOP_K')) 
+        self.pinecone_host = os.getenv('PINECONE_HOST')
+        self.pinecone_timeout = float(os.getenv('PINECONE_TIMEOUT_SEC', '10'))
+        self.hedge_pinecone = os.getenv('HEDGE_PINECONE', 'false').lower() == 'true'
+        # Namespace of each modality's vectors, the default namespace holds both unless they are set
+        self.namespaces = {
+            'image': os.getenv('PINECONE_IMAGE_NAMESPACE', ''),
+            'video': os.getenv('PINECONE_VIDEO_NAMESPACE', ''),
+        }
+
+        # Vertex AI embedding client (shared connection pool)
+        self.vertex_api_base_url = os.getenv('VERTEX_API_BASE_URL') or f"https://{self.location}-aiplatform.googleapis.com"
+        self.vertex_http2 = os.getenv('VERTEX_HTTP2', 'true').lower() == 'true'
+        self.vertex_max_connections = int(os.getenv('VERTEX_MAX_CONNECTIONS', '100'))
+        self.vertex_max_keepalive_connections = int(os.getenv('VERTEX_MAX_KEEPALIVE_CONNECTIONS', '20'))
+        self.vertex_keepalive_expiry = float(os.getenv('VERTEX_KEEPALIVE_EXPIRY_SEC', '30'))
+        self.vertex_timeout = float(os.getenv('VERTEX_TIMEOUT_SEC', '60'))
+        self.hedge_vertex = os.getenv('HEDGE_VERTEX', 'false').lower() == 'true'
+        self.embedding_batch_window_ms = float(os.getenv('EMBEDDING_BATCH_WINDOW_MS', '10'))
+        self.embedding_batch_max_size = int(os.getenv('EMBEDDING_BATCH_MAX_SIZE', '1'))
+
+        # Embedding caches
+        self.text_cache_max_size = int(os.getenv('TEXT_CACHE_MAX_SIZE', '10000'))
+        self.text_cache_ttl_sec = float(os.getenv('TEXT_CACHE_TTL_SEC', '86400'))
+        self.embedding_cache_redis_url = os.getenv('EMBEDDING_CACHE_REDIS_URL')
+        self.upload_cache_dir = os.getenv('UPLOAD_CACHE_DIR') or '/tmp/stl-embedding-cache'
+        self.upload_cache_max_bytes = int(os.getenv('UPLOAD_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+        # Image preprocessing before embedding
+        self.image_preprocess = os.getenv('IMAGE_PREPROCESS', 'true').lower() == 'true'
+        self.image_max_edge = int(os.getenv('IMAGE_MAX_EDGE', '1024'))
+        self.image_jpeg_quality = int(os.getenv('IMAGE_JPEG_QUALITY', '90'))
+
+        # Query video preprocessing before embedding
+        self.video_preprocess = os.getenv('VIDEO_PREPROCESS', 'true').lower() == 'true'
+        self.video_query_start_sec = int(os.getenv('VIDEO_QUERY_START_SEC', '0'))
+        self.video_query_segments = int(os.getenv('VIDEO_QUERY_SEGMENTS', '1'))
+        self.video_segment_sec = int(os.getenv('VIDEO_SEGMENT_SEC', '16'))
+        self.video_transcode = os.getenv('VIDEO_TRANSCODE', 'false').lower() == 'true'
+        self.video_max_height = int(os.getenv('VIDEO_MAX_HEIGHT', '480'))
+        self.video_bitrate = os.getenv('VIDEO_BITRATE', '1M')
+        self.video_preprocess_concurrency = int(os.getenv('VIDEO_PREPROCESS_CONCURRENCY', str(os.cpu_count() or 4)))
+        self.ffmpeg_path = os.getenv('FFMPEG_PATH', 'ffmpeg')
+
+        # Uploads
+        self.upload_tmp_dir = os.getenv('UPLOAD_TMP_DIR') or os.path.join(tempfile.gettempdir(), 'stl-uploads')
+        # Vertex AI rejects base64 video strings over 27,000,000 characters, i.e. 20,250,000 raw bytes
+        self.video_max_upload_bytes = int(os.getenv('VIDEO_MAX_UPLOAD_BYTES', '20250000'))
+
+        # Admission control: concurrent searches per modality and how many more may wait for a slot,
+        # requests beyond that are shed with 429 before their body is read
+        admission_defaults = {'text': (64, 256), 'similar': (64, 256), 'image': (8, 32), 'video': (2, 8), 'batch': (2, 8)}
+        self.admission_limits = {
+            modality: (int(os.getenv(f'ADMISSION_{modality.upper()}_CONCURRENCY', str(concurrency))),
+                       int(os.getenv(f'ADMISSION_{modality.upper()}_QUEUE', str(queue))))
+            for modality, (concurrency, queue) in admission_defaults.items()
+        }
+        self.admission_queue_timeout_sec = float(os.getenv('ADMISSION_QUEUE_TIMEOUT_SEC', '10'))
+        # Threads for CPU-bound stages (image decoding, base64 encoding), apart from the I/O thread pool
+        self.cpu_workers = int(os.getenv('CPU_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+        # Deadlines: the seconds a search of each modality has from its arrival, every upstream call
+        # (token, embedding, vector query) gets at most what is left of it, 0 disables the deadline
+        deadline_defaults = {'text': 10, 'similar': 10, 'image': 20, 'video': 60, 'batch': 30}
+        self.search_deadlines = {
+            modality: float(os.getenv(f'SEARCH_DEADLINE_{modality.upper()}_SEC', str(budget)))
+            for modality, budget in deadline_defaults.items()
+        }
+        # Hedged upstream calls: a duplicate is sent when a call is slower than this percentile
+        self.hedge_percentile = float(os.getenv('HEDGE_PERCENTILE', '95'))
+        self.hedge_min_delay_ms = float(os.getenv('HEDGE_MIN_DELAY_MS', '50'))
+
+        # Index statistics served by /index/info, refreshed in the background
+        self.index_stats_ttl_sec = float(os.getenv('INDEX_STATS_TTL_SEC', '300'))
+        self.index_stats_max_stale_sec = float(os.getenv('INDEX_STATS_MAX_STALE_SEC', '3600'))
+
+        # Local replica of the index, searched in memory instead of querying Pinecone
+        self.replica_dir = os.getenv('REPLICA_DIR')
+        self.replica_max_age_sec = float(os.getenv('REPLICA_MAX_AGE_SEC', '86400'))
+        self.replica_refresh_sec = float(os.getenv('REPLICA_REFRESH_SEC', '60'))
+        self.replica_block_rows = int(os.getenv('REPLICA_BLOCK_ROWS', '2048'))
+
+        # Batch search
+        self.search_batch_max_items = int(os.getenv('SEARCH_BATCH_MAX_ITEMS', '32'))
+        self.search_batch_max_top_k = int(os.getenv('SEARCH_BATCH_MAX_TOP_K', '100'))
+        self.search_batch_max_upload_bytes = int(os.getenv('SEARCH_BATCH_MAX_UPLOAD_BYTES', str(50 * 1000 * 1000)))
+
+        # Diagnostics
+        self.log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
+        self.server_timing = os.getenv('SERVER_TIMING', 'true').lower() == 'true'
+        self.slow_request_ms = float(os.getenv('SLOW_REQUEST_MS', '2000'))
+        self.slow_request_sample_rate = float(os.getenv('SLOW_REQUEST_SAMPLE_RATE', '1.0'))
     
     def get_credentials(self):
         if self.credentials:
             return self.credentials
 
+        credential_source = None
+        scopes = ['https://www.googleapis.com/auth/cloud-platform']
         try:
-            # Case 1: Using GOOGLE_CREDENTIALS_BASE64
+            # Case 1: Using GOOGLE_CREDENTIALS_BASE64, decoded in memory without writing the key to disk
             if self.google_credentials_base64:
-                print("Loading Google credentials from GOOGLE_CREDENTIALS_BASE64")
-                google_credentials = base64.b64decode(self.google_credentials_base64).decode('utf-8')
-                with open(self.credentials_path, 'w') as f:
-                    f.write(google_credentials)
-                os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = self.credentials_path
                 credential_source = "GOOGLE_CREDENTIALS_BASE64"
+                google_credentials = json.loads(base64.b64decode(self.google_credentials_base64))
+                self.credentials = service_account.Credentials.from_service_account_info(google_credentials, scopes=scopes)
 
             # Case 2: Using existing service account JSON file
-            elif os.path.exists(self.credentials_path):
+            elif self.credentials_path and os.path.exists(self.credentials_path):
                 credential_source = "GOOGLE_APPLICATION_CREDENTIALS file"
+                self.credentials = service_account.Credentials.from_service_account_file(self.credentials_path, scopes=scopes)
 
             # Case 3: No credentials available
             else:
                 raise ValueError("Google credentials not found. Please set GOOGLE_CREDENTIALS_BASE64 or ensure GOOGLE_APPLICATION_CREDENTIALS points to a valid file.")
 
-            # Load credentials from the file (works for both Case 1 and Case 2)
-            self.credentials = service_account.Credentials.from_service_account_file(
-                self.credentials_path,
-                scopes=['https://www.googleapis.com/auth/cloud-platform']
-            )
-            print(f"Successfully loaded Google credentials from {credential_source}")
+            logger.info("Successfully loaded Google credentials from %s", credential_source)
             return self.credentials
 
         except Exception as e:
@@ -61,20 +155,14 @@ class Settings:
             )
             raise ValueError(error_message) from e
 
-    def get_access_token(self):
-        if self.access_token and self.token_expiry and datetime.now() < self.token_expiry:
-            return self.access_token
+    def get_embedding_url(self):
+        return f"{self.vertex_api_base_url}/v1/projects/{self.project_id}/locations/{self.location}/publishers/google/models/multimodalembedding@001:predict"
 
-        try:
-            credentials = self.get_credentials()
-            credentials.refresh(Request())
-            self.access_token = credentials.token
-            self.token_expiry = datetime.now() + timedelta(hours=1)
-            print("Access token refreshed", self.access_token)
-            return self.access_token
-        except Exception as e:
-            print(f"Error getting access token: {str(e)}")
-            return None
+    def get_embedding_headers(self, access_token):
+        return {
+            "Authorization": f"Bearer {access_token}",
+            "Content-Type": "application/json"
+        }
 
     def get_embedding_request_data(self, access_token, content_type, content):
         """
@@ -85,23 +173,33 @@ class Settings:
         :param content: The actual content (query string for text, base64 encoded string for image/video)
         :return: A tuple containing the URL, headers, and data for the API request
         """
-        url = f"https://{self.location}-aiplatform.googleapis.com/v1/projects/{self.project_id}/locations/{self.location}/publishers/google/models/multimodalembedding@001:predict"
-        
-        headers = {
-            "Authorization": f"Bearer {access_token}",
-            "Content-Type": "application/json"
-        }
+        return self.get_batch_embedding_request_data(access_token, content_type, [content])
 
-        instance = {}
-        if content_type == 'text':
-            instance["text"] = content
-        elif content_type in ['image', 'video']:
-            instance[content_type] = {"bytesBase64Encoded": content}
-        else:
-            raise ValueError(f"Unsupported content type: {content_type}")
+    def get_batch_embedding_request_data(self, access_token, content_type, contents):
+        """
+        Prepares the request data for a multi-instance call to the multimodal embedding API.
+
+        :param access_token: The access token for authentication
+        :param content_type: The type of content ('text', 'image', or 'video')
+        :param contents: A list of contents, each becomes one instance of the predict request
+        :return: A tuple containing the URL, headers, and data for the API request
+        """
+        url = self.get_embedding_url()
+        headers = self.get_embedding_headers(access_token)
+
+        instances = []
+        for content in contents:
+            instance = {}
+            if content_type == 'text':
+                instance["text"] = content
+            elif content_type in ['image', 'video']:
+                instance[content_type] = {"bytesBase64Encoded": content}
+            else:
+                raise ValueError(f"Unsupported content type: {content_type}")
+            instances.append(instance)
 
         data = {
-            "instances": [instance]
+            "instances": instances
         }
 
         return url, headers, data
@@ -0,0 +1,143 @@
+import asyncio
+import time
+from collections import deque
+from contextvars import ContextVar
+from api.metrics import metrics, modality_for_path
+
+# Latencies kept per upstream to pick the hedging delay from
+HEDGE_WINDOW = 200
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+_deadline = ContextVar('request_deadline', default=None)
+
+
+def current_deadline():
+    """The `time.monotonic()` by which the current request must be answered, or None."""
+    return _deadline.get()
+
+
+def set_deadline(deadline):
+    """Sets the deadline of the current context, e.g. of a task serving several requests, and returns the reset token."""
+    return _deadline.set(deadline)
+
+
+def time_left(timeout=None):
+    """
+    Returns how long the next upstream call may take: `timeout`, cut to what is left of the request deadline.
+
+    Raises DeadlineExceeded when the deadline has already passed, and returns None when there is
+    neither a timeout nor a deadline.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return timeout
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("The search took longer than its deadline")
+    return left if timeout is None else min(timeout, left)
+
+
+async def bounded(awaitable, timeout=None, upstream='upstream'):
+    """Awaits `awaitable` for at most `time_left(timeout)`, raising DeadlineExceeded instead of waiting longer."""
+    try:
+        limit = time_left(timeout)
+    except DeadlineExceeded:
+        # Never awaited, close it so it is not reported as such
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    try:
+        return await asyncio.wait_for(awaitable, limit)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded(f"{upstream} did not respond within {limit:.2f} seconds") from None
+
+
+class Hedge:
+    """
+    Hedged calls to one upstream.
+
+    When a call has not returned after the `percentile` latency of the recent successful calls
+    (and at least `min_delay_ms`), a duplicate is sent and whichever finishes first is used, the
+    other is cancelled. This cuts the tail latency caused by a slow connection or replica at the
+    cost of about `100 - percentile` percent more calls. Until `min_samples` latencies have been
+    seen, or when disabled, calls are sent once. Only use it for idempotent calls.
+    """
+
+    def __init__(self, upstream, enabled=False, percentile=95, min_delay_ms=50, min_samples=20):
+        self.upstream = upstream
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay_sec = min_delay_ms / 1000
+        self.min_samples = min_samples
+        self._latencies = deque(maxlen=HEDGE_WINDOW)
+
+    def delay_sec(self):
+        if not self.enabled or len(self._latencies) < self.min_samples:
+            return None
+        ordered = sorted(self._latencies)
+        rank = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay_sec, ordered[rank])
+
+    async def _timed(self, call):
+        start = time.perf_counter()
+        result = await call()
+        self._latencies.append(time.perf_counter() - start)
+        return result
+
+    async def run(self, call):
+        """Returns the result of `call()`, a coroutine function, hedged with a second call when it is slow."""
+        delay = self.delay_sec()
+        if delay is None:
+            return await self._timed(call)
+
+        primary = asyncio.ensure_future(self._timed(call))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                tasks.append(asyncio.ensure_future(self._timed(call)))
+            while True:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    # A failed call still leaves the other one a chance to succeed
+                    if task.exception() is None or len(tasks) == 1:
+                        if len(tasks) > 1:
+                            metrics.record_hedge(self.upstream, 'primary' if task is primary else 'hedge')
+                        return task.result()
+                    tasks.remove(task)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+class DeadlineMiddleware:
+    """
+    Gives each search request a deadline, `budgets` seconds after it arrived, per modality.
+
+    `modalities` maps request paths to modalities as for TimingMiddleware. The upstream calls
+    made while serving the request take at most the time left (see `time_left`), so a stalled
+    connection fails the request with a 504 instead of holding it.
+    """
+
+    def __init__(self, app, modalities, budgets):
+        self.app = app
+        self.modalities = modalities
+        self.budgets = budgets
+
+    async def __call__(self, scope, receive, send):
+        budget = None
+        if scope["type"] == "http":
+            budget = self.budgets.get(modality_for_path(self.modalities, scope.get("path", "")))
+        if not budget:
+            await self.app(scope, receive, send)
+            return
+
+        token = _deadline.set(time.monotonic() + budget)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _deadline.reset(token)
@@ -1,5 +1,39 @@
 from pinecone import Pinecone
 from api.config import settings
 
-pc = Pinecone(api_key=settings.api_key, source_tag="pinecone:stl_sample_app")
-index = pc.Index(settings.index_name)
+# Set by `connect()` when the app starts
+pc = None
+index = None
+# Optional in-memory replica, queries fall back to Pinecone without a fresh snapshot
+replica = None
+
+
+def connect():
+    """
+    Creates the Pinecone client and index, wrapped by the local replica when one is configured.
+
+    Called when the app starts rather than at import, so importing the API makes no network calls.
+    Does nothing when `index` is already set, e.g. to a stand-in.
+    """
+    global pc, index, replica
+    if index is not None:
+        return index
+
+    pc = Pinecone(api_key=settings.api_key, source_tag="pinecone:stl_sample_app")
+    # Connecting by host skips the describe_index lookup the client otherwise does on startup
+    if settings.pinecone_host:
+        pinecone_index = pc.Index(host=settings.pinecone_host)
+    else:
+        pinecone_index = pc.Index(settings.index_name)
+
+    if settings.replica_dir:
+        from api.replica import ReplicaIndex
+        replica = pinecone_index = ReplicaIndex(
+            pinecone_index,
+            settings.replica_dir,
+            max_age_sec=settings.replica_max_age_sec,
+            refresh_interval_sec=settings.replica_refresh_sec,
+            block_rows=settings.replica_block_rows,
+        )
+    index = pinecone_index
+    return index
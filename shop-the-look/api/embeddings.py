@@ -0,0 +1,116 @@
+import importlib.util
+import httpx
+from api.config import settings
+from api.deadlines import Hedge, bounded
+
+
+def extract_embedding(content_type, prediction, video_segments=1):
+    """
+    Pulls the embedding vector for the given content type out of a single prediction.
+
+    Video predictions contain one embedding per segment. The first `video_segments` of them are
+    averaged into the search vector, by default only the first segment is used.
+    """
+    if content_type == 'video':
+        embeddings = [segment['embedding'] for segment in prediction['videoEmbeddings'][:video_segments]]
+        if len(embeddings) == 1:
+            return embeddings[0]
+        return [sum(values) / len(embeddings) for values in zip(*embeddings)]
+    return prediction[f'{content_type}Embedding']
+
+
+class EmbeddingClient:
+    """
+    Shared async client for the Vertex AI multimodal embedding API.
+
+    One pooled httpx.AsyncClient is reused by every search request, so connections to Vertex
+    are kept alive (and multiplexed over HTTP/2 when `h2` is installed) and a slow predict call
+    only holds its own connection instead of blocking the event loop.
+
+    Every call takes at most `vertex_timeout` seconds, or what is left of the request deadline.
+    Predict calls with an inline body can be hedged (`hedge_vertex`), see `api.deadlines.Hedge`.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self._client = None
+        self.hedge = Hedge('vertex', settings.hedge_vertex, settings.hedge_percentile, settings.hedge_min_delay_ms)
+
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            http2 = self.settings.vertex_http2 and importlib.util.find_spec('h2') is not None
+            self._client = httpx.AsyncClient(
+                http2=http2,
+                limits=httpx.Limits(
+                    max_connections=self.settings.vertex_max_connections,
+                    max_keepalive_connections=self.settings.vertex_max_keepalive_connections,
+                    keepalive_expiry=self.settings.vertex_keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.settings.vertex_timeout),
+            )
+        return self._client
+
+    async def warm_up(self):
+        """Opens a pooled connection to Vertex AI ahead of the first predict call."""
+        # Whatever the response, the connection stays open in the pool
+        response = await self._get_client().get(self.settings.vertex_api_base_url)
+        await response.aclose()
+
+    async def predict(self, access_token, content_type, content):
+        """
+        Sends a predict request to the multimodal embedding model.
+
+        :param access_token: The access token for authentication
+        :param content_type: The type of content ('text', 'image', or 'video')
+        :param content: The query string for text, base64 encoded string for image/video
+        :return: The list of predictions returned by Vertex AI
+        """
+        url, headers, data = self.settings.get_embedding_request_data(access_token, content_type, content)
+        return await self._post_hedged(url, headers, data)
+
+    async def _post(self, url, headers, **kwargs):
+        response = await self._get_client().post(url, headers=headers, **kwargs)
+        response.raise_for_status()
+        return response.json()['predictions']
+
+    async def _post_hedged(self, url, headers, data):
+        return await bounded(self.hedge.run(lambda: self._post(url, headers, json=data)), self.settings.vertex_timeout, 'Vertex AI')
+
+    async def predict_batch(self, access_token, content_type, contents):
+        """
+        Sends one predict request with an instance per content.
+
+        :return: The list of predictions, in the same order as `contents`
+        """
+        url, headers, data = self.settings.get_batch_embedding_request_data(access_token, content_type, contents)
+        predictions = await self._post_hedged(url, headers, data)
+        if len(predictions) != len(contents):
+            raise ValueError(f"Expected {len(contents)} predictions from Vertex AI, got {len(predictions)}")
+        return predictions
+
+    async def predict_stream(self, access_token, body):
+        """
+        Sends a predict request whose JSON body is produced in chunks while it is uploaded.
+
+        :param body: An async iterable of bytes chunks with a `content_length` attribute,
+                     such as `api.uploads.Base64PredictBody`
+        :return: The list of predictions returned by Vertex AI
+        """
+        headers = self.settings.get_embedding_headers(access_token)
+        headers["Content-Length"] = str(body.content_length)
+        # Never hedged, the body is a whole upload
+        return await bounded(self._post(self.settings.get_embedding_url(), headers, content=body),
+                             self.settings.vertex_timeout, 'Vertex AI')
+
+    async def embed(self, access_token, content_type, content):
+        """Returns the embedding vector for a single piece of content."""
+        predictions = await self.predict(access_token, content_type, content)
+        return extract_embedding(content_type, predictions[0])
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+embedding_client = EmbeddingClient(settings)
@@ -0,0 +1,79 @@
+import base64
+import io
+from PIL import Image, ImageOps
+
+# Vertex AI Multimodal Embedding Model only supports the following image formats
+SUPPORTED_IMAGE_FORMATS = ['bmp', 'gif', 'jpeg', 'png', 'jpg']
+
+
+class UnsupportedImageFormat(ValueError):
+    pass
+
+
+def preprocess_image(contents, max_edge, jpeg_quality, preprocess=True):
+    """
+    Validates an uploaded image and prepares it for the embedding model.
+
+    The image is decoded once. When `preprocess` is enabled it is rotated according to its EXIF
+    orientation, downscaled so its longest edge is at most `max_edge` pixels and re-encoded as
+    JPEG, because the model works on a much lower resolution than typical phone photos. Small
+    JPEGs that need no rotation are sent as they are. This is CPU bound, run it in a worker thread.
+
+    :param contents: The raw uploaded bytes
+    :return: The image bytes to embed
+    """
+    with Image.open(io.BytesIO(contents)) as img:
+        file_format = (img.format or '').lower()
+        if file_format not in SUPPORTED_IMAGE_FORMATS:
+            raise UnsupportedImageFormat(file_format)
+
+        if not preprocess:
+            return contents
+
+        needs_rotation = img.getexif().get(0x0112, 1) != 1
+        if file_format == 'jpeg' and not needs_rotation and max(img.size) <= max_edge:
+            return contents
+
+        # Lets the JPEG decoder scale down by a power of two while decoding, which is much cheaper
+        if file_format == 'jpeg':
+            img.draft('RGB', (max_edge, max_edge))
+
+        image = ImageOps.exif_transpose(img)
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+            # Flatten transparency onto white, as JPEG has no alpha channel
+            rgba = image.convert('RGBA')
+            image = Image.new('RGB', rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel('A'))
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=jpeg_quality, optimize=True)
+        prepared = output.getvalue()
+
+    # Never send more than the original upload
+    if len(prepared) >= len(contents) and not needs_rotation:
+        return contents
+    return prepared
+
+
+def cache_tag(max_edge, jpeg_quality, preprocess=True):
+    """Distinguishes cached upload embeddings made with other preprocessing settings."""
+    return f"{max_edge}q{jpeg_quality}" if preprocess else "original"
+
+
+def encode_image(image_bytes):
+    """Base64 encodes image bytes for a predict request."""
+    return base64.b64encode(image_bytes).decode('utf-8')
+
+
+def prepare_image(contents, max_edge, jpeg_quality, preprocess=True):
+    """
+    Preprocesses and base64 encodes an uploaded image, see `preprocess_image`.
+
+    :return: A tuple of the base64 encoded image to embed and its size in bytes before encoding
+    """
+    prepared = preprocess_image(contents, max_edge, jpeg_quality, preprocess)
+    return encode_image(prepared), len(prepared)
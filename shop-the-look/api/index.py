@@ -1,18 +1,97 @@
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from api.v1.endpoints import text, image, video, index
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from api import deps
+from api.admission import AdmissionMiddleware, admission_limiters
+from api.deadlines import DeadlineMiddleware
+from api.auth import token_manager
+from api.batcher import embedding_batcher
+from api.config import settings
+from api.embeddings import embedding_client
+from api.metrics import TimingMiddleware
+from api.stats import index_stats
+from api.uploads import UploadSizeLimitMiddleware
+from api.warmup import warmup
+from api.workers import cpu_workers
+from api.v1.endpoints import text, image, video, batch, similar, index, cache, embeddings, metrics
 
-app = FastAPI()
+logging.basicConfig(level=settings.log_level, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+# httpx logs every Vertex AI request at INFO
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+@asynccontextmanager
+async def lifespan(app):
+    # Connect and warm up before serving, so the first search does not pay for it
+    await run_in_threadpool(deps.connect)
+    token_manager.start()
+    index_stats.start()
+    if deps.replica is not None:
+        deps.replica.start()
+    warmup.start()
+    await warmup.wait(settings.warmup_timeout_sec)
+    yield
+    await warmup.stop()
+    await token_manager.stop()
+    await index_stats.stop()
+    if deps.replica is not None:
+        await deps.replica.stop()
+    await embedding_batcher.stop()
+    await embedding_client.aclose()
+    cpu_workers.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/api")
 async def root():
     return {"message": "Welcome to the Shop The Look API!"}
 
+@app.get("/api/ready")
+async def ready():
+    """Reports whether the start-up warm-up has finished, with 503 until it has."""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
+# Reject oversized video and batch uploads before the multipart body is parsed and spooled to disk
+app.add_middleware(UploadSizeLimitMiddleware, limits={
+    "/api/search/video": settings.video_max_upload_bytes,
+    "/api/search/batch": settings.search_batch_max_upload_bytes,
+})
+
+# Search paths and the modality they are limited and timed as
+search_modalities = {
+    "/api/search/text": "text",
+    "/api/search/image": "image",
+    "/api/search/video": "video",
+    "/api/search/batch": "batch",
+    "/api/search/similar": "similar",
+    "/api/search/similar/": "similar",
+}
+
+# Per-modality concurrency limits, excess requests are shed with 429 before their upload is read
+app.add_middleware(AdmissionMiddleware, modalities=search_modalities, limiters=admission_limiters)
+
+# Per-modality deadlines, counted from the arrival of a search so they include the wait for admission
+app.add_middleware(DeadlineMiddleware, modalities=search_modalities, budgets=settings.search_deadlines)
+
+# Stage timings of the searches, returned as Server-Timing headers and aggregated on /api/metrics
+app.add_middleware(
+    TimingMiddleware,
+    modalities=search_modalities,
+    slow_request_ms=settings.slow_request_ms,
+    sample_rate=settings.slow_request_sample_rate,
+    server_timing=settings.server_timing,
+)
+
 # Add CORS middleware
 # CORS is important for:
 # 1. Allowing controlled cross-origin access
 # 2. Enhancing security
 # 3. Enabling API interactions across domains
+# Added last, so it is the outermost middleware and the 413 and 429 responses of the
+# middlewares above carry the CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -25,4 +104,9 @@ app.add_middleware(
 app.include_router(text.router, prefix="/api")
 app.include_router(image.router, prefix="/api")
 app.include_router(video.router, prefix="/api")
-app.include_router(index.router, prefix="/api")
\ No newline at end of file
+app.include_router(batch.router, prefix="/api")
+app.include_router(similar.router, prefix="/api")
+app.include_router(index.router, prefix="/api")
+app.include_router(cache.router, prefix="/api")
+app.include_router(embeddings.router, prefix="/api")
+app.include_router(metrics.router, prefix="/api")
\ No newline at end of file
@@ -0,0 +1,267 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in labels) + '}'
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, labels, value):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0, 0.0]
+        counts = series[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        series[1] += 1
+        series[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for labels, (counts, count, total) in sorted(self._series.items()):
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{_format_labels(labels + (("le", repr(bound)),))} {bucket_count}')
+            lines.append(f'{self.name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(labels)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(labels)} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._series = {}
+
+    def inc(self, labels, amount=1):
+        self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self._series.items()):
+            lines.append(f'{self.name}{_format_labels(labels)} {value}')
+        return lines
+
+
+class Gauge:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._series = {}
+
+    def set(self, labels, value):
+        self._series[labels] = value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge']
+        for labels, value in sorted(self._series.items()):
+            lines.append(f'{self.name}{_format_labels(labels)} {value}')
+        return lines
+
+
+class Metrics:
+    """
+    In-process registry of the API's latency histograms and counters.
+
+    Labels are passed as tuples of `(name, value)` pairs. `render` returns the Prometheus text
+    exposition format served on `/api/metrics`; each worker process keeps its own registry.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_duration = Histogram('stl_request_duration_seconds', 'Search request latency.')
+        self.stage_duration = Histogram('stl_stage_duration_seconds', 'Latency of each stage of a search request.')
+        self.requests = Counter('stl_requests_total', 'Search requests by response status.')
+        self.cache_lookups = Counter('stl_cache_lookups_total', 'Embedding cache lookups by result.')
+        self.upstream_errors = Counter('stl_upstream_errors_total', 'Failed calls to Vertex AI and Pinecone.')
+        self.token_refreshes = Counter('stl_token_refreshes_total', 'Google access token refreshes by result.')
+        self.slow_requests = Counter('stl_slow_requests_total', 'Search requests slower than SLOW_REQUEST_MS.')
+        self.replica_queries = Counter('stl_replica_queries_total', 'Vector queries by where they were served from.')
+        self.admission_active = Gauge('stl_admission_active', 'Search requests being served, per modality.')
+        self.admission_queued = Gauge('stl_admission_queued', 'Search requests waiting for a slot, per modality.')
+        self.hedges = Counter('stl_hedged_calls_total', 'Upstream calls that were hedged, by the call that answered first.')
+        self.admission_shed = Counter('stl_admission_shed_total', 'Search requests rejected with 429 by admission control.')
+
+    def observe_stage(self, modality, stage, seconds):
+        with self._lock:
+            self.stage_duration.observe((('modality', modality), ('stage', stage)), seconds)
+
+    def observe_request(self, modality, status, seconds):
+        with self._lock:
+            self.request_duration.observe((('modality', modality),), seconds)
+            self.requests.inc((('modality', modality), ('status', str(status))))
+
+    def record_cache_lookup(self, cache, hit):
+        modality = current_modality()
+        with self._lock:
+            self.cache_lookups.inc((('modality', modality), ('cache', cache), ('result', 'hit' if hit else 'miss')))
+
+    def record_upstream_error(self, modality, upstream):
+        with self._lock:
+            self.upstream_errors.inc((('modality', modality), ('upstream', upstream)))
+
+    def record_token_refresh(self, succeeded):
+        with self._lock:
+            self.token_refreshes.inc((('result', 'success' if succeeded else 'failure'),))
+
+    def record_slow_request(self, modality):
+        with self._lock:
+            self.slow_requests.inc((('modality', modality),))
+
+    def record_replica_query(self, source):
+        with self._lock:
+            self.replica_queries.inc((('modality', current_modality()), ('source', source)))
+
+    def set_admission(self, modality, active, queued):
+        with self._lock:
+            self.admission_active.set((('modality', modality),), active)
+            self.admission_queued.set((('modality', modality),), queued)
+
+    def record_shed(self, modality, reason):
+        with self._lock:
+            self.admission_shed.inc((('modality', modality), ('reason', reason)))
+
+    def record_hedge(self, upstream, winner):
+        with self._lock:
+            self.hedges.inc((('modality', current_modality()), ('upstream', upstream), ('winner', winner)))
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.request_duration, self.stage_duration, self.requests, self.cache_lookups,
+                           self.upstream_errors, self.token_refreshes, self.slow_requests, self.replica_queries,
+                           self.hedges, self.admission_active, self.admission_queued, self.admission_shed):
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTimings:
+    """The stage spans recorded while serving one request."""
+
+    def __init__(self, modality):
+        self.modality = modality
+        self.started_at = time.perf_counter()
+        self.spans = []
+
+    def server_timing(self, total_sec):
+        entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.spans]
+        entries.append(f'total;dur={total_sec * 1000:.1f}')
+        return ', '.join(entries)
+
+
+_current_timings = ContextVar('request_timings', default=None)
+
+
+def modality_for_path(modalities, path):
+    """The modality `modalities` maps a request path to, a key ending in `/` covers the paths one level below it."""
+    return modalities.get(path) or modalities.get(path[:path.rfind("/") + 1])
+
+
+def current_modality():
+    timings = _current_timings.get()
+    return timings.modality if timings is not None else 'none'
+
+
+@contextmanager
+def span(stage, upstream=None):
+    """
+    Times one stage of the current request.
+
+    The duration is added to the request's `Server-Timing` header and to the stage histogram.
+    With `upstream` ('vertex', 'pinecone' or 'auth'), an exception raised inside the span is also
+    counted as an upstream error. Outside a timed request the span only feeds the histogram.
+    """
+    timings = _current_timings.get()
+    modality = timings.modality if timings is not None else 'none'
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        if upstream is not None:
+            metrics.record_upstream_error(modality, upstream)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if timings is not None:
+            timings.spans.append((stage, elapsed))
+        metrics.observe_stage(modality, stage, elapsed)
+
+
+class TimingMiddleware:
+    """
+    Times the search requests and reports their stage spans.
+
+    `modalities` maps request paths to the modality label of their metrics, a path ending in `/`
+    also covers the paths one level below it (e.g. a path parameter). The spans recorded
+    by `span` while serving such a request are returned in a `Server-Timing` header, and requests
+    slower than `slow_request_ms` are logged with their spans, for a `sample_rate` fraction of them.
+    """
+
+    def __init__(self, app, modalities, slow_request_ms=1000, sample_rate=1.0, server_timing=True):
+        self.app = app
+        self.modalities = modalities
+        self.slow_request_sec = slow_request_ms / 1000
+        self.sample_rate = sample_rate
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        modality = None
+        if scope["type"] == "http":
+            modality = modality_for_path(self.modalities, scope.get("path", ""))
+        if modality is None:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings(modality)
+        token = _current_timings.set(timings)
+        status = 500
+
+        async def timed_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    total = time.perf_counter() - timings.started_at
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", timings.server_timing(total).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            _current_timings.reset(token)
+            total = time.perf_counter() - timings.started_at
+            metrics.observe_request(modality, status, total)
+            if self.slow_request_sec > 0 and total >= self.slow_request_sec:
+                metrics.record_slow_request(modality)
+                if random.random() < self.sample_rate:
+                    logger.warning("Slow request %s", json.dumps({
+                        "path": scope.get("path"),
+                        "status": status,
+                        "total_ms": round(total * 1000, 1),
+                        "stages": [{"stage": name, "ms": round(seconds * 1000, 1)} for name, seconds in timings.spans],
+                    }))
+
+
+metrics = Metrics()
@@ -0,0 +1,351 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from starlette.concurrency import run_in_threadpool
+from api.metrics import metrics
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("The local replica requires the `numpy` package, install it with `pip install numpy`.") from e
+
+logger = logging.getLogger(__name__)
+
+# Snapshot layout, written by scripts/replica_snapshot.py
+FORMAT_VERSION = 1
+CURRENT_FILE = 'CURRENT'
+# Subdirectory of the default namespace, whose name is empty
+DEFAULT_NAMESPACE_DIR = '__default__'
+VECTOR_FILES = {'float32': 'vectors.f32', 'int8': 'vectors.i8'}
+# Filter masks kept per snapshot, searches mostly repeat the same few filters
+MASK_CACHE_SIZE = 32
+
+
+class UnsupportedFilter(Exception):
+    """A metadata filter the replica does not evaluate, the query goes to Pinecone instead."""
+
+
+class ReplicaSnapshot:
+    """
+    A replica snapshot opened for search.
+
+    The vector matrix is memory-mapped read-only, so every worker process on the host shares the
+    same pages of the page cache instead of holding its own copy. Metadata stays in its columnar
+    form and is only turned into dicts for the matches returned. Metadata filters made of `$eq`,
+    `$ne`, `$in`, `$nin`, `$and` and `$or` are evaluated over the columns into row masks.
+    """
+
+    def __init__(self, path, block_rows):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.block_rows = block_rows
+        with open(os.path.join(path, 'manifest.json')) as f:
+            manifest = json.load(f)
+        if manifest['format'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported replica snapshot format {manifest['format']}")
+        self.count = manifest['count']
+        self.dimension = manifest['dimension']
+        self.dtype = manifest['dtype']
+        self.metric = manifest['metric']
+        self.namespace = manifest.get('namespace', '')
+        self.created_at = datetime.fromisoformat(manifest['created_at'])
+        self.vectors = None
+        if self.count:
+            self.vectors = np.memmap(os.path.join(path, VECTOR_FILES[self.dtype]), dtype=self.dtype, mode='r',
+                                     shape=(self.count, self.dimension))
+        self.scales = np.fromfile(os.path.join(path, 'scales.f32'), dtype=np.float32) if self.dtype == 'int8' else None
+        with open(os.path.join(path, 'metadata.json')) as f:
+            table = json.load(f)
+        self.ids = table['ids']
+        self.columns = table['columns']
+        self._rows = None
+        self._codes = {}
+        self._masks = {}
+        self._masks_lock = threading.Lock()
+
+    def age_sec(self):
+        return (datetime.now(timezone.utc) - self.created_at).total_seconds()
+
+    def row(self, id):
+        """Returns the row of a vector ID, or None when the snapshot does not hold it."""
+        if self._rows is None:
+            self._rows = {id: row for row, id in enumerate(self.ids)}
+        return self._rows.get(id)
+
+    def values(self, row):
+        """Returns the stored values of a row, dequantized for int8 snapshots."""
+        values = self.vectors[row].astype(np.float32)
+        if self.scales is not None:
+            values *= self.scales[row]
+        return values.tolist()
+
+    def metadata(self, row):
+        metadata = {}
+        for key, column in self.columns.items():
+            if 'dictionary' in column:
+                code = column['codes'][row]
+                value = column['dictionary'][code] if code >= 0 else None
+            else:
+                value = column['values'][row]
+            if value is not None:
+                metadata[key] = value
+        return metadata
+
+    def _match(self, field, values):
+        column = self.columns.get(field)
+        if column is None:
+            return np.zeros(self.count, dtype=bool)
+        if 'dictionary' in column:
+            codes = self._codes.get(field)
+            if codes is None:
+                codes = self._codes[field] = np.asarray(column['codes'], dtype=np.int32)
+            return np.isin(codes, [code for code, value in enumerate(column['dictionary']) if value in values])
+        return np.fromiter((value in values for value in column['values']), dtype=bool, count=self.count)
+
+    def _field_mask(self, field, condition):
+        if not isinstance(condition, dict):
+            condition = {'$eq': condition}
+        mask = np.ones(self.count, dtype=bool)
+        for operator, operand in condition.items():
+            if operator in ('$eq', '$ne'):
+                matched = self._match(field, [operand])
+            elif operator in ('$in', '$nin') and isinstance(operand, list):
+                matched = self._match(field, operand)
+            else:
+                raise UnsupportedFilter(f"{field}: {operator}")
+            mask &= ~matched if operator in ('$ne', '$nin') else matched
+        return mask
+
+    def _filter_mask(self, metadata_filter):
+        mask = np.ones(self.count, dtype=bool)
+        for key, condition in metadata_filter.items():
+            if key == '$and':
+                for clause in condition:
+                    mask &= self._filter_mask(clause)
+            elif key == '$or':
+                matched = np.zeros(self.count, dtype=bool)
+                for clause in condition:
+                    matched |= self._filter_mask(clause)
+                mask &= matched
+            elif key.startswith('$'):
+                raise UnsupportedFilter(key)
+            else:
+                mask &= self._field_mask(key, condition)
+        return mask
+
+    def filter_mask(self, metadata_filter):
+        """Returns the boolean mask of the rows matching a Pinecone metadata filter, or raises `UnsupportedFilter`."""
+        key = json.dumps(metadata_filter, sort_keys=True)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = self._filter_mask(metadata_filter)
+            with self._masks_lock:
+                if len(self._masks) >= MASK_CACHE_SIZE:
+                    self._masks.pop(next(iter(self._masks)))
+                self._masks[key] = mask
+        return mask
+
+    def search(self, vector, top_k, mask=None):
+        """
+        Returns the `(row, score)` pairs of the `top_k` most similar rows, best first.
+
+        The matrix is scanned in blocks of `block_rows`, keeping only the best candidates of each
+        block, so int8 rows are only ever converted to float32 one block at a time. With a `mask`,
+        only its rows are candidates and blocks without any are skipped.
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape != (self.dimension,):
+            raise ValueError(f"Query vector has {query.size} dimensions, the replica has {self.dimension}")
+        if self.metric == 'cosine':
+            norm = np.linalg.norm(query)
+            if norm > 0:
+                query = query / norm
+        if not self.count or top_k <= 0:
+            return []
+
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, self.count, self.block_rows):
+            block_mask = None if mask is None else mask[start:start + self.block_rows]
+            if block_mask is not None and not block_mask.any():
+                continue
+            block = self.vectors[start:start + self.block_rows]
+            if self.scales is not None:
+                scores = (block.astype(np.float32) @ query) * self.scales[start:start + len(block)]
+            else:
+                scores = block @ query
+            if block_mask is not None:
+                scores = np.where(block_mask, scores, -np.inf)
+            k = min(top_k, len(scores))
+            candidates = np.argpartition(-scores, k - 1)[:k]
+            best_rows = np.concatenate([best_rows, candidates + start])
+            best_scores = np.concatenate([best_scores, scores[candidates]])
+            if len(best_rows) > top_k:
+                keep = np.argpartition(-best_scores, top_k - 1)[:top_k]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        order = np.argsort(-best_scores, kind='stable')
+        return [(int(best_rows[i]), float(best_scores[i])) for i in order if best_scores[i] != -np.inf]
+
+
+class ReplicaIndex:
+    """
+    Serves vector queries from a local replica snapshot, and everything else from Pinecone.
+
+    Wraps the Pinecone index: `query` calls with a vector and without values, and `fetch` calls
+    for IDs the snapshot holds, are answered from the current snapshot of their namespace, read
+    from its subdirectory of `replica_dir`. All other calls and attributes go to Pinecone. Queries
+    also fall back to Pinecone while their namespace has no snapshot, when the snapshot is older
+    than `max_age_sec`, when their filter uses operators the replica does not evaluate or when the
+    local search fails. A background task switches to new snapshots every `refresh_interval_sec`
+    once `scripts/export_replica.py` or the ingestion scripts have written them.
+    """
+
+    def __init__(self, index, replica_dir, max_age_sec=86400, refresh_interval_sec=60, block_rows=2048):
+        self.index = index
+        self.replica_dir = replica_dir
+        self.max_age_sec = max_age_sec
+        self.refresh_interval_sec = refresh_interval_sec
+        self.block_rows = block_rows
+        # The snapshot of each namespace, replaced as a whole so readers never see it change
+        self.snapshots = {}
+        self._background_task = None
+        self._stale_logged = set()
+        self.load()
+
+    def _current_paths(self):
+        """Returns the path of the current snapshot of each namespace directory."""
+        try:
+            entries = sorted(os.listdir(self.replica_dir))
+        except FileNotFoundError:
+            return {}
+        paths = {}
+        for entry in entries:
+            try:
+                with open(os.path.join(self.replica_dir, entry, CURRENT_FILE)) as f:
+                    name = f.read().strip()
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            if name:
+                paths['' if entry == DEFAULT_NAMESPACE_DIR else entry] = os.path.join(self.replica_dir, entry, name)
+        return paths
+
+    def load(self):
+        """Opens the current snapshots that changed, returns True if a new one was loaded."""
+        paths = self._current_paths()
+        if not paths and not self.snapshots:
+            logger.warning("No replica snapshot in %s, queries go to Pinecone", self.replica_dir)
+            return False
+        snapshots = dict(self.snapshots)
+        loaded = False
+        for namespace, path in paths.items():
+            current = snapshots.get(namespace)
+            if current is not None and current.path == path:
+                continue
+            try:
+                snapshot = ReplicaSnapshot(path, self.block_rows)
+            except Exception as e:
+                logger.error("Could not load replica snapshot %s: %s", path, e)
+                continue
+            snapshots[namespace] = snapshot
+            loaded = True
+            logger.info("Loaded replica snapshot %s of namespace '%s' with %d vectors (%s)", snapshot.name, namespace,
+                        snapshot.count, snapshot.dtype)
+        self.snapshots = snapshots
+        return loaded
+
+    def _usable_snapshot(self, kwargs):
+        if kwargs.get('vector') is None or kwargs.get('include_values') or kwargs.get('id'):
+            return None
+        return self._fresh_snapshot(kwargs.get('namespace'))
+
+    def _fresh_snapshot(self, namespace):
+        snapshot = self.snapshots.get(namespace or '')
+        if snapshot is None:
+            return None
+        if self.max_age_sec and snapshot.age_sec() > self.max_age_sec:
+            if snapshot.path not in self._stale_logged:
+                self._stale_logged.add(snapshot.path)
+                logger.warning("Replica snapshot %s is older than %ss, queries go to Pinecone", snapshot.path, self.max_age_sec)
+            return None
+        return snapshot
+
+    def query(self, *args, **kwargs):
+        snapshot = self._usable_snapshot(kwargs)
+        if snapshot is not None and not args:
+            try:
+                metadata_filter = kwargs.get('filter')
+                mask = snapshot.filter_mask(metadata_filter) if metadata_filter else None
+                matches = snapshot.search(kwargs['vector'], kwargs.get('top_k', 10), mask)
+                include_metadata = kwargs.get('include_metadata')
+                metrics.record_replica_query('replica')
+                return {
+                    'matches': [{
+                        'id': snapshot.ids[row],
+                        'score': score,
+                        'metadata': snapshot.metadata(row) if include_metadata else None,
+                    } for row, score in matches],
+                    'namespace': snapshot.namespace,
+                }
+            except UnsupportedFilter as e:
+                logger.debug("Replica does not evaluate filter %s, querying Pinecone", e)
+            except Exception as e:
+                logger.warning("Replica query failed, falling back to Pinecone: %s", e)
+        metrics.record_replica_query('pinecone')
+        return self.index.query(*args, **kwargs)
+
+    def fetch(self, ids, namespace=None, **kwargs):
+        snapshot = self._fresh_snapshot(namespace)
+        if snapshot is not None:
+            rows = [snapshot.row(id) for id in ids]
+            # IDs missing from the snapshot may have been upserted since it was exported
+            if None not in rows:
+                return {
+                    'vectors': {id: {'id': id, 'values': snapshot.values(row), 'metadata': snapshot.metadata(row)}
+                                for id, row in zip(ids, rows)},
+                    'namespace': snapshot.namespace,
+                }
+        return self.index.fetch(ids=ids, namespace=namespace or '', **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval_sec)
+            try:
+                await run_in_threadpool(self.load)
+            except Exception as e:
+                logger.error("Replica refresh failed: %s", e)
+
+    def start(self):
+        """Starts checking for new snapshots in the background."""
+        if self.refresh_interval_sec > 0 and (self._background_task is None or self._background_task.done()):
+            self._background_task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._background_task is not None:
+            self._background_task.cancel()
+            try:
+                await self._background_task
+            except asyncio.CancelledError:
+                pass
+            self._background_task = None
+
+    def stats(self):
+        snapshots = self.snapshots
+        return {
+            "vectors": sum(snapshot.count for snapshot in snapshots.values()),
+            "namespaces": {
+                namespace: {
+                    "snapshot": snapshot.name,
+                    "vectors": snapshot.count,
+                    "dtype": snapshot.dtype,
+                    "created_at": snapshot.created_at.isoformat(),
+                    "stale": bool(self.max_age_sec and snapshot.age_sec() > self.max_age_sec),
+                } for namespace, snapshot in sorted(snapshots.items())
+            },
+        }
@@ -0,0 +1,97 @@
+import json
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+GCS_PUBLIC_URL_BASE = "https://storage.googleapis.com/"
+
+# Metadata fields a search result can return, in response order
+RESULT_FIELDS = (
+    'gcs_file_name',
+    'gcs_file_path',
+    'gcs_public_url',
+    'file_type',
+    'segment',
+    'start_offset_sec',
+    'end_offset_sec',
+    'interval_sec',
+)
+
+
+class SearchResponse(JSONResponse):
+    """
+    JSON response that skips FastAPI's `jsonable_encoder` pass and renders compactly.
+
+    Uses `orjson` when it is installed, and the standard library encoder without whitespace otherwise.
+    Only return plain dicts, lists, strings, numbers and None from it.
+    """
+
+    def render(self, content):
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(',', ':')).encode('utf-8')
+
+
+def parse_fields(fields):
+    """
+    Parses the comma-separated `fields` query parameter into a tuple of metadata fields.
+
+    :return: The requested fields in response order, or all of them when `fields` is empty
+    """
+    if not fields:
+        return RESULT_FIELDS
+    requested = {field.strip() for field in fields.split(',') if field.strip()}
+    unknown = requested.difference(RESULT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown result fields: {', '.join(sorted(unknown))}. Choose from {', '.join(RESULT_FIELDS)}")
+    return tuple(field for field in RESULT_FIELDS if field in requested)
+
+
+class ResultFormatter:
+    """
+    Turns Pinecone matches into search results with only the requested metadata fields.
+
+    Every result carries the vector `id`, which `/search/similar/{id}` accepts to search for more
+    results like it.
+
+    Fields without a value (such as the segment fields of images) are left out. In compact mode
+    `gcs_public_url` is not repeated in every result: the response carries `url_base` once and a
+    result's URL is `url_base + gcs_file_path + gcs_file_name`, so those two fields are returned
+    instead when the URL is requested.
+    """
+
+    def __init__(self, fields=RESULT_FIELDS, compact=False):
+        # Only a compact response that asks for the URL carries `url_base`
+        self.compact = compact and 'gcs_public_url' in fields
+        if self.compact:
+            requested = set(fields) - {'gcs_public_url'} | {'gcs_file_path', 'gcs_file_name'}
+            fields = tuple(field for field in RESULT_FIELDS if field in requested)
+        self.fields = tuple(fields)
+
+    @classmethod
+    def from_params(cls, fields=None, compact=False):
+        return cls(parse_fields(fields), compact)
+
+    def format_match(self, match):
+        stored = match.get('metadata') or {}
+        metadata = {}
+        for field in self.fields:
+            if field == 'gcs_public_url':
+                metadata[field] = f"{GCS_PUBLIC_URL_BASE}{stored.get('gcs_file_path')}{stored.get('gcs_file_name')}"
+                continue
+            value = stored.get(field)
+            if value is not None:
+                metadata[field] = value
+        return {"id": match['id'], "score": match['score'], "metadata": metadata}
+
+    def format_matches(self, matches):
+        return [self.format_match(match) for match in matches]
+
+    def response_body(self, key, value):
+        """Returns the response dict for `{key: value}`, with `url_base` in compact mode."""
+        if self.compact:
+            return {"url_base": GCS_PUBLIC_URL_BASE, key: value}
+        return {key: value}
@@ -0,0 +1,168 @@
+import asyncio
+import heapq
+import json
+from fastapi.concurrency import run_in_threadpool
+from api.config import settings
+from api.deadlines import Hedge, bounded, time_left
+from api import deps
+
+# Kinds of vectors in the index, stored as their `file_type` metadata
+MODALITIES = ('image', 'video')
+# What a similar search leaves out: nothing, the source vector, or every segment of the source video
+EXCLUDE_MODES = ('none', 'item', 'video')
+
+pinecone_hedge = Hedge('pinecone', settings.hedge_pinecone, settings.hedge_percentile, settings.hedge_min_delay_ms)
+
+
+def parse_modalities(modality):
+    """
+    Parses the comma-separated `modality` query parameter.
+
+    :return: The requested modalities, or all of them when `modality` is empty or `all`
+    """
+    requested = {value.strip() for value in (modality or '').split(',') if value.strip()}
+    if not requested or requested == {'all'}:
+        return MODALITIES
+    unknown = requested.difference(MODALITIES)
+    if unknown:
+        raise ValueError(f"Unknown modality: {', '.join(sorted(unknown))}. Choose from {', '.join(MODALITIES)} or all")
+    return tuple(value for value in MODALITIES if value in requested)
+
+
+def parse_filter(metadata_filter):
+    """Parses a Pinecone metadata filter given as a JSON object, or as its string from a query parameter."""
+    if metadata_filter is None or metadata_filter == '':
+        return None
+    if isinstance(metadata_filter, str):
+        try:
+            metadata_filter = json.loads(metadata_filter)
+        except ValueError:
+            raise ValueError("The filter must be a JSON object, e.g. {\"gcs_file_path\": \"catalog/products/\"}")
+    if not isinstance(metadata_filter, dict):
+        raise ValueError("The filter must be a JSON object, e.g. {\"gcs_file_path\": \"catalog/products/\"}")
+    return metadata_filter or None
+
+
+class SearchScope:
+    """
+    The namespaces a search queries, each with the metadata filter to query it with.
+
+    Modalities map to their configured namespaces. A namespace holding several modalities is only
+    narrowed with a `file_type` filter when some of them were not requested, so with one namespace
+    per modality a modality search reads nothing but that modality's vectors.
+    """
+
+    def __init__(self, targets):
+        # A list of `(namespace, filter)`
+        self.targets = targets
+
+    @classmethod
+    def from_params(cls, modality=None, metadata_filter=None, namespaces=None):
+        modalities = parse_modalities(modality)
+        metadata_filter = parse_filter(metadata_filter)
+        namespaces = namespaces or settings.namespaces
+
+        targets = []
+        for namespace in dict.fromkeys(namespaces[value] for value in MODALITIES):
+            hosted = [value for value in MODALITIES if namespaces[value] == namespace]
+            wanted = [value for value in hosted if value in modalities]
+            if not wanted:
+                continue
+            clauses = []
+            if len(wanted) < len(hosted):
+                clauses.append({'file_type': {'$in': wanted}})
+            if metadata_filter:
+                clauses.append(metadata_filter)
+            if len(clauses) > 1:
+                targets.append((namespace, {'$and': clauses}))
+            else:
+                targets.append((namespace, clauses[0] if clauses else None))
+        return cls(targets)
+
+    def narrowed(self, clause):
+        """Returns the scope with `clause` added to the filter of every namespace."""
+        return SearchScope([
+            (namespace, {'$and': [metadata_filter, clause]} if metadata_filter else clause)
+            for namespace, metadata_filter in self.targets
+        ])
+
+
+def query_namespace(vector, top_k, namespace, metadata_filter=None, timeout=None):
+    kwargs = {'filter': metadata_filter} if metadata_filter else {}
+    return deps.index.query(vector=vector, top_k=top_k, namespace=namespace, include_metadata=True,
+                            _request_timeout=timeout, **kwargs)
+
+
+def fetch_namespace(ids, namespace, timeout=None):
+    # Skipping the client's per-value type checks halves the time to parse a response
+    return deps.index.fetch(ids=ids, namespace=namespace, _check_return_type=False, _request_timeout=timeout)
+
+
+async def call_pinecone(func, *args):
+    """
+    Runs a blocking Pinecone call in a worker thread, for at most `pinecone_timeout` or what is left of the deadline.
+
+    The timeout is also passed to the client, so a call given up on does not hold its thread any
+    longer. Calls are hedged with `hedge_pinecone`.
+    """
+    timeout = time_left(settings.pinecone_timeout)
+    return await bounded(pinecone_hedge.run(lambda: run_in_threadpool(func, *args, timeout=timeout)), timeout, 'Pinecone')
+
+
+async def fetch_vectors(ids, namespaces=None):
+    """
+    Looks up stored vectors by ID in the namespaces of every modality, concurrently.
+
+    :return: A dict mapping each ID found to its `(values, metadata)`
+    """
+    namespaces = namespaces or settings.namespaces
+    responses = await asyncio.gather(*(
+        call_pinecone(fetch_namespace, ids, namespace) for namespace in dict.fromkeys(namespaces.values())
+    ))
+    found = {}
+    for response in responses:
+        for id, vector in response['vectors'].items():
+            found.setdefault(id, (vector['values'], vector.get('metadata') or {}))
+    return found
+
+
+def parse_exclude(exclude):
+    if exclude not in EXCLUDE_MODES:
+        raise ValueError(f"Unknown exclude mode: {exclude}. Choose from {', '.join(EXCLUDE_MODES)}")
+    return exclude
+
+
+async def query_similar(vector_id, stored, top_k, scope, exclude='item'):
+    """
+    Returns the `top_k` matches most similar to the stored vector `vector_id`, without embedding anything.
+
+    :param stored: The `(values, metadata)` of the vector, see `fetch_vectors`
+    :param exclude: 'item' leaves out the vector itself, 'video' also the other segments of its video
+    """
+    values, metadata = stored
+    if exclude == 'video' and metadata.get('file_type') == 'video':
+        scope = scope.narrowed({'$or': [
+            {'gcs_file_path': {'$ne': metadata.get('gcs_file_path')}},
+            {'gcs_file_name': {'$ne': metadata.get('gcs_file_name')}},
+        ]})
+    if exclude == 'none':
+        return await query_index(values, top_k, scope)
+    # One more match, in case the vector itself is among them
+    matches = await query_index(values, top_k + 1, scope)
+    return [match for match in matches if match['id'] != vector_id][:top_k]
+
+
+async def query_index(vector, top_k, scope):
+    """
+    Queries the namespaces of `scope` concurrently and returns the best `top_k` matches.
+
+    The matches of a single namespace are returned as Pinecone ranked them, those of several
+    namespaces are merged by score.
+    """
+    responses = await asyncio.gather(*(
+        call_pinecone(query_namespace, vector, top_k, namespace, metadata_filter)
+        for namespace, metadata_filter in scope.targets
+    ))
+    if len(responses) == 1:
+        return responses[0]['matches']
+    return heapq.nlargest(top_k, (match for response in responses for match in response['matches']), key=lambda match: match['score'])
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from starlette.concurrency import run_in_threadpool
+from api.config import settings
+from api.search import MODALITIES
+from api import deps
+
+logger = logging.getLogger(__name__)
+
+# Refreshes triggered on demand are spaced by at least this much, triggers in between share the next one
+MIN_REFRESH_INTERVAL_SEC = 5
+RETRY_INTERVAL_SEC = 30
+
+
+class IndexStatsCache:
+    """
+    Keeps the index statistics in memory, so `/index/info` never waits on Pinecone.
+
+    The statistics are refreshed in the background every `ttl_sec`. Readers are served the cached
+    copy; a copy older than `ttl_sec` is still served while a refresh runs (stale-while-revalidate),
+    and only a missing copy, or one older than `max_stale_sec`, makes the reader wait for the
+    refresh. Concurrent refreshes share a single `describe_index_stats` call.
+
+    Besides the total, the counts are broken down per namespace and per modality. A modality with a
+    namespace of its own is counted from that namespace; modalities sharing a namespace are counted
+    from the local replica when it holds that namespace, or with filtered index statistics where
+    the index supports them (pod-based indexes), and are reported as None otherwise.
+    """
+
+    def __init__(self, index_provider, namespaces, ttl_sec=300, max_stale_sec=3600, replica_provider=None):
+        self.index_provider = index_provider
+        self.namespaces = namespaces
+        self.ttl_sec = ttl_sec
+        self.max_stale_sec = max_stale_sec
+        self.replica_provider = replica_provider
+        self._stats = None
+        self._updated = None
+        self._updated_at = None
+        self._refresh_task = None
+        self._requested_refresh = None
+        self._background_task = None
+        self._filtered_stats_supported = True
+        self.refreshes = 0
+        self.refresh_failures = 0
+
+    def age_sec(self):
+        return time.monotonic() - self._updated if self._updated is not None else None
+
+    def _count_shared(self, index, modality, namespace):
+        replica = self.replica_provider() if self.replica_provider else None
+        snapshot = replica.snapshots.get(namespace) if replica is not None else None
+        if snapshot is not None:
+            return int(snapshot.filter_mask({'file_type': modality}).sum())
+        if self._filtered_stats_supported:
+            try:
+                info = index.describe_index_stats(filter={'file_type': {'$eq': modality}})
+                summary = info['namespaces'].get(namespace)
+                return summary['vector_count'] if summary else 0
+            except Exception as e:
+                # Serverless indexes reject filtered statistics, there is no point asking again
+                logger.info("The index does not support filtered statistics, modalities sharing a namespace are not counted")
+                logger.debug("Filtered statistics error: %s", e)
+                self._filtered_stats_supported = False
+        return None
+
+    def _collect(self):
+        index = self.index_provider()
+        info = index.describe_index_stats()
+        namespaces = {name: summary['vector_count'] for name, summary in info['namespaces'].items()}
+        modalities = {}
+        for modality in MODALITIES:
+            namespace = self.namespaces[modality]
+            shared = sum(1 for other in MODALITIES if self.namespaces[other] == namespace) > 1
+            count = self._count_shared(index, modality, namespace) if shared else namespaces.get(namespace, 0)
+            modalities[modality] = {"namespace": namespace, "vectors": count}
+        return {
+            "total_vectors": info['total_vector_count'],
+            "namespaces": namespaces,
+            "modalities": modalities,
+        }
+
+    async def _refresh(self):
+        try:
+            stats = await run_in_threadpool(self._collect)
+        except Exception as e:
+            self.refresh_failures += 1
+            logger.error("Error refreshing the index statistics: %s", e)
+            raise
+        self._stats = stats
+        self._updated = time.monotonic()
+        self._updated_at = datetime.now(timezone.utc)
+        self.refreshes += 1
+        return stats
+
+    def _start_refresh(self):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh())
+            # Failures are logged in _refresh, background refreshes may have nobody awaiting them
+            self._refresh_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._refresh_task
+
+    async def get(self):
+        """
+        Returns the statistics, waiting for a refresh only when there is no usable copy.
+
+        Raises the refresh error when there is no copy at all or the copy is older than `max_stale_sec`.
+        """
+        age = self.age_sec()
+        if age is None or age >= self.max_stale_sec:
+            await asyncio.shield(self._start_refresh())
+        elif age >= self.ttl_sec:
+            self._start_refresh()
+        return self._stats
+
+    async def _spaced_refresh(self):
+        age = self.age_sec()
+        if age is not None and age < MIN_REFRESH_INTERVAL_SEC:
+            await asyncio.sleep(MIN_REFRESH_INTERVAL_SEC - age)
+        if self._refresh_task is not None and not self._refresh_task.done():
+            # It may have started before the change the caller wants to see
+            await asyncio.wait([self._refresh_task])
+        return await self._start_refresh()
+
+    async def refresh(self):
+        """Refreshes the statistics, e.g. after ingestion, and returns them."""
+        if self._requested_refresh is None or self._requested_refresh.done():
+            self._requested_refresh = asyncio.ensure_future(self._spaced_refresh())
+        return await asyncio.shield(self._requested_refresh)
+
+    def fresh_for_sec(self):
+        """Seconds until the current copy is due for a refresh."""
+        age = self.age_sec()
+        return max(0.0, self.ttl_sec - age) if age is not None else 0.0
+
+    async def _run(self):
+        while True:
+            try:
+                wait = self.fresh_for_sec()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                await asyncio.shield(self._start_refresh())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await asyncio.sleep(min(self.ttl_sec, RETRY_INTERVAL_SEC))
+
+    def start(self):
+        """Starts refreshing the statistics in the background every `ttl_sec`."""
+        if self.ttl_sec > 0 and (self._background_task is None or self._background_task.done()):
+            self._background_task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._background_task is not None:
+            self._background_task.cancel()
+            try:
+                await self._background_task
+            except asyncio.CancelledError:
+                pass
+            self._background_task = None
+
+    def cache_stats(self):
+        return {
+            "refreshes": self.refreshes,
+            "refresh_failures": self.refresh_failures,
+            "age_sec": round(self.age_sec(), 1) if self._updated is not None else None,
+            "updated_at": self._updated_at.isoformat() if self._updated_at is not None else None,
+        }
+
+
+index_stats = IndexStatsCache(
+    lambda: deps.index,
+    settings.namespaces,
+    ttl_sec=settings.index_stats_ttl_sec,
+    max_stale_sec=settings.index_stats_max_stale_sec,
+    replica_provider=lambda: deps.replica,
+)
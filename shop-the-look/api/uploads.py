@@ -0,0 +1,161 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+from starlette.responses import JSONResponse
+from api.workers import cpu_workers
+
+# Multiples of 3 bytes encode to base64 without padding, so chunks can be concatenated
+BASE64_CHUNK_SIZE = 3 * 256 * 1024
+# Allowance for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Rejects oversized uploads before FastAPI parses the multipart body.
+
+    Requests to a limited path are refused with 413 straight away when their Content-Length is
+    over the limit, and otherwise the body is counted as it streams in so a chunked upload is cut
+    off as soon as it passes the limit.
+    """
+
+    def __init__(self, app, limits):
+        self.app = app
+        self.limits = limits
+
+    async def __call__(self, scope, receive, send):
+        max_bytes = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if max_bytes is None:
+            await self.app(scope, receive, send)
+            return
+
+        max_body_bytes = max_bytes + MULTIPART_OVERHEAD_BYTES
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length is not None:
+            try:
+                content_length = int(content_length)
+            except ValueError:
+                content_length = -1
+            if content_length < 0:
+                response = JSONResponse(status_code=400, content={"detail": "Invalid Content-Length header."})
+                await response(scope, receive, send)
+                return
+            if content_length > max_body_bytes:
+                await self._reject(scope, receive, send, max_bytes)
+                return
+
+        received = 0
+        exceeded = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, exceeded
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body_bytes:
+                    exceeded = True
+                    raise UploadTooLarge()
+            return message
+
+        async def limited_send(message):
+            nonlocal rejected
+            # Whatever error response the app produced for the aborted body is replaced by a 413
+            if exceeded:
+                if not rejected:
+                    rejected = True
+                    await self._reject(scope, receive, send, max_bytes)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, limited_send)
+        except UploadTooLarge:
+            if not rejected:
+                rejected = True
+                await self._reject(scope, receive, send, max_bytes)
+
+    async def _reject(self, scope, receive, send, max_bytes):
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"We don't support uploads greater than {max_bytes // 1_000_000} MB. Please upload a smaller file."},
+        )
+        await response(scope, receive, send)
+
+
+def spool_upload(source, directory, max_bytes, chunk_size=1024 * 1024, suffix=''):
+    """
+    Copies an uploaded file to a new, uniquely named temporary file in chunks.
+
+    :param source: A readable binary file object (e.g. `UploadFile.file`)
+    :param directory: Directory for the temporary file, created if missing
+    :param max_bytes: Maximum accepted size, UploadTooLarge is raised as soon as it is exceeded
+    :return: A tuple of the temporary file path, its size in bytes, and the SHA-256 hex digest of its contents
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory, suffix=suffix)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = source.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge()
+                digest.update(chunk)
+                out.write(chunk)
+    except BaseException:
+        remove_quietly(path)
+        raise
+    return path, size, digest.hexdigest()
+
+
+def remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class Base64PredictBody:
+    """
+    JSON predict request body for a single file, base64 encoded while it is being sent.
+
+    Only one chunk of the file and its encoding are in memory at a time, instead of the whole
+    upload plus its base64 string plus the serialized JSON. The body can be iterated more than
+    once (e.g. to retry a request), each iteration reads the file again. `fields` are added to the
+    content object next to the bytes, e.g. a video's `videoSegmentConfig`.
+    """
+
+    @staticmethod
+    def _read_encoded(f):
+        return base64.b64encode(f.read(BASE64_CHUNK_SIZE))
+
+    def __init__(self, path, content_type, fields=None):
+        self.path = path
+        self.prefix = ('{"instances": [{%s: {"bytesBase64Encoded": "' % json.dumps(content_type)).encode('utf-8')
+        extra = ''.join(f', {json.dumps(name)}: {json.dumps(value)}' for name, value in (fields or {}).items())
+        self.suffix = ('"%s}}]}' % extra).encode('utf-8')
+        size = os.path.getsize(path)
+        self.content_length = len(self.prefix) + 4 * ((size + 2) // 3) + len(self.suffix)
+
+    async def __aiter__(self):
+        yield self.prefix
+        with open(self.path, 'rb') as f:
+            while True:
+                # Reading and encoding a chunk run together on the CPU worker threads, off the event loop
+                chunk = await cpu_workers.run(self._read_encoded, f)
+                if not chunk:
+                    break
+                yield chunk
+        yield self.suffix
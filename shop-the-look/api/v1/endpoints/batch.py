@@ -0,0 +1,218 @@
+import asyncio
+import json
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from PIL import UnidentifiedImageError
+from pydantic import BaseModel, ValidationError
+from api.batcher import embedding_batcher
+from api.cache import image_key, normalize_query, text_embedding_cache, upload_embedding_cache
+from api.config import settings
+from api.deadlines import DeadlineExceeded
+from api.images import UnsupportedImageFormat, prepare_image
+from api.metrics import current_modality, metrics, span
+from api.results import ResultFormatter, SearchResponse
+from api.search import SearchScope, query_index
+from api.workers import cpu_workers
+
+router = APIRouter()
+
+class BatchQueryItem(BaseModel):
+    text: Optional[str] = None
+    # Position of the image in the uploaded `files`
+    image: Optional[int] = None
+    top_k: Optional[int] = None
+    # Override the request's `modality` and `filter` query parameters for this query
+    modality: Optional[str] = None
+    filter: Optional[dict] = None
+
+class BatchQuery(BaseModel):
+    queries: List[BatchQueryItem]
+
+class BatchItemError(Exception):
+    pass
+
+
+async def parse_batch(request):
+    """
+    Reads the queries and uploaded images of a batch search.
+
+    The queries are either the JSON body, or with multipart form data a `queries` field holding the
+    same JSON next to the images in `files`.
+    """
+    if request.headers.get('content-type', '').startswith('multipart/form-data'):
+        form = await request.form()
+        raw_queries = form.get('queries')
+        if raw_queries is None:
+            raise HTTPException(status_code=400, detail="The `queries` form field is required")
+        payload = json.loads(raw_queries)
+        files = form.getlist('files')
+    else:
+        payload = await request.json()
+        files = []
+    if isinstance(payload, list):
+        payload = {"queries": payload}
+    return BatchQuery.model_validate(payload), files
+
+
+def validate_item(item, files, modality=None, metadata_filter=None):
+    """Returns the top_k and the search scope of a query, or raises a `BatchItemError`."""
+    if (item.text is None) == (item.image is None):
+        raise BatchItemError("Each query needs either `text` or `image`")
+    if item.text is not None and not item.text.strip():
+        raise BatchItemError("The query text cannot be empty")
+    if item.image is not None and not 0 <= item.image < len(files):
+        raise BatchItemError(f"There is no uploaded file at position {item.image}")
+    top_k = item.top_k or settings.k
+    if not 1 <= top_k <= settings.search_batch_max_top_k:
+        raise BatchItemError(f"top_k must be between 1 and {settings.search_batch_max_top_k}")
+    try:
+        scope = SearchScope.from_params(item.modality or modality, item.filter if item.filter is not None else metadata_filter)
+    except ValueError as e:
+        raise BatchItemError(str(e))
+    return top_k, scope
+
+
+async def embed_texts(texts):
+    """Returns a vector or exception per text, embedding each distinct uncached query once."""
+    keys = [normalize_query(text) for text in texts]
+    vectors = {}
+    with span('cache'):
+        for key in set(keys):
+            vectors[key] = await text_embedding_cache.get(key)
+    for key in keys:
+        metrics.record_cache_lookup('text', vectors[key] is not None)
+
+    missing = [key for key, vector in vectors.items() if vector is None]
+    if missing:
+        originals = {key: text for key, text in zip(keys, texts)}
+        embedded = await embedding_batcher.embed_many('text', [originals[key] for key in missing])
+        for key, vector in zip(missing, embedded):
+            vectors[key] = vector
+            if not isinstance(vector, Exception):
+                await text_embedding_cache.set(key, vector)
+    return [vectors[key] for key in keys]
+
+
+async def embed_images(uploads):
+    """Returns a vector or exception per distinct upload, skipping decoding and embedding for cached ones."""
+    contents = [await upload.read() for upload in uploads]
+    keys = [image_key(data) for data in contents]
+    with span('cache'):
+        vectors = await asyncio.gather(*(run_in_threadpool(upload_embedding_cache.get, key) for key in keys))
+    for vector in vectors:
+        metrics.record_cache_lookup('uploads', vector is not None)
+
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if not missing:
+        return vectors
+
+    # Decoding and downscaling are CPU bound, so they run on the CPU worker threads
+    with span('decode'):
+        prepared = await asyncio.gather(*(cpu_workers.run(
+            prepare_image,
+            contents[i],
+            settings.image_max_edge,
+            settings.image_jpeg_quality,
+            settings.image_preprocess,
+        ) for i in missing), return_exceptions=True)
+
+    to_embed = []
+    for i, result in zip(missing, prepared):
+        if isinstance(result, (UnsupportedImageFormat, UnidentifiedImageError)):
+            vectors[i] = BatchItemError("We only support BMP, GIF, JPG, JPEG, and PNG for images. Please upload a valid image file.")
+        elif isinstance(result, Exception):
+            vectors[i] = result
+        else:
+            to_embed.append((i, result[0]))
+
+    embedded = await embedding_batcher.embed_many('image', [image for _, image in to_embed])
+    for (i, _), vector in zip(to_embed, embedded):
+        vectors[i] = vector
+        if not isinstance(vector, Exception):
+            await run_in_threadpool(upload_embedding_cache.set, keys[i], vector)
+    return vectors
+
+
+@router.post("/search/batch", response_class=SearchResponse)
+async def query_batch(request: Request, fields: Optional[str] = None, compact: bool = False,
+                      modality: Optional[str] = None, metadata_filter: Optional[str] = Query(None, alias='filter')):
+    """
+    Searches for several text queries and uploaded images at once.
+
+    Text and image queries are embedded in as few predict calls as the embedding batch size allows
+    and their Pinecone queries run concurrently. Results are returned per query, in order, and a
+    query that fails gets an `error` instead of `results` without failing the others. The
+    `modality` and `filter` query parameters apply to every query that does not set its own.
+    """
+    try:
+        formatter = ResultFormatter.from_params(fields, compact)
+        # An invalid `modality` or `filter` fails the request before the uploads are read
+        SearchScope.from_params(modality, metadata_filter)
+        with span('read'):
+            batch, files = await parse_batch(request)
+    except HTTPException:
+        raise
+    except (ValueError, ValidationError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch query: {str(e)}")
+
+    if not batch.queries:
+        raise HTTPException(status_code=400, detail="The batch needs at least one query")
+    if len(batch.queries) > settings.search_batch_max_items:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {settings.search_batch_max_items} queries")
+
+    try:
+        outcomes = [None] * len(batch.queries)
+        top_ks = [None] * len(batch.queries)
+        scopes = [None] * len(batch.queries)
+        for i, item in enumerate(batch.queries):
+            try:
+                top_ks[i], scopes[i] = validate_item(item, files, modality, metadata_filter)
+            except BatchItemError as e:
+                outcomes[i] = e
+
+        text_items = [i for i, item in enumerate(batch.queries) if outcomes[i] is None and item.text is not None]
+        image_positions = sorted({item.image for i, item in enumerate(batch.queries) if outcomes[i] is None and item.image is not None})
+
+        with span('embed'):
+            text_vectors, image_vectors = await asyncio.gather(
+                embed_texts([batch.queries[i].text for i in text_items]) if text_items else asyncio.sleep(0, []),
+                embed_images([files[position] for position in image_positions]) if image_positions else asyncio.sleep(0, []),
+            )
+        for i, vector in zip(text_items, text_vectors):
+            outcomes[i] = vector
+        vectors_by_image = dict(zip(image_positions, image_vectors))
+        for i, item in enumerate(batch.queries):
+            if outcomes[i] is None and item.image is not None:
+                outcomes[i] = vectors_by_image[item.image]
+
+        modality = current_modality()
+        for outcome in outcomes:
+            if isinstance(outcome, Exception) and not isinstance(outcome, BatchItemError):
+                metrics.record_upstream_error(modality, 'vertex')
+
+        ready = [i for i, outcome in enumerate(outcomes) if not isinstance(outcome, Exception)]
+        with span('query'):
+            responses = await asyncio.gather(*(
+                query_index(outcomes[i], top_ks[i], scopes[i]) for i in ready
+            ), return_exceptions=True)
+        for i, response in zip(ready, responses):
+            if isinstance(response, Exception):
+                metrics.record_upstream_error(modality, 'pinecone')
+            outcomes[i] = response
+
+        with span('results'):
+            items = []
+            for i, (item, outcome) in enumerate(zip(batch.queries, outcomes)):
+                entry = {"index": i, "type": "text" if item.text is not None else "image"}
+                if isinstance(outcome, Exception):
+                    entry["error"] = str(outcome)
+                else:
+                    entry["results"] = formatter.format_matches(outcome)
+                items.append(entry)
+
+        return SearchResponse(formatter.response_body("items", items))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from api.cache import text_embedding_cache, upload_embedding_cache
+from api.stats import index_stats
+
+router = APIRouter()
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return {
+        "text": text_embedding_cache.stats(),
+        "uploads": upload_embedding_cache.stats(),
+        "index_stats": index_stats.cache_stats(),
+    }
@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from api.batcher import embedding_batcher
+
+router = APIRouter()
+
+@router.get("/embeddings/stats")
+async def get_embedding_stats():
+    return {
+        "batching_enabled": embedding_batcher.enabled,
+        "window_ms": embedding_batcher.window_sec * 1000,
+        "max_batch_size": embedding_batcher.max_batch_size,
+        **embedding_batcher.stats.as_dict(),
+    }
@@ -1,59 +1,65 @@
-import base64
-import requests
-from PIL import Image
-import io
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from api.batcher import embedding_batcher
+from api.cache import image_key, upload_embedding_cache
 from api.config import settings
-from api import deps
+from api.deadlines import DeadlineExceeded
+from api.images import UnsupportedImageFormat, encode_image, preprocess_image
+from api.metrics import metrics, span
+from api.results import ResultFormatter, SearchResponse
+from api.search import SearchScope, query_index
+from api.workers import cpu_workers
 
 router = APIRouter()
 
-@router.post("/search/image")
-async def query_image(file: UploadFile = File(...)):
+@router.post("/search/image", response_class=SearchResponse)
+async def query_image(file: UploadFile = File(...), fields: Optional[str] = None, compact: bool = False,
+                      modality: Optional[str] = None, metadata_filter: Optional[str] = Query(None, alias='filter')):
     try:
-        contents = await file.read()
+        formatter = ResultFormatter.from_params(fields, compact)
+        scope = SearchScope.from_params(modality, metadata_filter)
 
-        with Image.open(io.BytesIO(contents)) as img:
-            file_format = img.format.lower()
-        
-        # Vertex AI Multimodal Embedding Model only supports the following image formats
-        if file_format not in ['bmp', 'gif', 'jpeg', 'png', 'jpg']:
-            raise HTTPException(status_code=400, detail="We only support BMP, GIF, JPG, JPEG, and PNG for images. Please upload a valid image file.")
-        
-        base64_encoded_image = base64.b64encode(contents).decode('utf-8')
-        
-        access_token = settings.get_access_token()
-        
-        url, headers, data = settings.get_embedding_request_data(access_token, 'image', base64_encoded_image)
-        
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        
-        # Extract the first embedding from the response
-        embedding_data = response.json()
-        vector = embedding_data['predictions'][0]['imageEmbedding']
-        
-        query_response = deps.index.query(
-            vector=vector,
-            top_k=settings.k,
-            include_metadata=True
-        )
+        with span('read'):
+            contents = await file.read()
+
+        # Repeat uploads of the same image skip decoding and embedding entirely
+        cache_key = image_key(contents)
+        with span('cache'):
+            vector = await run_in_threadpool(upload_embedding_cache.get, cache_key)
+        metrics.record_cache_lookup('uploads', vector is not None)
+
+        if vector is None:
+            # Decoding and downscaling are CPU bound, so they run on the CPU worker threads
+            try:
+                with span('decode'):
+                    prepared = await cpu_workers.run(
+                        preprocess_image,
+                        contents,
+                        settings.image_max_edge,
+                        settings.image_jpeg_quality,
+                        settings.image_preprocess,
+                    )
+            except UnsupportedImageFormat:
+                raise HTTPException(status_code=400, detail="We only support BMP, GIF, JPG, JPEG, and PNG for images. Please upload a valid image file.")
+
+            with span('encode'):
+                base64_encoded_image = await cpu_workers.run(encode_image, prepared)
+
+            with span('embed', upstream='vertex'):
+                vector = await embedding_batcher.embed('image', base64_encoded_image)
+            await run_in_threadpool(upload_embedding_cache.set, cache_key, vector)
         
-        matches = query_response['matches']
-        results = [{
-            "score": match['score'],
-            "metadata": {
-                "gcs_file_name": match['metadata'].get('gcs_file_name'),
-                "gcs_file_path": match['metadata'].get('gcs_file_path'),
-                "gcs_public_url": f"https://storage.googleapis.com/{match['metadata'].get('gcs_file_path')}{match['metadata'].get('gcs_file_name')}",
-                "file_type": match['metadata'].get('file_type'),
-                "segment": match['metadata'].get('segment'),
-                "start_offset_sec": match['metadata'].get('start_offset_sec'),
-                "end_offset_sec": match['metadata'].get('end_offset_sec'),
-                "interval_sec": match['metadata'].get('interval_sec'),
-            }
-        } for match in matches]
+        with span('query', upstream='pinecone'):
+            matches = await query_index(vector, settings.k, scope)
         
-        return {"results": results}
+        with span('results'):
+            body = formatter.response_body("results", formatter.format_matches(matches))
+
+        return SearchResponse(body)
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
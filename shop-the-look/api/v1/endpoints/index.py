@@ -1,13 +1,45 @@
-from fastapi import APIRouter, HTTPException
+import hashlib
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from api.results import SearchResponse
+from api.stats import index_stats
 from api import deps
 
 router = APIRouter()
 
+
+def index_info_response(request, stats):
+    info = dict(stats)
+    if deps.replica is not None:
+        info["replica"] = deps.replica.stats()
+    response = SearchResponse(info)
+    # The counts change only when ingestion runs, browsers revalidate them with If-None-Match
+    etag = '"' + hashlib.sha1(response.body).hexdigest()[:20] + '"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={int(index_stats.fresh_for_sec())}, stale-while-revalidate={int(index_stats.ttl_sec)}",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return response
+
 @router.get("/index/info")
-async def get_index_info():
+async def get_index_info(request: Request):
     try:
-        index_info = deps.index.describe_index_stats()
-        total_vectors = index_info['total_vector_count']
-        return {"total_vectors": total_vectors}
+        stats = await index_stats.get()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve index info: {str(e)}")
+    return index_info_response(request, stats)
+
+@router.post("/index/refresh")
+async def refresh_index_info(request: Request):
+    """Refreshes the index statistics and picks up a new replica snapshot, e.g. after ingestion."""
+    try:
+        if deps.replica is not None:
+            await run_in_threadpool(deps.replica.load)
+        stats = await index_stats.refresh()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to refresh index info: {str(e)}")
+    return index_info_response(request, stats)
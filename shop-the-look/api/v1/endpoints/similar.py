@@ -0,0 +1,105 @@
+import asyncio
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query
+from pydantic import BaseModel
+from api.config import settings
+from api.deadlines import DeadlineExceeded
+from api.metrics import current_modality, metrics, span
+from api.results import ResultFormatter, SearchResponse
+from api.search import SearchScope, fetch_vectors, parse_exclude, query_similar
+
+router = APIRouter()
+
+class SimilarQuery(BaseModel):
+    ids: List[str]
+
+@router.get("/search/similar/{vector_id}", response_class=SearchResponse)
+async def search_similar(vector_id: str, fields: Optional[str] = None, compact: bool = False,
+                         modality: Optional[str] = None, metadata_filter: Optional[str] = Query(None, alias='filter'),
+                         exclude: str = 'item'):
+    """
+    Searches for results like the stored vector `vector_id` (the `id` of a search result).
+
+    The vector is read from the index instead of embedding the file again, so there is no upload
+    and no Vertex AI call. `exclude` leaves out the vector itself (`item`, the default), also the
+    other segments of the same video (`video`), or nothing (`none`).
+    """
+    try:
+        formatter = ResultFormatter.from_params(fields, compact)
+        scope = SearchScope.from_params(modality, metadata_filter)
+        exclude = parse_exclude(exclude)
+
+        with span('fetch', upstream='pinecone'):
+            stored = (await fetch_vectors([vector_id])).get(vector_id)
+        if stored is None:
+            raise HTTPException(status_code=404, detail=f"No vector with ID {vector_id}")
+
+        with span('query', upstream='pinecone'):
+            matches = await query_similar(vector_id, stored, settings.k, scope, exclude)
+
+        with span('results'):
+            body = formatter.response_body("results", formatter.format_matches(matches))
+
+        return SearchResponse(body)
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/search/similar", response_class=SearchResponse)
+async def search_similar_batch(query: SimilarQuery, fields: Optional[str] = None, compact: bool = False,
+                               modality: Optional[str] = None, metadata_filter: Optional[str] = Query(None, alias='filter'),
+                               exclude: str = 'item'):
+    """
+    Searches for results like each of several stored vectors at once.
+
+    The vectors are fetched together and their Pinecone queries run concurrently. Results are
+    returned per ID, in order, and an ID that is not in the index gets an `error` instead of
+    `results` without failing the others.
+    """
+    try:
+        formatter = ResultFormatter.from_params(fields, compact)
+        scope = SearchScope.from_params(modality, metadata_filter)
+        exclude = parse_exclude(exclude)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not query.ids:
+        raise HTTPException(status_code=400, detail="The batch needs at least one ID")
+    if len(query.ids) > settings.search_batch_max_items:
+        raise HTTPException(status_code=400, detail=f"A batch can hold at most {settings.search_batch_max_items} IDs")
+
+    try:
+        with span('fetch', upstream='pinecone'):
+            found = await fetch_vectors(list(dict.fromkeys(query.ids)))
+
+        ready = [i for i, vector_id in enumerate(query.ids) if vector_id in found]
+        with span('query'):
+            responses = await asyncio.gather(*(
+                query_similar(query.ids[i], found[query.ids[i]], settings.k, scope, exclude) for i in ready
+            ), return_exceptions=True)
+        outcomes = dict(zip(ready, responses))
+        for response in responses:
+            if isinstance(response, Exception):
+                metrics.record_upstream_error(current_modality(), 'pinecone')
+
+        with span('results'):
+            items = []
+            for i, vector_id in enumerate(query.ids):
+                entry = {"index": i, "id": vector_id}
+                outcome = outcomes.get(i)
+                if i not in outcomes:
+                    entry["error"] = f"No vector with ID {vector_id}"
+                elif isinstance(outcome, Exception):
+                    entry["error"] = str(outcome)
+                else:
+                    entry["results"] = formatter.format_matches(outcome)
+                items.append(entry)
+
+        return SearchResponse(formatter.response_body("items", items))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
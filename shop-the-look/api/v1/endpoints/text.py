@@ -1,52 +1,47 @@
-import requests
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
+from api.batcher import embedding_batcher
+from api.cache import normalize_query, text_embedding_cache
 from api.config import settings
-from api import deps
+from api.deadlines import DeadlineExceeded
+from api.metrics import metrics, span
+from api.results import ResultFormatter, SearchResponse
+from api.search import SearchScope, query_index
 
 router = APIRouter()
 
 class TextQuery(BaseModel):
     query: str
 
-@router.post("/search/text")
-async def query_text(query: TextQuery):
+@router.post("/search/text", response_class=SearchResponse)
+async def query_text(query: TextQuery, fields: Optional[str] = None, compact: bool = False,
+                     modality: Optional[str] = None, metadata_filter: Optional[str] = Query(None, alias='filter')):
     try:
+        formatter = ResultFormatter.from_params(fields, compact)
+        scope = SearchScope.from_params(modality, metadata_filter)
+
         if not query.query:
             raise HTTPException(status_code=400, detail="The query text cannot be empty")
 
-        access_token = settings.get_access_token()
-
-        url, headers, data = settings.get_embedding_request_data(access_token, 'text', query.query)
-
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-
-        # Extract the first embedding from the response
-        embedding_data = response.json()
-        vector = embedding_data['predictions'][0]['textEmbedding']
-
-        query_response = deps.index.query(
-            vector=vector,
-            top_k=settings.k,
-            include_metadata=True
-        )
-
-        matches = query_response['matches']
-        results = [{
-            "score": match['score'],
-            "metadata": {
-                "gcs_file_name": match['metadata'].get('gcs_file_name'),
-                "gcs_file_path": match['metadata'].get('gcs_file_path'),
-                "gcs_public_url": f"https://storage.googleapis.com/{match['metadata'].get('gcs_file_path')}{match['metadata'].get('gcs_file_name')}",
-                "file_type": match['metadata'].get('file_type'),
-                "segment": match['metadata'].get('segment'),
-                "start_offset_sec": match['metadata'].get('start_offset_sec'),
-                "end_offset_sec": match['metadata'].get('end_offset_sec'),
-                "interval_sec": match['metadata'].get('interval_sec'),
-            }
-        } for match in matches]
-
-        return {"results": results}
+        # Popular queries are served from the cache without a token check or Vertex call
+        cache_key = normalize_query(query.query)
+        with span('cache'):
+            vector = await text_embedding_cache.get(cache_key)
+        metrics.record_cache_lookup('text', vector is not None)
+        if vector is None:
+            with span('embed', upstream='vertex'):
+                vector = await embedding_batcher.embed('text', query.query)
+            await text_embedding_cache.set(cache_key, vector)
+
+        with span('query', upstream='pinecone'):
+            matches = await query_index(vector, settings.k, scope)
+
+        with span('results'):
+            body = formatter.response_body("results", formatter.format_matches(matches))
+
+        return SearchResponse(body)
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
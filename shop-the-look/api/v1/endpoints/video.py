@@ -1,60 +1,76 @@
 import os
-import base64
-import requests
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from typing import Optional
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from api.auth import token_manager
+from api.cache import digest_key, upload_embedding_cache
 from api.config import settings
-from api import deps
+from api.deadlines import DeadlineExceeded, bounded
+from api.embeddings import embedding_client, extract_embedding
+from api.metrics import metrics, span
+from api.results import ResultFormatter, SearchResponse
+from api.search import SearchScope, query_index
+from api.uploads import Base64PredictBody, UploadTooLarge, remove_quietly, spool_upload
+from api.videos import video_preprocessor
 
 router = APIRouter()
 
-@router.post("/search/video")
-async def query_video(file: UploadFile = File(...)):
+@router.post("/search/video", response_class=SearchResponse)
+async def query_video(file: UploadFile = File(...), fields: Optional[str] = None, compact: bool = False,
+                      modality: Optional[str] = None, metadata_filter: Optional[str] = Query(None, alias='filter')):
+    file_path = None
+    prepared_path = None
     try:
-        file_path = f"/tmp/{file.filename}"
-        with open(file_path, "wb") as buffer:
-            buffer.write(await file.read())
-        
-        with open(file_path, "rb") as video_file:
-            base64_encoded_data = base64.b64encode(video_file.read())
-            base64_video = base64_encoded_data.decode('utf-8')
-        
-        if len(base64_video) > 27000000:
-            os.remove(file_path)
-            raise HTTPException(status_code=400, detail="We don't support videos greater than 20 MB. Please upload a smaller video.")
+        formatter = ResultFormatter.from_params(fields, compact)
+        scope = SearchScope.from_params(modality, metadata_filter)
 
-        access_token = settings.get_access_token()
-        
-        url, headers, data = settings.get_embedding_request_data(access_token, 'video', base64_video)
-        
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        
-        # Extract the first embedding from the response
-        embedding_data = response.json()
-        vector = embedding_data['predictions'][0]['videoEmbeddings'][0]['embedding']
-        
-        query_response = deps.index.query(
-            vector=vector,
-            top_k=settings.k,
-            include_metadata=True
-        )
+        # Stream the upload to a uniquely named temp file, hashing and size-checking it on the way
+        suffix = os.path.splitext(file.filename or '')[1]
+        with span('read'):
+            file_path, _, sha256 = await run_in_threadpool(
+                spool_upload, file.file, settings.upload_tmp_dir, settings.video_max_upload_bytes, suffix=suffix
+            )
+
+        # Repeat uploads of the same clip skip base64 encoding and embedding entirely
+        cache_key = digest_key(f'video:{video_preprocessor.cache_tag()}', sha256)
+        with span('cache'):
+            vector = await run_in_threadpool(upload_embedding_cache.get, cache_key)
+        metrics.record_cache_lookup('uploads', vector is not None)
+
+        if vector is None:
+            with span('token', upstream='auth'):
+                access_token = await bounded(token_manager.get_token(), settings.token_timeout, 'Google auth')
+
+            # Only the window that is embedded is sent, trimmed by ffmpeg in a subprocess
+            with span('trim'):
+                prepared_path, segment_config = await bounded(
+                    video_preprocessor.prepare(file_path, settings.upload_tmp_dir), upstream='ffmpeg'
+                )
+
+            # The clip is base64 encoded chunk by chunk while it is sent to Vertex AI
+            with span('embed', upstream='vertex'):
+                predict_body = Base64PredictBody(prepared_path, 'video', {'videoSegmentConfig': segment_config})
+                predictions = await embedding_client.predict_stream(access_token, predict_body)
+                vector = extract_embedding('video', predictions[0], video_preprocessor.segments)
+            await run_in_threadpool(upload_embedding_cache.set, cache_key, vector)
         
-        matches = query_response['matches']
-        results = [{
-            "score": match['score'],
-            "metadata": {
-                "gcs_file_name": match['metadata'].get('gcs_file_name'),
-                "gcs_file_path": match['metadata'].get('gcs_file_path'),
-                "gcs_public_url": f"https://storage.googleapis.com/{match['metadata'].get('gcs_file_path')}{match['metadata'].get('gcs_file_name')}",
-                "file_type": match['metadata'].get('file_type'),
-                "segment": match['metadata'].get('segment'),
-                "start_offset_sec": match['metadata'].get('start_offset_sec'),
-                "end_offset_sec": match['metadata'].get('end_offset_sec'),
-                "interval_sec": match['metadata'].get('interval_sec'),
-            }
-        } for match in matches]
+        with span('query', upstream='pinecone'):
+            matches = await query_index(vector, settings.k, scope)
         
-        os.remove(file_path)
-        return {"results": results}
+        with span('results'):
+            body = formatter.response_body("results", formatter.format_matches(matches))
+
+        return SearchResponse(body)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="We don't support videos greater than 20 MB. Please upload a smaller video.")
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        if file_path:
+            remove_quietly(file_path)
+        if prepared_path and prepared_path != file_path:
+            remove_quietly(prepared_path)
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from api.config import settings
+from api.uploads import remove_quietly
+
+logger = logging.getLogger(__name__)
+
+# Vertex AI rejects video segments shorter than this
+MIN_SEGMENT_SEC = 4
+# Containers ffmpeg can copy any stream into, for uploads without an extension
+DEFAULT_SUFFIX = '.mkv'
+
+
+class VideoPreprocessor:
+    """
+    Trims a query video to the part that is embedded, before it is base64 encoded and sent to Vertex AI.
+
+    Search uses the first `segments` segment embeddings of a clip (averaged when there are several),
+    so the clip is cut to `start_sec` .. `start_sec + segments * segment_sec` with ffmpeg, copying the
+    video stream without re-encoding and dropping the audio the model ignores. With `transcode`, the
+    trimmed clip is also downscaled to at most `max_height` pixels and re-encoded at `bitrate`.
+
+    ffmpeg runs as a subprocess, at most `concurrency` at a time, so the event loop is never blocked,
+    and is killed when the request is cancelled or runs out of time.
+    Without ffmpeg, or when it fails or does not make the clip smaller, the upload is sent as it is
+    and the window is applied by the model instead, which still saves the embedding time.
+    """
+
+    def __init__(self, enabled=True, start_sec=0, segments=1, segment_sec=16, transcode=False, max_height=480,
+                 bitrate='1M', concurrency=4, ffmpeg='ffmpeg'):
+        if segment_sec < MIN_SEGMENT_SEC:
+            raise ValueError(f"The video segment length must be at least {MIN_SEGMENT_SEC} seconds")
+        self.enabled = enabled
+        self.start_sec = start_sec
+        self.segments = max(1, segments)
+        self.segment_sec = segment_sec
+        self.transcode = transcode
+        self.max_height = max_height
+        self.bitrate = bitrate
+        self.ffmpeg = ffmpeg
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._ffmpeg_path = None
+        self._warned = False
+
+    @property
+    def window_sec(self):
+        return self.segments * self.segment_sec
+
+    def cache_tag(self):
+        """Distinguishes cached upload embeddings made with other window, averaging or transcoding settings."""
+        tag = f"{self.start_sec}+{self.segments}x{self.segment_sec}"
+        return tag + (f":t{self.max_height}@{self.bitrate}" if self.transcode else "")
+
+    def segment_config(self, trimmed):
+        """The `videoSegmentConfig` of the predict request, offsets are relative to the trimmed clip."""
+        start = 0 if trimmed else self.start_sec
+        return {"startOffsetSec": start, "endOffsetSec": start + self.window_sec, "intervalSec": self.segment_sec}
+
+    def ffmpeg_args(self, source, target):
+        args = [self._ffmpeg_path, '-v', 'error', '-nostdin', '-y', '-ss', str(self.start_sec), '-i', source,
+                '-t', str(self.window_sec), '-map', '0:v:0', '-an']
+        if self.transcode:
+            args += ['-vf', f"scale=-2:'min({self.max_height},ih)'", '-c:v', 'libx264', '-preset', 'veryfast',
+                     '-b:v', self.bitrate, '-maxrate', self.bitrate, '-bufsize', self.bitrate, '-pix_fmt', 'yuv420p']
+        else:
+            args += ['-c:v', 'copy']
+        return args + [target]
+
+    def _available(self):
+        if self._ffmpeg_path is None:
+            self._ffmpeg_path = shutil.which(self.ffmpeg) or ''
+            if not self._ffmpeg_path and not self._warned:
+                self._warned = True
+                logger.warning("ffmpeg was not found, query videos are embedded without trimming")
+        return bool(self._ffmpeg_path)
+
+    async def prepare(self, path, directory):
+        """
+        Trims (and transcodes) the video at `path` into a new temporary file in `directory`.
+
+        :return: A tuple of the path of the video to embed, which the caller removes when it is
+                 not `path`, and the `videoSegmentConfig` to embed it with
+        """
+        if not self.enabled or not self._available():
+            return path, self.segment_config(False)
+
+        suffix = '.mp4' if self.transcode else (os.path.splitext(path)[1] or DEFAULT_SUFFIX)
+        fd, target = tempfile.mkstemp(dir=directory, suffix=suffix)
+        os.close(fd)
+        try:
+            async with self._semaphore:
+                process = await asyncio.create_subprocess_exec(
+                    *self.ffmpeg_args(path, target), stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+                )
+                try:
+                    _, stderr = await process.communicate()
+                except BaseException:
+                    # Cancelled, e.g. past the deadline: stop ffmpeg before its slot and output file are released
+                    if process.returncode is None:
+                        process.kill()
+                        await process.wait()
+                    raise
+            if process.returncode != 0:
+                logger.debug("ffmpeg could not trim %s: %s", path, stderr.decode('utf-8', 'replace').strip())
+            elif 0 < os.path.getsize(target) < os.path.getsize(path):
+                return target, self.segment_config(True)
+        except BaseException:
+            remove_quietly(target)
+            raise
+        remove_quietly(target)
+        return path, self.segment_config(False)
+
+
+video_preprocessor = VideoPreprocessor(
+    enabled=settings.video_preprocess,
+    start_sec=settings.video_query_start_sec,
+    segments=settings.video_query_segments,
+    segment_sec=settings.video_segment_sec,
+    transcode=settings.video_transcode,
+    max_height=settings.video_max_height,
+    bitrate=settings.video_bitrate,
+    concurrency=settings.video_preprocess_concurrency,
+    ffmpeg=settings.ffmpeg_path,
+)
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from api.auth import token_manager
+from api.batcher import embedding_batcher
+from api.config import settings
+from api.embeddings import embedding_client
+from api.search import SearchScope, query_index
+from api.stats import index_stats
+
+logger = logging.getLogger(__name__)
+
+RETRY_INTERVAL_SEC = 5
+
+
+class Warmup:
+    """
+    Does the first-request work of the backend when it starts, so the first search does not pay for it.
+
+    Fetches the first Google access token, opens a pooled connection to Vertex AI, loads the index
+    statistics over the Pinecone connection pool and, with a `query`, runs it through the whole
+    text search path. The steps run concurrently; failed ones are retried every
+    RETRY_INTERVAL_SEC seconds in the background until they all succeed, and only then is the
+    backend reported as ready on `/api/ready`.
+    """
+
+    def __init__(self, enabled=True, query=''):
+        self.enabled = enabled
+        self.query = query
+        self.ready = False
+        self.duration_sec = None
+        self.results = {}
+        self._task = None
+
+    async def _query(self):
+        vector = await embedding_batcher.embed('text', self.query)
+        await query_index(vector, settings.k, SearchScope.from_params())
+
+    def steps(self):
+        steps = {
+            "token": token_manager.get_token,
+            "vertex": embedding_client.warm_up,
+            "pinecone": index_stats.get,
+        }
+        if self.query:
+            steps["query"] = self._query
+        return steps
+
+    async def _step(self, name, step):
+        start = time.perf_counter()
+        try:
+            await step()
+        except Exception as e:
+            self.results[name] = {"ok": False, "error": str(e)}
+            logger.warning("Warm-up step %s failed: %s", name, e)
+            return False
+        self.results[name] = {"ok": True, "ms": round((time.perf_counter() - start) * 1000, 1)}
+        return True
+
+    async def _run(self):
+        start = time.perf_counter()
+        pending = self.steps()
+        while True:
+            done = await asyncio.gather(*(self._step(name, step) for name, step in pending.items()))
+            pending = {name: step for (name, step), ok in zip(pending.items(), done) if not ok}
+            if not pending:
+                break
+            await asyncio.sleep(RETRY_INTERVAL_SEC)
+        self.duration_sec = round(time.perf_counter() - start, 3)
+        self.ready = True
+        logger.info("Warm-up finished in %.2fs", self.duration_sec)
+
+    def start(self):
+        """Starts warming up in the background, or reports ready right away when disabled."""
+        if not self.enabled:
+            self.ready = True
+        elif self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+
+    async def wait(self, timeout):
+        """Waits up to `timeout` seconds for the warm-up, which keeps going in the background after that."""
+        if self._task is None:
+            return self.ready
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("The warm-up did not finish within %ss, serving while it continues", timeout)
+        return self.ready
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "warmup": self.enabled,
+            "duration_sec": self.duration_sec,
+            "steps": self.results,
+        }
+
+
+warmup = Warmup(enabled=settings.warmup, query=settings.warmup_query)
@@ -0,0 +1,32 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from api.config import settings
+
+
+class CpuWorkers:
+    """
+    A small thread pool for the CPU-bound stages of a request, such as decoding images and base64 encoding.
+
+    Keeping them off the event loop lets other requests progress, and keeping them out of the
+    shared thread pool used for blocking I/O (Pinecone queries, cache lookups) means a burst of
+    uploads cannot hold every I/O thread. More threads than cores would only contend for the GIL,
+    so the pool is small; how many requests get to queue work on it is bounded by admission control.
+    """
+
+    def __init__(self, max_workers):
+        self.max_workers = max(1, max_workers)
+        self._executor = None
+
+    async def run(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='stl-cpu')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(func, *args))
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+cpu_workers = CpuWorkers(settings.cpu_workers)
@@ -32,6 +32,7 @@ const API_URL = (() => {
 })();
 
 interface Result {
+  id: string;
   score: number;
   metadata: {
     gcs_file_name: string;
@@ -54,7 +55,7 @@ export default function Home() {
   const [totalVectors, setTotalVectors] = useState<number | null>(null);
   const [isSearchComplete, setIsSearchComplete] = useState<boolean>(false);
   const [searchTime, setSearchTime] = useState<number | null>(null);
-  const [searchType, setSearchType] = useState<'text' | 'image' | 'video' | null>(null);
+  const [searchType, setSearchType] = useState<'text' | 'image' | 'video' | 'similar' | null>(null);
   const [isInputEmpty, setIsInputEmpty] = useState<boolean>(true);
   const [errorMessage, setErrorMessage] = useState<string | null>(null);
   const [isLoadingResults, setIsLoadingResults] = useState<boolean>(false);
@@ -228,6 +229,35 @@ export default function Home() {
     }
   };
 
+  // Searches by the stored vector of a result, without uploading or embedding anything
+  const handleSimilarSearch = async (result: Result) => {
+    resetSearchState();
+    setShowSuggestions(false);
+    setIsSearching(true);
+    setSearchType('similar');
+    setIsLoadingResults(true);
+    const startTime = Date.now();
+    try {
+      const response = await axios.get(`${API_URL}/api/search/similar/${encodeURIComponent(result.id)}`, {
+        params: { exclude: 'video' }
+      });
+      setResults(response.data.results);
+      setSearchTime(Date.now() - startTime);
+      setIsSearchComplete(true);
+      track('similar_search', { fileType: result.metadata.file_type });
+    } catch (error) {
+      console.error('Error during similar search:', error);
+      if (axios.isAxiosError(error) && error.response) {
+        setErrorMessage(`Oops! ${error.response.data.detail || 'An unexpected error occurred'}`);
+      } else {
+        setErrorMessage('Oops! An unexpected error occurred. Our engineers have been notified.');
+      }
+    } finally {
+      setIsSearching(false);
+      setIsLoadingResults(false);
+    }
+  };
+
   const handleInputChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     const value = e.target.value;
     setQuery(value);
@@ -409,6 +439,7 @@ export default function Home() {
                   {searchType === 'text' && <> for <strong className="text-indigo-800">{query}</strong></>}
                   {searchType === 'image' && <> for <strong className="text-indigo-800">your image</strong></>}
                   {searchType === 'video' && <> for <strong className="text-indigo-800">your video</strong></>}
+                  {searchType === 'similar' && <> for <strong className="text-indigo-800">looks like your pick</strong></>}
                 </p>
                 <button
                   type="button"
@@ -474,6 +505,14 @@ export default function Home() {
                             <a href="https://www.pinecone.io/learn/vector-similarity?utm_source=shop-the-look&utm_medium=referral)" target="_blank" rel="noopener noreferrer" className="text-blue-300 hover:text-blue-200"> About vector similarity.</a>
                           </div>
                         </div>
+                        <button
+                          type="button"
+                          onClick={() => handleSimilarSearch(result)}
+                          className="ml-auto text-indigo-500 hover:text-indigo-700 focus:outline-none"
+                          disabled={isUploading || isSearching}
+                        >
+                          More like this
+                        </button>
                       </div>
                     </div>
                   );
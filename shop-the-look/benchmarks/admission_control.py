@@ -0,0 +1,108 @@
+"""
+Admission control benchmark.
+
+Runs the API in its own process against the fake Vertex endpoint with a simulated upload
+bandwidth, sends a burst of `--uploads` concurrent video uploads of `--size-mb` each while
+`--text-concurrency` clients keep searching for text, and reports the text search latency during
+the burst, how many uploads were served or shed with 429 (and how quickly), and the peak
+resident memory of the API process (Linux only):
+
+    python -m benchmarks.admission_control --uploads 40 --size-mb 10
+
+`--mode unlimited` disables the per-modality limits, as before admission control.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from benchmarks import app_under_test, fake_vertex
+from benchmarks.common import configure_app_env, free_port, serve_in_process, summarize_latencies
+from benchmarks.video_upload_memory import memory_kb, upload
+
+MODALITIES = ('text', 'similar', 'image', 'video', 'batch')
+
+
+async def search_text(client, url, stop, latencies):
+    i = 0
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.post(url, json={'query': f'summer dress {i}'})
+        if response.status_code == 200:
+            latencies.append(time.perf_counter() - start)
+        i += 1
+
+
+async def drive(base_url, pid, uploads, size_mb, text_concurrency):
+    payload = os.urandom(int(size_mb * 1_000_000) - 16)
+    limits = httpx.Limits(max_connections=uploads + text_concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=600, limits=limits) as client:
+        idle_latencies = []
+        idle_stop = asyncio.Event()
+        idle = [asyncio.ensure_future(search_text(client, '/api/search/text', idle_stop, idle_latencies))
+                for _ in range(text_concurrency)]
+        await asyncio.sleep(2)
+        idle_stop.set()
+        await asyncio.gather(*idle)
+
+        idle_rss_kb = memory_kb(pid, 'VmRSS')
+        text_latencies = []
+        stop = asyncio.Event()
+        searches = [asyncio.ensure_future(search_text(client, '/api/search/text', stop, text_latencies))
+                    for _ in range(text_concurrency)]
+        start = time.perf_counter()
+        results = await asyncio.gather(*(upload(client, '/api/search/video', i.to_bytes(16, 'big'), payload)
+                                         for i in range(uploads)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(*searches)
+
+    served = [latency for status, latency in results if status == 200]
+    shed = [latency for status, latency in results if status == 429]
+    text = summarize_latencies(text_latencies, elapsed)
+    return {
+        'burst_sec': round(elapsed, 2),
+        'text_idle_p50_ms': summarize_latencies(idle_latencies, 2)['p50_ms'],
+        'text_during_burst': {key: text[key] for key in ('requests', 'p50_ms', 'p99_ms', 'max_ms')},
+        'video_served': len(served),
+        'video_shed': len(shed),
+        'video_errors': len(results) - len(served) - len(shed),
+        'video_served_p50_ms': summarize_latencies(served, elapsed)['p50_ms'],
+        'video_shed_p50_ms': summarize_latencies(shed, elapsed)['p50_ms'],
+        'idle_rss_mb': round(idle_rss_kb / 1024, 1),
+        'peak_rss_mb': round(memory_kb(pid, 'VmHWM') / 1024, 1),
+    }
+
+
+def main(mode, uploads, size_mb, text_concurrency, vertex_latency_ms, upload_mbps):
+    vertex_port = free_port()
+    serve_in_process(fake_vertex.create_app, vertex_port, vertex_latency_ms, upload_mbps)
+    overrides = {'UPLOAD_CACHE_MAX_BYTES': 0, 'TEXT_CACHE_MAX_SIZE': 0, 'VIDEO_PREPROCESS': 'false', 'WARMUP': 'false',
+                 'SLOW_REQUEST_MS': 0}
+    if mode == 'unlimited':
+        overrides.update({f'ADMISSION_{modality.upper()}_CONCURRENCY': 0 for modality in MODALITIES})
+    configure_app_env(f'http://127.0.0.1:{vertex_port}', **overrides)
+
+    api_port = free_port()
+    api_process = serve_in_process(app_under_test.create_app, api_port)
+
+    result = asyncio.run(drive(f'http://127.0.0.1:{api_port}', api_process.pid, uploads, size_mb, text_concurrency))
+    result.update({'mode': mode, 'uploads': uploads, 'size_mb': size_mb})
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure text search latency and load shedding under a burst of video uploads.')
+    parser.add_argument('--mode', choices=['limited', 'unlimited'], default='limited', help='With or without the per-modality limits.')
+    parser.add_argument('--uploads', type=int, default=40, help='Number of concurrent video uploads in the burst.')
+    parser.add_argument('--size-mb', type=float, default=10.0, help='Size of each upload in MB.')
+    parser.add_argument('--text-concurrency', type=int, default=4, help='Concurrent text search clients.')
+    parser.add_argument('--vertex-latency-ms', type=float, default=150.0, help='Fake Vertex predict latency.')
+    parser.add_argument('--upload-mbps', type=float, default=200.0, help='Simulated upload bandwidth to Vertex.')
+
+    args = parser.parse_args()
+    main(args.mode, args.uploads, args.size_mb, args.text_concurrency, args.vertex_latency_ms, args.upload_mbps)
@@ -0,0 +1,43 @@
+"""
+The API wired to benchmark stand-ins.
+
+`configure_app_env` must have been called before `create_app` imports the `api` package.
+"""
+
+import time
+
+from benchmarks.fake_credentials import FakeCredentials
+
+
+class FakeIndex:
+    """Blocking stand-in for `pinecone.Index` with a fixed query latency."""
+
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+
+    def query(self, vector=None, top_k=10, include_metadata=False, **kwargs):
+        time.sleep(self.latency_ms / 1000)
+        return {'matches': [{
+            'id': f'vec-{i}',
+            'score': 1.0 - i / top_k,
+            'metadata': {'gcs_file_path': 'bucket/folder/', 'gcs_file_name': f'{i}.jpg', 'file_type': 'image'},
+        } for i in range(top_k)]}
+
+    def describe_index_stats(self, **kwargs):
+        return {'total_vector_count': 0, 'namespaces': {}}
+
+
+def create_app(pinecone_latency_ms=0.0, fake_index=True, credentials_latency_ms=0.0):
+    """
+    Returns the FastAPI app with fake Google credentials, and a fake in-process index unless
+    `fake_index` is False, in which case the real Pinecone client talks to `PINECONE_HOST`.
+    """
+    from api import deps
+    from api.auth import token_manager
+    from api.index import app
+
+    if fake_index:
+        deps.index = FakeIndex(pinecone_latency_ms)
+    credentials = FakeCredentials(refresh_latency_ms=credentials_latency_ms)
+    token_manager.credentials_provider = lambda: credentials
+    return app
@@ -0,0 +1,123 @@
+"""
+Cold start benchmark.
+
+Starts the API in a fresh Python process against the fake Vertex endpoint and the fake Pinecone
+data plane (through the real Pinecone client), with fake credentials whose token exchange takes
+`--credentials-latency-ms`, and reports the median over `--runs` starts of the time until the
+port accepts connections, until `/api/ready` reports ready, the latency of the first text search,
+and the time from spawning the process to the first search response. Runs with the start-up
+warm-up and without it (`WARMUP=false`, the former behavior):
+
+    python -m benchmarks.cold_start --runs 5 --credentials-latency-ms 300
+
+The fakes run locally, so the TCP and TLS handshakes of the real services are not part of the numbers.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks import fake_pinecone, fake_vertex
+from benchmarks.common import free_port, serve_in_process
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def serve(port, credentials_latency_ms):
+    """Entry point of the API process."""
+    import uvicorn
+    from benchmarks import app_under_test
+
+    app = app_under_test.create_app(fake_index=False, credentials_latency_ms=credentials_latency_ms)
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='warning')
+
+
+def wait_listening(port, process):
+    while True:
+        if process.poll() is not None:
+            raise RuntimeError(f"The API exited with code {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.1):
+                return
+        except OSError:
+            time.sleep(0.005)
+
+
+def cold_start(vertex_port, pinecone_port, warmup, credentials_latency_ms):
+    port = free_port()
+    env = dict(
+        os.environ,
+        GOOGLE_CLOUD_PROJECT_ID='benchmark-project',
+        GOOGLE_CLOUD_PROJECT_LOCATION='local',
+        PINECONE_API_KEY='benchmark-key',
+        PINECONE_INDEX_NAME='benchmark-index',
+        PINECONE_TOP_K='20',
+        VERTEX_API_BASE_URL=f'http://127.0.0.1:{vertex_port}',
+        PINECONE_HOST=f'http://127.0.0.1:{pinecone_port}',
+        WARMUP=str(warmup).lower(),
+        LOG_LEVEL='WARNING',
+    )
+    code = f'from benchmarks.cold_start import serve; serve({port}, {credentials_latency_ms})'
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', code], cwd=os.path.dirname(BENCHMARKS_DIR), env=env)
+    try:
+        wait_listening(port, process)
+        listening = time.perf_counter() - start
+        with httpx.Client(base_url=f'http://127.0.0.1:{port}', timeout=60) as client:
+            while client.get('/api/ready').status_code != 200:
+                time.sleep(0.01)
+            ready = time.perf_counter() - start
+
+            request_start = time.perf_counter()
+            client.post('/api/search/text', json={'query': 'red summer dress'}).raise_for_status()
+            first_response = time.perf_counter()
+
+            second_start = time.perf_counter()
+            client.post('/api/search/text', json={'query': 'blue denim jacket'}).raise_for_status()
+            second = time.perf_counter() - second_start
+    finally:
+        process.terminate()
+        process.wait()
+
+    return {
+        'listening_ms': listening * 1000,
+        'ready_ms': ready * 1000,
+        'first_request_ms': (first_response - request_start) * 1000,
+        'second_request_ms': second * 1000,
+        'first_response_ms': (first_response - start) * 1000,
+    }
+
+
+def run(runs, vertex_latency_ms, pinecone_latency_ms, credentials_latency_ms):
+    vertex_port = free_port()
+    serve_in_process(fake_vertex.create_app, vertex_port, vertex_latency_ms)
+    pinecone_port = free_port()
+    serve_in_process(fake_pinecone.create_app, pinecone_port, pinecone_latency_ms, 0.0, 1000)
+
+    report = []
+    for warmup in (False, True):
+        samples = [cold_start(vertex_port, pinecone_port, warmup, credentials_latency_ms) for _ in range(runs)]
+        entry = {'warmup': warmup}
+        for key in samples[0]:
+            entry[key] = round(sorted(sample[key] for sample in samples)[len(samples) // 2], 1)
+        report.append(entry)
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the time from starting the API to its first search response.')
+    parser.add_argument('--runs', type=int, default=5, help='Starts per configuration (the median is reported).')
+    parser.add_argument('--vertex-latency-ms', type=float, default=150.0, help='Fake Vertex predict latency.')
+    parser.add_argument('--pinecone-latency-ms', type=float, default=30.0, help='Fake Pinecone latency.')
+    parser.add_argument('--credentials-latency-ms', type=float, default=300.0, help='Fake access token exchange latency.')
+
+    args = parser.parse_args()
+    output = run(args.runs, args.vertex_latency_ms, args.pinecone_latency_ms, args.credentials_latency_ms)
+    print(json.dumps(output, indent=2))
@@ -0,0 +1,129 @@
+"""
+Shared helpers for the Shop The Look benchmarks.
+
+The benchmarks run the FastAPI app against local stand-ins for Vertex AI and Pinecone,
+so they need no Google Cloud or Pinecone account. Run them from the `shop-the-look`
+directory so the `api` package is importable, e.g. `python -m benchmarks.search_concurrency`.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+import httpx
+import uvicorn
+
+
+def free_port():
+    """Returns a free TCP port on localhost."""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(app, port, **kwargs):
+    """Starts a uvicorn server for `app` in a daemon thread and waits until it accepts connections."""
+    config = uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning', **kwargs)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
+
+
+def _run_app(factory, port, args):
+    uvicorn.run(factory(*args), host='127.0.0.1', port=port, log_level='warning')
+
+
+def serve_in_process(factory, port, *args):
+    """
+    Starts `factory(*args)` under uvicorn in a separate process, so a fake upstream does not
+    compete with the app under test for the GIL. Returns the process once the port accepts connections.
+    """
+    process = multiprocessing.Process(target=_run_app, args=(factory, port, args), daemon=True)
+    process.start()
+    while True:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.1):
+                return process
+        except OSError:
+            time.sleep(0.05)
+
+
+def configure_app_env(vertex_url, pinecone_host='http://127.0.0.1:1', **overrides):
+    """
+    Points the API settings at local stand-ins. Must be called before `api` is imported,
+    because the settings are read from the environment at import time.
+    """
+    os.environ.setdefault('GOOGLE_CLOUD_PROJECT_ID', 'benchmark-project')
+    os.environ.setdefault('GOOGLE_CLOUD_PROJECT_LOCATION', 'local')
+    os.environ.setdefault('PINECONE_API_KEY', 'benchmark-key')
+    os.environ.setdefault('PINECONE_INDEX_NAME', 'benchmark-index')
+    os.environ.setdefault('PINECONE_TOP_K', '20')
+    os.environ['VERTEX_API_BASE_URL'] = vertex_url
+    os.environ['PINECONE_HOST'] = pinecone_host
+    for key, value in overrides.items():
+        os.environ[key] = str(value)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def summarize_latencies(latencies, elapsed):
+    """Summarizes a list of request latencies (seconds) measured over `elapsed` seconds."""
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'max_ms': round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def drive_requests(url, concurrency, total, request_kwargs, timeout=120):
+    """
+    Sends `total` POST requests to `url` from `concurrency` concurrent clients and summarizes
+    the latencies of the successful ones. `request_kwargs(i)` returns the `httpx` keyword
+    arguments (e.g. `json` or `files`) of the i-th request.
+    """
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker(client):
+        nonlocal errors
+        while not queue.empty():
+            i = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, **request_kwargs(i))
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    summary = summarize_latencies(latencies, elapsed)
+    summary['errors'] = errors
+    return summary
@@ -0,0 +1,68 @@
+"""
+Compares two load test result files written by `benchmarks.load_test`.
+
+Prints the change of throughput and latency percentiles for every scenario and concurrency level
+present in both, and exits with status 1 if any of them regressed by more than `--threshold`
+percent:
+
+    python -m benchmarks.compare baseline.json results.json --threshold 10
+"""
+
+import argparse
+import json
+import sys
+
+# Metric -> True if higher is better
+METRICS = {
+    'rps': True,
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'vectors_per_sec': True,
+}
+
+
+def result_key(result):
+    return result['scenario'], result.get('concurrency')
+
+
+def compare(baseline, current, threshold):
+    """Returns the printable rows and whether any metric regressed by more than `threshold` percent."""
+    baseline_results = {result_key(result): result for result in baseline['results']}
+    rows = []
+    regressed = False
+    for result in current['results']:
+        before = baseline_results.get(result_key(result))
+        if before is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric not in result or not before.get(metric):
+                continue
+            change = (result[metric] - before[metric]) / before[metric] * 100
+            worse = -change if higher_is_better else change
+            flag = ''
+            if worse > threshold:
+                flag = 'REGRESSION'
+                regressed = True
+            scenario, concurrency = result_key(result)
+            label = scenario if concurrency is None else f'{scenario} c={concurrency}'
+            rows.append(f"{label:<16} {metric:<16} {before[metric]:>10} -> {result[metric]:>10} {change:>+8.1f}% {flag}")
+    return rows, regressed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare two load test result files.')
+    parser.add_argument('baseline', help='Results of the reference run.')
+    parser.add_argument('current', help='Results of the run to check.')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Percent change counted as a regression.')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    print(f"{baseline.get('commit')} -> {current.get('commit')}")
+    rows, regressed = compare(baseline, current, args.threshold)
+    print('\n'.join(rows))
+    sys.exit(1 if regressed else 0)
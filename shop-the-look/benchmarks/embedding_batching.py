@@ -0,0 +1,85 @@
+"""
+Embedding micro-batching benchmark.
+
+Sends bursts of concurrent text embedding requests through `EmbeddingBatcher` against the fake
+Vertex endpoint for several batching windows, and reports how many predict calls were made and
+the latency each request paid:
+
+    python -m benchmarks.embedding_batching --concurrency 50 --rounds 10 --windows 0,2,5,10
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from benchmarks import fake_vertex
+from benchmarks.common import configure_app_env, free_port, serve_in_process, summarize_latencies
+
+
+async def run_window(batcher, vertex_url, concurrency, rounds):
+    async with httpx.AsyncClient() as client:
+        await client.post(f'{vertex_url}/stats/reset')
+
+    latencies = []
+
+    async def one(i):
+        start = time.perf_counter()
+        await batcher.embed('text', f'denim jacket {i}')
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for round_number in range(rounds):
+        await asyncio.gather(*(one(round_number * concurrency + i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    async with httpx.AsyncClient() as client:
+        upstream = (await client.get(f'{vertex_url}/stats')).json()
+
+    summary = summarize_latencies(latencies, elapsed)
+    summary['predict_calls'] = upstream['requests']
+    summary.update({f'batcher_{key}': value for key, value in batcher.stats.as_dict().items()})
+    return summary
+
+
+async def benchmark_token():
+    return 'benchmark-token'
+
+
+def main(concurrency, rounds, windows, max_batch_size, vertex_latency_ms):
+    vertex_port = free_port()
+    serve_in_process(fake_vertex.create_app, vertex_port, vertex_latency_ms)
+    vertex_url = f'http://127.0.0.1:{vertex_port}'
+    configure_app_env(vertex_url)
+
+    from api.batcher import EmbeddingBatcher
+    from api.embeddings import EmbeddingClient
+    from api.config import settings
+
+    async def run_all():
+        client = EmbeddingClient(settings)
+        results = []
+        for window_ms in windows:
+            batcher = EmbeddingBatcher(client, window_ms, max_batch_size if window_ms else 1, benchmark_token)
+            result = await run_window(batcher, vertex_url, concurrency, rounds)
+            result.update({'window_ms': window_ms, 'max_batch_size': batcher.max_batch_size})
+            results.append(result)
+        await client.aclose()
+        return results
+
+    print(json.dumps(asyncio.run(run_all()), indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark embedding micro-batching against a fake Vertex endpoint.')
+    parser.add_argument('--concurrency', type=int, default=50, help='Concurrent requests per burst.')
+    parser.add_argument('--rounds', type=int, default=10, help='Number of bursts per window setting.')
+    parser.add_argument('--windows', type=str, default='0,2,5,10', help='Comma-separated batching windows in ms (0 disables batching).')
+    parser.add_argument('--max-batch-size', type=int, default=16, help='Maximum instances per predict call.')
+    parser.add_argument('--vertex-latency-ms', type=float, default=100.0, help='Fake Vertex predict latency.')
+
+    args = parser.parse_args()
+    windows = [float(window) for window in args.windows.split(',')]
+    main(args.concurrency, args.rounds, windows, args.max_batch_size, args.vertex_latency_ms)
@@ -0,0 +1,32 @@
+"""
+Stand-in for `google.oauth2.service_account.Credentials`.
+"""
+
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+
+class FakeCredentials:
+    """
+    Issues numbered tokens with a fixed lifetime. `refresh` blocks for `refresh_latency_ms`,
+    like the real token exchange with Google, and counts how often it was called.
+    """
+
+    def __init__(self, lifetime_sec=3600, refresh_latency_ms=0.0):
+        self.lifetime = timedelta(seconds=lifetime_sec)
+        self.refresh_latency_sec = refresh_latency_ms / 1000
+        self.token = None
+        self.expiry = None
+        self.refresh_calls = 0
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def refresh(self, request):
+        with self._lock:
+            self.refresh_calls += 1
+        time.sleep(self.refresh_latency_sec)
+        self.token = f'fake-token-{next(self._counter)}'
+        # Naive UTC, like google-auth
+        self.expiry = datetime.now(timezone.utc).replace(tzinfo=None) + self.lifetime
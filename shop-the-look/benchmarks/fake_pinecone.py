@@ -0,0 +1,232 @@
+"""
+Local stand-in for the Pinecone data plane.
+
+Serves the REST endpoints the Pinecone Python client calls for an index host (query, upsert,
+fetch, delete, list and describe_index_stats) from an in-memory store, so the real client can be
+pointed at it with `PINECONE_HOST=http://127.0.0.1:<port>`. Queries rank the stored vectors by
+dot product (with numpy, if installed) and honor metadata filters, after a configurable latency;
+a fraction of requests can be failed with 503s, and a fraction `tail_rate` slowed down by
+`tail_ms`. The index can be seeded with a synthetic catalog:
+
+    python -m benchmarks.fake_pinecone --port 8082 --latency-ms 30 --seed-vectors 10000
+"""
+
+import argparse
+import asyncio
+import random
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+from starlette.requests import ClientDisconnect
+
+from benchmarks.fake_vertex import DIMENSION, deterministic_vector
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+FILTER_OPERATORS = {
+    '$eq': lambda value, operand: value == operand,
+    '$ne': lambda value, operand: value != operand,
+    '$in': lambda value, operand: value in operand,
+    '$nin': lambda value, operand: value not in operand,
+    '$gt': lambda value, operand: isinstance(value, (int, float)) and value > operand,
+    '$gte': lambda value, operand: isinstance(value, (int, float)) and value >= operand,
+    '$lt': lambda value, operand: isinstance(value, (int, float)) and value < operand,
+    '$lte': lambda value, operand: isinstance(value, (int, float)) and value <= operand,
+}
+
+
+def matches_filter(metadata, metadata_filter):
+    """Evaluates a Pinecone metadata filter against the metadata of a vector."""
+    for key, condition in metadata_filter.items():
+        if key == '$and':
+            if not all(matches_filter(metadata, clause) for clause in condition):
+                return False
+        elif key == '$or':
+            if not any(matches_filter(metadata, clause) for clause in condition):
+                return False
+        else:
+            if not isinstance(condition, dict):
+                condition = {'$eq': condition}
+            value = metadata.get(key)
+            if not all(FILTER_OPERATORS[operator](value, operand) for operator, operand in condition.items()):
+                return False
+    return True
+
+
+class Namespace:
+    def __init__(self):
+        self.vectors = {}
+        self._matrix = None
+        self._ids = None
+
+    def upsert(self, vectors):
+        for vector in vectors:
+            self.vectors[vector['id']] = (vector.get('values', []), vector.get('metadata') or {})
+        self._matrix = None
+
+    def delete(self, ids):
+        for id in ids:
+            self.vectors.pop(id, None)
+        self._matrix = None
+
+    def query(self, values, top_k, metadata_filter=None):
+        if not self.vectors:
+            return []
+        if np is None:
+            scored = ((sum(a * b for a, b in zip(values, stored)), id) for id, (stored, _) in self.vectors.items())
+            ranked = [(id, score) for score, id in sorted(scored, reverse=True)]
+        else:
+            if self._matrix is None:
+                self._ids = list(self.vectors)
+                self._matrix = np.array([self.vectors[id][0] for id in self._ids], dtype=np.float32)
+            scores = self._matrix @ np.asarray(values, dtype=np.float32)
+            order = np.argsort(-scores) if metadata_filter else np.argsort(-scores)[:top_k]
+            ranked = ((self._ids[i], float(scores[i])) for i in order)
+        if metadata_filter:
+            ranked = (match for match in ranked if matches_filter(self.vectors[match[0]][1], metadata_filter))
+        return [match for _, match in zip(range(top_k), ranked)]
+
+
+def seed_catalog(namespace, count):
+    """Adds `count` synthetic image and video vectors with the metadata the ingestion scripts write."""
+    vectors = []
+    for i in range(count):
+        file_type = 'video' if i % 10 == 0 else 'image'
+        extension = 'mp4' if file_type == 'video' else 'jpg'
+        metadata = {'file_type': file_type, 'gcs_file_path': 'catalog/products/', 'gcs_file_name': f'{i}.{extension}'}
+        if file_type == 'video':
+            metadata.update({'segment': 0, 'start_offset_sec': 0, 'end_offset_sec': 15, 'interval_sec': 15})
+        vectors.append({'id': f'seed-{i}', 'values': deterministic_vector(f'seed:{i}'), 'metadata': metadata})
+    namespace.upsert(vectors)
+
+
+def create_app(latency_ms=0.0, error_rate=0.0, seed_vectors=0, tail_rate=0.0, tail_ms=0.0):
+    app = FastAPI()
+    app.state.latency_ms = latency_ms
+    app.state.error_rate = error_rate
+    app.state.tail_rate = tail_rate
+    app.state.tail_ms = tail_ms
+    app.state.namespaces = {}
+    app.state.requests = {}
+
+    def namespace(name):
+        return app.state.namespaces.setdefault(name or '', Namespace())
+
+    if seed_vectors:
+        seed_catalog(namespace(''), seed_vectors)
+
+    @app.middleware("http")
+    async def simulate_network(request: Request, call_next):
+        app.state.requests[request.url.path] = app.state.requests.get(request.url.path, 0) + 1
+        if request.url.path.startswith('/stats'):
+            return await call_next(request)
+        delay_sec = app.state.latency_ms / 1000
+        if app.state.tail_rate and random.random() < app.state.tail_rate:
+            delay_sec += app.state.tail_ms / 1000
+        if delay_sec:
+            await asyncio.sleep(delay_sec)
+        if app.state.error_rate and random.random() < app.state.error_rate:
+            return JSONResponse({'code': 14, 'message': 'Service unavailable', 'details': []}, status_code=503)
+        try:
+            return await call_next(request)
+        except ClientDisconnect:
+            # The client gave up on a slow request
+            return Response(status_code=499)
+
+    @app.post("/query")
+    async def query(request: Request):
+        body = await request.json()
+        target = namespace(body.get('namespace'))
+        values = body.get('vector')
+        if values is None and body.get('id') in target.vectors:
+            values = target.vectors[body['id']][0]
+        matches = []
+        for id, score in target.query(values or [], body.get('topK', 10), body.get('filter')):
+            stored, metadata = target.vectors[id]
+            match = {'id': id, 'score': score, 'values': stored if body.get('includeValues') else []}
+            if body.get('includeMetadata'):
+                match['metadata'] = metadata
+            matches.append(match)
+        return {'matches': matches, 'namespace': body.get('namespace', ''), 'usage': {'readUnits': 5}}
+
+    @app.post("/vectors/upsert")
+    async def upsert(request: Request):
+        body = await request.json()
+        namespace(body.get('namespace')).upsert(body['vectors'])
+        return {'upsertedCount': len(body['vectors'])}
+
+    @app.get("/vectors/fetch")
+    async def fetch(request: Request):
+        target = namespace(request.query_params.get('namespace'))
+        vectors = {}
+        for id in request.query_params.getlist('ids'):
+            if id in target.vectors:
+                values, metadata = target.vectors[id]
+                vectors[id] = {'id': id, 'values': values, 'metadata': metadata}
+        return {'vectors': vectors, 'namespace': request.query_params.get('namespace', ''), 'usage': {'readUnits': 1}}
+
+    @app.post("/vectors/delete")
+    async def delete(request: Request):
+        body = await request.json()
+        target = namespace(body.get('namespace'))
+        if body.get('deleteAll'):
+            target.delete(list(target.vectors))
+        else:
+            target.delete(body.get('ids', []))
+        return {}
+
+    @app.get("/vectors/list")
+    async def list_vectors(request: Request):
+        params = request.query_params
+        prefix = params.get('prefix', '')
+        limit = int(params.get('limit', 100))
+        ids = sorted(id for id in namespace(params.get('namespace')).vectors if id.startswith(prefix))
+        start = int(params.get('paginationToken') or 0)
+        page = ids[start:start + limit]
+        response = {'vectors': [{'id': id} for id in page], 'namespace': params.get('namespace', ''), 'usage': {'readUnits': 1}}
+        if start + limit < len(ids):
+            response['pagination'] = {'next': str(start + limit)}
+        return response
+
+    @app.post("/describe_index_stats")
+    async def describe_index_stats(request: Request):
+        body = await request.json() if await request.body() else {}
+        if body.get('filter'):
+            # Like a serverless index
+            return JSONResponse({'code': 3, 'message': 'Serverless and Starter indexes do not support describing index stats with metadata filtering.', 'details': []}, status_code=400)
+        namespaces = {name: {'vectorCount': len(target.vectors)} for name, target in app.state.namespaces.items()}
+        return {
+            'namespaces': namespaces,
+            'dimension': DIMENSION,
+            'indexFullness': 0.0,
+            'totalVectorCount': sum(target['vectorCount'] for target in namespaces.values()),
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {'requests': app.state.requests}
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        app.state.requests = {}
+        return {}
+
+    return app
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Run a fake Pinecone index data plane.')
+    parser.add_argument('--port', type=int, default=8082, help='Port to listen on.')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Artificial latency per request.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failed with a 503.')
+    parser.add_argument('--seed-vectors', type=int, default=0, help='Synthetic catalog vectors to start with.')
+    parser.add_argument('--tail-rate', type=float, default=0.0, help='Fraction of requests slowed down by --tail-ms.')
+    parser.add_argument('--tail-ms', type=float, default=0.0, help='Extra latency of the slow requests.')
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.error_rate, args.seed_vectors, args.tail_rate, args.tail_ms), host='127.0.0.1', port=args.port, log_level='warning')
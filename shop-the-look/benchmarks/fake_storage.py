@@ -0,0 +1,33 @@
+"""
+In-process stand-in for the Google Cloud Storage client used by the ingestion scripts.
+
+`list_blobs` yields blobs one page at a time, each page after a simulated round-trip, like the
+real client's paged iterator.
+"""
+
+import time
+
+PAGE_SIZE = 1000
+
+
+class FakeBlob:
+    def __init__(self, name, generation=1):
+        self.name = name
+        self.generation = generation
+        self.etag = f'etag-{generation}'
+
+
+class FakeStorageClient:
+    """Lists `files` blobs (one in `video_every` is a video, the rest images), one page per `page_latency_ms`."""
+
+    def __init__(self, files, page_latency_ms=0.0, video_every=10):
+        self.files = files
+        self.page_latency_sec = page_latency_ms / 1000
+        self.video_every = video_every
+
+    def list_blobs(self, bucket_name, prefix=None, page_size=PAGE_SIZE):
+        for start in range(0, self.files, page_size):
+            time.sleep(self.page_latency_sec)
+            for i in range(start, min(start + page_size, self.files)):
+                extension = 'mp4' if self.video_every and i % self.video_every == 0 else 'jpg'
+                yield FakeBlob(f'{prefix}/{i}.{extension}')
@@ -0,0 +1,148 @@
+"""
+Local stand-in for the Vertex AI multimodal embedding predict endpoint.
+
+Returns deterministic 1408-dimensional vectors derived from the request content, after a
+configurable artificial latency, plus an optional delay proportional to the request size that
+simulates upload bandwidth. With a quota, requests beyond `quota_rps` per second are rejected
+with a 429 and a Retry-After header, like a Vertex AI quota; text or image content containing
+"corrupt" is rejected with a 400, and a fraction `error_rate` of requests fails with a 503. A
+fraction `tail_rate` of requests takes `tail_ms` longer, like a slow replica or a stalled connection.
+Can be run on its own:
+
+    python -m benchmarks.fake_vertex --port 8081 --latency-ms 200 --upload-mbps 50 --quota-rps 100
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+from functools import lru_cache
+
+from fastapi import FastAPI, Request, Response
+
+DIMENSION = 1408
+CORRUPT_MARKER = 'corrupt'
+
+
+@lru_cache(maxsize=4096)
+def deterministic_vector(seed):
+    """Unit-length vector seeded by the given string, so equal content gets equal embeddings."""
+    digest = hashlib.shake_256(seed.encode('utf-8')).digest(DIMENSION)
+    values = [b - 127.5 for b in digest]
+    norm = math.sqrt(sum(v * v for v in values))
+    return [round(v / norm, 6) for v in values]
+
+
+def predict_instance(instance):
+    if 'text' in instance:
+        return {'textEmbedding': deterministic_vector('text:' + instance['text'])}
+    if 'image' in instance:
+        return {'imageEmbedding': deterministic_vector('image:' + instance['image']['bytesBase64Encoded'][:4096])}
+    if 'video' in instance:
+        # One segment per interval of the requested window, the first 16 seconds by default
+        content = instance['video']['bytesBase64Encoded'][:4096]
+        config = instance['video'].get('videoSegmentConfig') or {}
+        interval = config.get('intervalSec', 16)
+        start = config.get('startOffsetSec', 0)
+        end = config.get('endOffsetSec', start + interval)
+        return {'videoEmbeddings': [
+            {'startOffsetSec': offset, 'endOffsetSec': min(offset + interval, end),
+             'embedding': deterministic_vector(f'video:{offset}:{content}')}
+            for offset in range(start, end, interval)
+        ]}
+    raise ValueError(f"Unsupported instance: {list(instance)}")
+
+
+def error_response(code, status, message, headers=None):
+    content = json.dumps({'error': {'code': code, 'message': message, 'status': status}})
+    return Response(content=content, status_code=code, media_type='application/json', headers=headers)
+
+
+class QuotaBucket:
+    """Token bucket allowing `rate` requests per second, with a burst of one second's worth."""
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.tokens = rate
+        self.updated_at = time.monotonic()
+
+    def try_acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+def create_app(latency_ms=0.0, upload_mbps=0.0, quota_rps=0.0, retry_after_sec=1, error_rate=0.0, tail_rate=0.0, tail_ms=0.0):
+    app = FastAPI()
+    app.state.latency_ms = latency_ms
+    app.state.upload_mbps = upload_mbps
+    app.state.quota = QuotaBucket(quota_rps) if quota_rps else None
+    app.state.retry_after_sec = retry_after_sec
+    app.state.error_rate = error_rate
+    app.state.tail_rate = tail_rate
+    app.state.tail_ms = tail_ms
+    app.state.requests = 0
+    app.state.instances = 0
+    app.state.throttled = 0
+
+    @app.post("/v1/projects/{project}/locations/{location}/publishers/google/models/{model_action}")
+    async def predict(project: str, location: str, model_action: str, request: Request):
+        raw_body = await request.body()
+        body = json.loads(raw_body)
+        if app.state.quota and not app.state.quota.try_acquire():
+            app.state.throttled += 1
+            return error_response(429, 'RESOURCE_EXHAUSTED', 'Quota exceeded for online_prediction_requests_per_base_model.',
+                                  headers={'Retry-After': str(app.state.retry_after_sec)})
+        if any(CORRUPT_MARKER in json.dumps(instance) for instance in body['instances']):
+            return error_response(400, 'INVALID_ARGUMENT', 'Unable to decode the provided content.')
+        if app.state.error_rate and random.random() < app.state.error_rate:
+            return error_response(503, 'UNAVAILABLE', 'The service is currently unavailable.')
+        app.state.requests += 1
+        app.state.instances += len(body['instances'])
+        delay_sec = app.state.latency_ms / 1000
+        if app.state.upload_mbps:
+            delay_sec += len(raw_body) * 8 / (app.state.upload_mbps * 1_000_000)
+        if app.state.tail_rate and random.random() < app.state.tail_rate:
+            delay_sec += app.state.tail_ms / 1000
+        if delay_sec:
+            await asyncio.sleep(delay_sec)
+        predictions = [predict_instance(instance) for instance in body['instances']]
+        return Response(content=json.dumps({'predictions': predictions}), media_type='application/json')
+
+    @app.get("/stats")
+    async def stats():
+        return {'requests': app.state.requests, 'instances': app.state.instances, 'throttled': app.state.throttled}
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        app.state.requests = 0
+        app.state.instances = 0
+        app.state.throttled = 0
+        return {}
+
+    return app
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Run a fake Vertex AI multimodal embedding endpoint.')
+    parser.add_argument('--port', type=int, default=8081, help='Port to listen on.')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Artificial latency per predict call.')
+    parser.add_argument('--upload-mbps', type=float, default=0.0, help='Simulated upload bandwidth, 0 disables it.')
+    parser.add_argument('--quota-rps', type=float, default=0.0, help='Requests per second before returning 429s, 0 disables it.')
+    parser.add_argument('--retry-after-sec', type=int, default=1, help='Retry-After sent with 429s.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failed with a 503.')
+    parser.add_argument('--tail-rate', type=float, default=0.0, help='Fraction of requests slowed down by --tail-ms.')
+    parser.add_argument('--tail-ms', type=float, default=0.0, help='Extra latency of the slow requests.')
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency_ms, args.upload_mbps, args.quota_rps, args.retry_after_sec, args.error_rate,
+                           args.tail_rate, args.tail_ms),
+                host='127.0.0.1', port=args.port, log_level='warning')
@@ -0,0 +1,155 @@
+"""
+Image preprocessing benchmark.
+
+For each sample image, reports the size of the predict payload and the end-to-end latency of
+`/api/search/image` with and without preprocessing, against the fake Vertex endpoint with a
+simulated upload bandwidth. Without `--images`, a set of synthetic photos is generated:
+
+    python -m benchmarks.image_preprocessing --images path/to/photos --upload-mbps 50
+
+With `--live`, the benchmark instead uses the real Vertex AI and Pinecone settings from the
+environment and checks that the top-k results for the original and the preprocessed image match:
+
+    python -m benchmarks.image_preprocessing --images path/to/photos --live
+"""
+
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import time
+
+import httpx
+from PIL import Image
+
+from benchmarks import app_under_test, fake_vertex
+from benchmarks.common import configure_app_env, free_port, serve_in_process, serve_in_thread
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+def synthetic_images():
+    """Photo-sized test images: noisy gradients compress about as badly as real photos."""
+    samples = {}
+    for name, size, file_format in [('phone-12mp.jpg', (4000, 3000), 'JPEG'),
+                                    ('phone-12mp.png', (4032, 3024), 'PNG'),
+                                    ('product-2mp.jpg', (1600, 1200), 'JPEG'),
+                                    ('thumbnail.jpg', (640, 480), 'JPEG')]:
+        noise = Image.effect_noise(size, 40).convert('RGB')
+        gradient = Image.linear_gradient('L').resize(size).convert('RGB')
+        image = Image.blend(noise, gradient, 0.5)
+        output = io.BytesIO()
+        image.save(output, format=file_format, quality=95)
+        samples[name] = output.getvalue()
+    return samples
+
+
+def load_images(directory):
+    samples = {}
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(directory, name), 'rb') as f:
+                samples[name] = f.read()
+    return samples
+
+
+async def search_latency(client, url, name, contents, repeats):
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        response = await client.post(url, files={'file': (name, contents)})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)[len(latencies) // 2]
+
+
+def run_fake(samples, vertex_latency_ms, upload_mbps, repeats):
+    from api.images import prepare_image
+
+    vertex_port = free_port()
+    serve_in_process(fake_vertex.create_app, vertex_port, vertex_latency_ms, upload_mbps)
+    # Disable the upload cache so every request is embedded
+    configure_app_env(f'http://127.0.0.1:{vertex_port}', UPLOAD_CACHE_MAX_BYTES=0)
+    from api.config import settings
+
+    app = app_under_test.create_app()
+    api_port = free_port()
+    serve_in_thread(app, api_port)
+    url = f'http://127.0.0.1:{api_port}/api/search/image'
+
+    async def run():
+        results = []
+        async with httpx.AsyncClient(timeout=120) as client:
+            for name, contents in samples.items():
+                start = time.perf_counter()
+                prepared, prepared_bytes = prepare_image(contents, settings.image_max_edge, settings.image_jpeg_quality)
+                preprocess_ms = (time.perf_counter() - start) * 1000
+
+                settings.image_preprocess = False
+                original_latency = await search_latency(client, url, name, contents, repeats)
+                settings.image_preprocess = True
+                prepared_latency = await search_latency(client, url, name, contents, repeats)
+
+                results.append({
+                    'image': name,
+                    'original_payload_bytes': len(base64.b64encode(contents)),
+                    'prepared_payload_bytes': len(prepared),
+                    'preprocess_ms': round(preprocess_ms, 1),
+                    'original_latency_ms': round(original_latency * 1000, 1),
+                    'prepared_latency_ms': round(prepared_latency * 1000, 1),
+                })
+        return results
+
+    return asyncio.run(run())
+
+
+def run_live(samples, top_k):
+    """Compares the top-k ids for original and preprocessed images using the real services."""
+    from api import deps
+    from api.auth import token_manager
+    from api.config import settings
+    from api.embeddings import EmbeddingClient
+    from api.images import prepare_image
+
+    deps.connect()
+
+    async def run():
+        client = EmbeddingClient(settings)
+        access_token = await token_manager.get_token()
+        results = []
+        for name, contents in samples.items():
+            prepared, _ = prepare_image(contents, settings.image_max_edge, settings.image_jpeg_quality)
+            ids = []
+            for payload in (base64.b64encode(contents).decode('utf-8'), prepared):
+                vector = await client.embed(access_token, 'image', payload)
+                response = deps.index.query(vector=vector, top_k=top_k)
+                ids.append([match['id'] for match in response['matches']])
+            results.append({
+                'image': name,
+                'same_top_k_order': ids[0] == ids[1],
+                'top_k_overlap': round(len(set(ids[0]) & set(ids[1])) / max(1, len(ids[0])), 3),
+            })
+        await client.aclose()
+        return results
+
+    return asyncio.run(run())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark image preprocessing before embedding.')
+    parser.add_argument('--images', type=str, help='Directory of sample images (default: generated samples).')
+    parser.add_argument('--vertex-latency-ms', type=float, default=150.0, help='Fake Vertex predict latency.')
+    parser.add_argument('--upload-mbps', type=float, default=50.0, help='Simulated upload bandwidth to Vertex.')
+    parser.add_argument('--repeats', type=int, default=5, help='Searches per image and mode (the median is reported).')
+    parser.add_argument('--live', action='store_true', help='Check top-k stability against the real Vertex AI and Pinecone.')
+    parser.add_argument('--top-k', type=int, default=20, help='Top-k used for the --live comparison.')
+
+    args = parser.parse_args()
+    samples = load_images(args.images) if args.images else synthetic_images()
+    if args.live:
+        output = run_live(samples, args.top_k)
+    else:
+        output = run_fake(samples, args.vertex_latency_ms, args.upload_mbps, args.repeats)
+    print(json.dumps(output, indent=2))
@@ -0,0 +1,143 @@
+"""
+Ingestion pipeline benchmark.
+
+Ingests a fake bucket of images and videos with the streaming pipeline used by the ingestion
+scripts, and (with `--mode legacy`) with the previous approach of listing the whole folder
+before submitting every file to a thread pool. The fake bucket lists one page at a time with a
+round-trip latency, the fake model embeds with a fixed latency, and the fake index upserts with
+a fixed latency. Reports the time to the first upsert, the throughput and the peak memory
+allocated while ingesting:
+
+    python -m benchmarks.ingestion_pipeline --files 20000 --mode pipeline
+
+With `--profile PATH`, the pipeline also writes its per-stage profile (see scripts/ingest_profile.py)
+to PATH.json and PATH.csv.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from benchmarks.fake_storage import FakeStorageClient  # noqa: E402
+from ingest_manifest import vector_id  # noqa: E402
+from pipeline import Modality, PipelineConfig, run_ingestion  # noqa: E402
+from upsert_buffer import UpsertBuffer  # noqa: E402
+
+DIMENSION = 1408
+
+
+class FakeModel:
+    def __init__(self, latency_ms):
+        self.latency_sec = latency_ms / 1000
+
+    def get_embeddings(self, **kwargs):
+        time.sleep(self.latency_sec)
+        return [0.01] * DIMENSION
+
+
+class FakeIndex:
+    def __init__(self, latency_ms):
+        self.latency_sec = latency_ms / 1000
+        self.vectors = 0
+        self.first_upsert_at = None
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors):
+        time.sleep(self.latency_sec)
+        with self._lock:
+            if self.first_upsert_at is None:
+                self.first_upsert_at = time.perf_counter()
+            self.vectors += len(vectors)
+
+    def delete(self, ids):
+        pass
+
+
+def embed(model, item):
+    values = model.get_embeddings(content=item.content)
+    segments = 4 if item.modality.file_type == 'video' else 1
+    return [{
+        'id': vector_id(item.bucket_name, item.blob.name, segment if segments > 1 else None),
+        'values': values,
+        'metadata': {'file_type': item.modality.file_type, 'gcs_file_name': item.file_name},
+    } for segment in range(segments)]
+
+
+MODALITIES = [
+    Modality('image', ('jpg',), lambda item: item.gcs_uri, embed),
+    Modality('video', ('mp4',), lambda item: item.gcs_uri, embed),
+]
+
+
+def run_pipeline(client, model, index, workers, manifest_path, profile=None):
+    # No rate limit: this measures the pipeline itself
+    config = PipelineConfig(load_workers=4, embed_workers=workers, manifest_path=manifest_path, progress_interval_sec=5,
+                            initial_rate=1e6, max_rate=1e6, profile=profile)
+    run_ingestion(client, model, index, 'bucket', 'folder', MODALITIES, config)
+
+
+def run_legacy(client, model, index, workers):
+    """The former processors: list everything, then submit every file up front."""
+    class Item:
+        def __init__(self, blob, modality):
+            self.blob, self.modality, self.bucket_name = blob, modality, 'bucket'
+            self.gcs_uri = f'gs://bucket/{blob.name}'
+            self.file_name = blob.name.replace('folder/', '')
+            self.content = self.gcs_uri
+
+    blobs = list(client.list_blobs('bucket', prefix='folder'))
+    with UpsertBuffer(index) as upsert_buffer:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(lambda blob: upsert_buffer.add(embed(model, Item(blob, MODALITIES[blob.name.endswith('mp4')]))), blob)
+                       for blob in blobs]
+            for future in as_completed(futures):
+                future.result()
+
+
+def main(mode, files, workers, page_latency_ms, embed_latency_ms, upsert_latency_ms, profile=None):
+    client = FakeStorageClient(files, page_latency_ms)
+    model = FakeModel(embed_latency_ms)
+    index = FakeIndex(upsert_latency_ms)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    if mode == 'pipeline':
+        with tempfile.TemporaryDirectory() as directory:
+            run_pipeline(client, model, index, workers, os.path.join(directory, 'manifest.jsonl'), profile)
+    else:
+        run_legacy(client, model, index, workers)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(json.dumps({
+        'mode': mode,
+        'files': files,
+        'vectors': index.vectors,
+        'seconds': round(elapsed, 2),
+        'files_per_sec': round(files / elapsed, 1),
+        'first_upsert_sec': round(index.first_upsert_at - start, 2) if index.first_upsert_at else None,
+        'peak_traced_mb': round(peak / 1024 / 1024, 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the streaming ingestion pipeline against fake storage, model and index.')
+    parser.add_argument('--mode', choices=['pipeline', 'legacy'], default='pipeline', help='Ingestion implementation to run.')
+    parser.add_argument('--files', type=int, default=20000, help='Number of files in the fake bucket (one in ten is a video).')
+    parser.add_argument('--workers', type=int, default=32, help='Embedding threads.')
+    parser.add_argument('--page-latency-ms', type=float, default=100.0, help='Fake latency of listing one page of 1000 files.')
+    parser.add_argument('--embed-latency-ms', type=float, default=20.0, help='Fake embedding latency per file.')
+    parser.add_argument('--upsert-latency-ms', type=float, default=40.0, help='Fake latency per upsert request.')
+    parser.add_argument('--profile', type=str, help='Write the pipeline profile to PROFILE.json and PROFILE.csv (pipeline mode only).')
+
+    args = parser.parse_args()
+    main(args.mode, args.files, args.workers, args.page_latency_ms, args.embed_latency_ms, args.upsert_latency_ms, args.profile)
@@ -0,0 +1,202 @@
+"""
+Load test harness.
+
+Starts the fake Vertex endpoint, the fake Pinecone data plane (seeded with a synthetic catalog)
+and the API, each in its own process, with the API using the real Pinecone client against the
+fake index. Then drives `/api/search/text`, `/api/search/image` and `/api/search/video` at each
+concurrency level, and runs the ingestion pipeline end to end against a fake bucket, the fake
+Vertex endpoint and the fake index. Writes the results as JSON, tagged with the current commit,
+so runs can be compared with `benchmarks.compare`:
+
+    python -m benchmarks.load_test --concurrency 1,10,50 --requests 200 --output results.json
+
+Every request sends distinct content and the embedding caches are disabled (unless `--cache`),
+so each search embeds and queries.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from benchmarks import app_under_test, fake_pinecone, fake_vertex  # noqa: E402
+from benchmarks.common import configure_app_env, drive_requests, free_port, serve_in_process  # noqa: E402
+from benchmarks.fake_storage import FakeStorageClient  # noqa: E402
+
+SCENARIOS = ('text', 'image', 'video', 'ingest')
+VIDEO_BYTES = 2 * 1024 * 1024
+
+
+def sample_image():
+    image = Image.blend(Image.effect_noise((1600, 1200), 40).convert('RGB'),
+                        Image.linear_gradient('L').resize((1600, 1200)).convert('RGB'), 0.5)
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=90)
+    return output.getvalue()
+
+
+def request_factory(scenario):
+    """Returns `request_kwargs(i)` for a search scenario; bytes appended to the uploads make each one distinct."""
+    if scenario == 'text':
+        return lambda i: {'json': {'query': f'red summer dress {i}'}}
+    if scenario == 'image':
+        image = sample_image()
+        return lambda i: {'files': {'file': ('photo.jpg', image + str(i).encode(), 'image/jpeg')}}
+    video = os.urandom(VIDEO_BYTES)
+    return lambda i: {'files': {'file': ('clip.mp4', video + str(i).encode(), 'video/mp4')}}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class VertexModel:
+    """
+    Minimal stand-in for `MultiModalEmbeddingModel` that calls a Vertex predict endpoint over
+    HTTP, returning objects shaped like the SDK's embeddings response.
+    """
+
+    def __init__(self, vertex_url):
+        self.url = f'{vertex_url}/v1/projects/benchmark/locations/local/publishers/google/models/multimodalembedding@001:predict'
+        self.client = httpx.Client(timeout=60, limits=httpx.Limits(max_connections=64, max_keepalive_connections=64))
+
+    def get_embeddings(self, image=None, video=None, video_segment_config=None):
+        content_type = 'image' if image is not None else 'video'
+        instance = {content_type: {'bytesBase64Encoded': image if image is not None else video}}
+        response = self.client.post(self.url, json={'instances': [instance]})
+        response.raise_for_status()
+        prediction = response.json()['predictions'][0]
+        if content_type == 'image':
+            return type('ImageEmbeddings', (), {'image_embedding': prediction['imageEmbedding']})
+        segments = [type('VideoEmbedding', (), {
+            'embedding': segment['embedding'],
+            'start_offset_sec': segment['startOffsetSec'],
+            'end_offset_sec': segment['endOffsetSec'],
+        }) for segment in prediction['videoEmbeddings']]
+        return type('VideoEmbeddings', (), {'video_embeddings': segments})
+
+
+def run_ingest(vertex_url, pinecone_url, files, embed_workers):
+    """Ingests a fake bucket through the ingestion pipeline, the fake Vertex endpoint and the real Pinecone client."""
+    from pinecone import Pinecone
+    from ingest_manifest import vector_id
+    from pipeline import Modality, PipelineConfig, run_ingestion
+
+    def embed_image(model, item):
+        embeddings = model.get_embeddings(image=item.content)
+        return [{'id': vector_id(item.bucket_name, item.blob.name), 'values': embeddings.image_embedding,
+                 'metadata': {'file_type': 'image', 'gcs_file_path': 'bucket/folder/', 'gcs_file_name': item.file_name}}]
+
+    def embed_video(model, item):
+        embeddings = model.get_embeddings(video=item.content)
+        return [{'id': vector_id(item.bucket_name, item.blob.name, segment.start_offset_sec), 'values': segment.embedding,
+                 'metadata': {'file_type': 'video', 'gcs_file_path': 'bucket/folder/', 'gcs_file_name': item.file_name,
+                              'start_offset_sec': segment.start_offset_sec, 'end_offset_sec': segment.end_offset_sec}}
+                for segment in embeddings.video_embeddings]
+
+    modalities = [
+        Modality('image', ('jpg',), lambda item: item.gcs_uri, embed_image),
+        Modality('video', ('mp4',), lambda item: item.gcs_uri, embed_video),
+    ]
+    index = Pinecone(api_key='benchmark-key').Index(host=pinecone_url)
+    before = index.describe_index_stats()['total_vector_count']
+
+    with tempfile.TemporaryDirectory() as directory:
+        config = PipelineConfig(embed_workers=embed_workers, progress_interval_sec=30, initial_rate=1e6, max_rate=1e6,
+                                manifest_path=os.path.join(directory, 'manifest.jsonl'),
+                                dead_letter_path=os.path.join(directory, 'dead-letter.jsonl'))
+        start = time.perf_counter()
+        pipeline = run_ingestion(FakeStorageClient(files), VertexModel(vertex_url), index, 'bucket', 'folder', modalities, config)
+        elapsed = time.perf_counter() - start
+
+    vectors = index.describe_index_stats()['total_vector_count'] - before
+    return {
+        'scenario': 'ingest',
+        'files': files,
+        'vectors': vectors,
+        'failed': sum(stage.failed for stage in pipeline.stages),
+        'seconds': round(elapsed, 2),
+        'files_per_sec': round(files / elapsed, 1),
+        'vectors_per_sec': round(vectors / elapsed, 1),
+    }
+
+
+def main(args):
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(',')]
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    vertex_port, pinecone_port, api_port = free_port(), free_port(), free_port()
+    vertex_url, pinecone_url = f'http://127.0.0.1:{vertex_port}', f'http://127.0.0.1:{pinecone_port}'
+    serve_in_process(fake_vertex.create_app, vertex_port, args.vertex_latency_ms, 0.0, 0.0, 1, args.error_rate)
+    serve_in_process(fake_pinecone.create_app, pinecone_port, args.pinecone_latency_ms, args.error_rate, args.seed_vectors)
+
+    overrides = {} if args.cache else {'TEXT_CACHE_MAX_SIZE': 0, 'UPLOAD_CACHE_MAX_BYTES': 0}
+    configure_app_env(vertex_url, pinecone_url, **overrides)
+    serve_in_process(app_under_test.create_app, api_port, 0.0, False)
+
+    results = []
+    for scenario in scenarios:
+        if scenario == 'ingest':
+            continue
+        url = f'http://127.0.0.1:{api_port}/api/search/{scenario}'
+        request_kwargs = request_factory(scenario)
+        # Warm up connections and lazily initialized clients
+        asyncio.run(drive_requests(url, 2, 4, request_kwargs))
+        for concurrency in levels:
+            total = max(args.requests, concurrency)
+            result = asyncio.run(drive_requests(url, concurrency, total, request_kwargs))
+            result.update({'scenario': scenario, 'concurrency': concurrency})
+            print(json.dumps(result))
+            results.append(result)
+
+    if 'ingest' in scenarios:
+        result = run_ingest(vertex_url, pinecone_url, args.ingest_files, args.ingest_workers)
+        print(json.dumps(result))
+        results.append(result)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {key: value for key, value in vars(args).items() if key != 'output'},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test the API and the ingestion pipeline against local fakes.')
+    parser.add_argument('--scenarios', type=str, default=','.join(SCENARIOS), help='Comma-separated scenarios: text, image, video, ingest.')
+    parser.add_argument('--concurrency', type=str, default='1,10,50', help='Comma-separated concurrency levels for the searches.')
+    parser.add_argument('--requests', type=int, default=200, help='Searches per scenario and concurrency level.')
+    parser.add_argument('--vertex-latency-ms', type=float, default=150.0, help='Fake Vertex predict latency.')
+    parser.add_argument('--pinecone-latency-ms', type=float, default=30.0, help='Fake Pinecone latency per request.')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake Vertex and Pinecone requests failed with a 503.')
+    parser.add_argument('--seed-vectors', type=int, default=10000, help='Synthetic catalog size of the fake index.')
+    parser.add_argument('--ingest-files', type=int, default=2000, help='Files in the fake bucket for the ingest scenario.')
+    parser.add_argument('--ingest-workers', type=int, default=16, help='Embedding threads for the ingest scenario.')
+    parser.add_argument('--cache', action='store_true', help='Keep the embedding caches enabled.')
+    parser.add_argument('--output', type=str, help='File to write the JSON results to (default: print them).')
+
+    main(parser.parse_args())
@@ -0,0 +1,88 @@
+"""
+Local replica search benchmark.
+
+Writes a synthetic replica snapshot of `--vectors` random 1408-dimension vectors with the
+ingestion scripts' snapshot writer, once as float32 and once as int8, then serves queries from
+each through the API's `ReplicaIndex`. Reports the snapshot size, the query latency percentiles
+and, for int8, the recall of the top-k against the exact float32 results:
+
+    python -m benchmarks.replica_search --vectors 300000 --queries 200 --top-k 20
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from benchmarks.common import summarize_latencies  # noqa: E402
+from replica_snapshot import SnapshotWriter, namespace_dir  # noqa: E402
+
+DIMENSION = 1408
+
+
+class UnusedIndex:
+    def query(self, **kwargs):
+        raise AssertionError("The benchmark query fell back to Pinecone")
+
+
+def write_snapshot(directory, vectors, dtype, chunk=10000):
+    with SnapshotWriter(namespace_dir(directory, ''), DIMENSION, dtype) as writer:
+        for start in range(0, len(vectors), chunk):
+            for i, values in enumerate(vectors[start:start + chunk], start):
+                writer.add(f'vec-{i}', values, {'file_type': 'image', 'gcs_file_path': 'catalog/products/', 'gcs_file_name': f'{i}.jpg'})
+    return writer.path
+
+
+def main(count, queries, top_k, block_rows):
+    from api.replica import ReplicaIndex
+
+    rng = np.random.default_rng(0)
+    # Clustered vectors, closer to real embeddings than uniform noise
+    centers = rng.standard_normal((256, DIMENSION)).astype(np.float32)
+    vectors = centers[rng.integers(0, 256, count)] + 0.5 * rng.standard_normal((count, DIMENSION)).astype(np.float32)
+    query_vectors = centers[rng.integers(0, 256, queries)] + 0.5 * rng.standard_normal((queries, DIMENSION)).astype(np.float32)
+
+    report = {'vectors': count, 'dimension': DIMENSION, 'top_k': top_k, 'block_rows': block_rows}
+    exact = None
+    with tempfile.TemporaryDirectory() as directory:
+        for dtype in ('float32', 'int8'):
+            replica_dir = os.path.join(directory, dtype)
+            start = time.perf_counter()
+            path = write_snapshot(replica_dir, vectors, dtype)
+            write_sec = time.perf_counter() - start
+            size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+            replica = ReplicaIndex(UnusedIndex(), replica_dir, max_age_sec=0, refresh_interval_sec=0, block_rows=block_rows)
+            replica.query(vector=query_vectors[0].tolist(), top_k=top_k, include_metadata=True)
+            latencies, results = [], []
+            for query in query_vectors:
+                values = query.tolist()
+                started = time.perf_counter()
+                response = replica.query(vector=values, top_k=top_k, include_metadata=True)
+                latencies.append(time.perf_counter() - started)
+                results.append([match['id'] for match in response['matches']])
+
+            entry = {'snapshot_mb': round(size / 1024 / 1024, 1), 'write_sec': round(write_sec, 1), **summarize_latencies(latencies, sum(latencies))}
+            if exact is None:
+                exact = results
+            else:
+                entry['recall'] = round(float(np.mean([len(set(a) & set(b)) / top_k for a, b in zip(exact, results)])), 4)
+            report[dtype] = entry
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark searching a local replica snapshot.')
+    parser.add_argument('--vectors', type=int, default=300000, help='Vectors in the synthetic snapshot.')
+    parser.add_argument('--queries', type=int, default=200, help='Queries per snapshot dtype.')
+    parser.add_argument('--top-k', type=int, default=20, help='Results per query.')
+    parser.add_argument('--block-rows', type=int, default=2048, help='Rows scanned per block.')
+    args = parser.parse_args()
+    main(args.vectors, args.queries, args.top_k, args.block_rows)
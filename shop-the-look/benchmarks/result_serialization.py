@@ -0,0 +1,99 @@
+"""
+Search result serialization micro-benchmark.
+
+Formats and serializes one search response of `--top-k` Pinecone matches (one in ten a video
+segment) the way the search routers used to, by building the full metadata dict per match and
+returning it through FastAPI's default JSON path, and with the shared `ResultFormatter` and
+`SearchResponse` in its full, projected and compact modes. Reports the time per response and the
+body size:
+
+    python -m benchmarks.result_serialization --top-k 100
+"""
+
+import argparse
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pinecone.core.client.model.scored_vector import ScoredVector
+
+from benchmarks.common import configure_app_env
+
+
+def sample_matches(top_k):
+    matches = []
+    for i in range(top_k):
+        metadata = {'file_type': 'image', 'gcs_file_path': 'shop-the-look-catalog/products/', 'gcs_file_name': f'product-{i:05d}.jpg'}
+        if i % 10 == 0:
+            metadata = {'file_type': 'video', 'gcs_file_path': 'shop-the-look-catalog/videos/', 'gcs_file_name': f'clip-{i:05d}.mp4',
+                        'segment': 2, 'start_offset_sec': 30, 'end_offset_sec': 45, 'interval_sec': 15}
+        matches.append(ScoredVector(id=f'vec-{i}', score=0.9 - i / 1000, values=[], metadata=metadata))
+    return matches
+
+
+def legacy_body(matches):
+    """The former per-router formatting, serialized like FastAPI does for a returned dict."""
+    results = [{
+        "score": match['score'],
+        "metadata": {
+            "gcs_file_name": match['metadata'].get('gcs_file_name'),
+            "gcs_file_path": match['metadata'].get('gcs_file_path'),
+            "gcs_public_url": f"https://storage.googleapis.com/{match['metadata'].get('gcs_file_path')}{match['metadata'].get('gcs_file_name')}",
+            "file_type": match['metadata'].get('file_type'),
+            "segment": match['metadata'].get('segment'),
+            "start_offset_sec": match['metadata'].get('start_offset_sec'),
+            "end_offset_sec": match['metadata'].get('end_offset_sec'),
+            "interval_sec": match['metadata'].get('interval_sec'),
+        }
+    } for match in matches]
+    return JSONResponse(jsonable_encoder({"results": results})).body
+
+
+def measure(render, iterations):
+    body = render()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        render()
+    elapsed = time.perf_counter() - start
+    return {'us_per_response': round(elapsed / iterations * 1e6, 1), 'bytes': len(body)}
+
+
+def main(top_k, iterations):
+    configure_app_env('http://127.0.0.1:1')
+    from api import results
+    from api.results import ResultFormatter, SearchResponse
+
+    matches = sample_matches(top_k)
+
+    def render(fields=None, compact=False):
+        formatter = ResultFormatter.from_params(fields, compact)
+        return lambda: SearchResponse(formatter.response_body("results", formatter.format_matches(matches))).body
+
+    variants = {
+        'legacy': lambda: legacy_body(matches),
+        'formatter': render(),
+        'formatter_compact': render(compact=True),
+        'formatter_fields': render('gcs_public_url,file_type,start_offset_sec'),
+    }
+    report = {'top_k': top_k, 'orjson': results.orjson is not None}
+    for name, variant in variants.items():
+        report[name] = measure(variant, iterations)
+
+    if results.orjson is not None:
+        # The fallback encoder, for deployments without orjson
+        orjson, results.orjson = results.orjson, None
+        try:
+            report['formatter_stdlib_json'] = measure(render(), iterations)
+        finally:
+            results.orjson = orjson
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark formatting and serializing search results.')
+    parser.add_argument('--top-k', type=int, default=100, help='Matches per response.')
+    parser.add_argument('--iterations', type=int, default=2000, help='Responses rendered per variant.')
+    args = parser.parse_args()
+    main(args.top_k, args.iterations)
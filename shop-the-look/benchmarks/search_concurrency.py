@@ -0,0 +1,52 @@
+"""
+Concurrent search throughput benchmark.
+
+Runs the API against the fake Vertex endpoint and an in-process fake Pinecone index whose
+`query` blocks like a real network call, then fires `--requests` text searches at the given
+concurrency and reports throughput and latency percentiles:
+
+    python -m benchmarks.search_concurrency --concurrency 50 --requests 500 --vertex-latency-ms 200
+"""
+
+import argparse
+import asyncio
+import json
+
+from benchmarks import app_under_test, fake_vertex
+from benchmarks.common import configure_app_env, drive_requests, free_port, serve_in_process, serve_in_thread
+
+
+def text_query(distinct_queries):
+    return lambda i: {'json': {'query': f'red dress {i % distinct_queries}'}}
+
+
+def main(concurrency, total, vertex_latency_ms, pinecone_latency_ms, distinct_queries):
+    vertex_port = free_port()
+    serve_in_process(fake_vertex.create_app, vertex_port, vertex_latency_ms)
+    configure_app_env(f'http://127.0.0.1:{vertex_port}')
+
+    app = app_under_test.create_app(pinecone_latency_ms)
+    api_port = free_port()
+    serve_in_thread(app, api_port)
+
+    url = f'http://127.0.0.1:{api_port}/api/search/text'
+    result = asyncio.run(drive_requests(url, concurrency, total, text_query(distinct_queries)))
+    result.update({
+        'concurrency': concurrency,
+        'vertex_latency_ms': vertex_latency_ms,
+        'pinecone_latency_ms': pinecone_latency_ms,
+        'distinct_queries': distinct_queries,
+    })
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark concurrent text searches against local fakes.')
+    parser.add_argument('--concurrency', type=int, default=50, help='Number of concurrent clients.')
+    parser.add_argument('--requests', type=int, default=500, help='Total number of searches.')
+    parser.add_argument('--vertex-latency-ms', type=float, default=200.0, help='Fake Vertex predict latency.')
+    parser.add_argument('--pinecone-latency-ms', type=float, default=30.0, help='Fake Pinecone query latency.')
+    parser.add_argument('--distinct-queries', type=int, default=1000000, help='Number of distinct query strings to cycle through.')
+
+    args = parser.parse_args()
+    main(args.concurrency, args.requests, args.vertex_latency_ms, args.pinecone_latency_ms, args.distinct_queries)
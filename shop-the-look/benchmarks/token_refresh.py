@@ -0,0 +1,108 @@
+"""
+Access token refresh load test.
+
+Runs concurrent callers asking for an access token across several expiries of short-lived fake
+credentials, whose refresh blocks like the real token exchange. Reports the latency of getting a
+token, the worst event loop stall (measured by a ticker task) and how many refreshes were made:
+
+    python -m benchmarks.token_refresh --callers 50 --duration-sec 12 --lifetime-sec 4
+
+`--mode legacy` runs the same load against the previous synchronous, lock-free implementation.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+from benchmarks.common import configure_app_env, summarize_latencies
+from benchmarks.fake_credentials import FakeCredentials
+
+
+class LegacyTokenSource:
+    """The former `Settings.get_access_token`: synchronous, no lock, fixed lifetime."""
+
+    def __init__(self, credentials, lifetime_sec):
+        self.credentials = credentials
+        self.lifetime = timedelta(seconds=lifetime_sec)
+        self.access_token = None
+        self.token_expiry = None
+
+    async def get_token(self):
+        if self.access_token and self.token_expiry and datetime.now() < self.token_expiry:
+            return self.access_token
+        self.credentials.refresh(None)
+        self.access_token = self.credentials.token
+        self.token_expiry = datetime.now() + self.lifetime
+        return self.access_token
+
+
+async def measure_loop_lag(stop, interval_sec=0.01):
+    """Returns the worst delay of a periodic timer, i.e. the longest the event loop was blocked."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval_sec)
+        worst = max(worst, time.perf_counter() - start - interval_sec)
+    return worst
+
+
+async def run(mode, callers, duration_sec, lifetime_sec, refresh_latency_ms, margin_sec):
+    credentials = FakeCredentials(lifetime_sec=lifetime_sec, refresh_latency_ms=refresh_latency_ms)
+    if mode == 'manager':
+        from api.auth import TokenManager
+        source = TokenManager(lambda: credentials, refresh_margin_sec=margin_sec)
+        source.start()
+    else:
+        source = LegacyTokenSource(credentials, lifetime_sec)
+
+    # The first token is fetched before the load starts, as the app would do at startup
+    await source.get_token()
+
+    latencies = []
+    stop = asyncio.Event()
+
+    async def caller():
+        while not stop.is_set():
+            start = time.perf_counter()
+            await source.get_token()
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.005)
+
+    lag_task = asyncio.ensure_future(measure_loop_lag(stop))
+    tasks = [asyncio.ensure_future(caller()) for _ in range(callers)]
+    start = time.perf_counter()
+    await asyncio.sleep(duration_sec)
+    stop.set()
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    worst_lag = await lag_task
+    if mode == 'manager':
+        await source.stop()
+
+    summary = summarize_latencies(latencies, elapsed)
+    summary.update({
+        'mode': mode,
+        'callers': callers,
+        'token_lifetime_sec': lifetime_sec,
+        'refresh_latency_ms': refresh_latency_ms,
+        'refresh_calls': credentials.refresh_calls,
+        'max_event_loop_stall_ms': round(worst_lag * 1000, 2),
+    })
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test access token refresh across token expiries.')
+    parser.add_argument('--mode', choices=['manager', 'legacy'], default='manager', help='Token source to test.')
+    parser.add_argument('--callers', type=int, default=50, help='Concurrent callers.')
+    parser.add_argument('--duration-sec', type=float, default=12.0, help='Length of the test.')
+    parser.add_argument('--lifetime-sec', type=float, default=4.0, help='Lifetime of each fake token.')
+    parser.add_argument('--refresh-latency-ms', type=float, default=300.0, help='Blocking latency of a refresh.')
+    parser.add_argument('--margin-sec', type=float, default=1.0, help='TokenManager refresh margin.')
+
+    args = parser.parse_args()
+    configure_app_env('http://127.0.0.1:1')
+    result = asyncio.run(run(args.mode, args.callers, args.duration_sec, args.lifetime_sec, args.refresh_latency_ms, args.margin_sec))
+    print(json.dumps(result, indent=2))
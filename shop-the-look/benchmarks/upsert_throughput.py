@@ -0,0 +1,93 @@
+"""
+Ingestion upsert throughput benchmark.
+
+Compares the old one-upsert-per-vector pattern with the batched `UpsertBuffer` used by the
+ingestion scripts, against a fake index whose upsert costs a fixed round-trip plus a small
+per-vector cost:
+
+    python -m benchmarks.upsert_throughput --vectors 2000 --round-trip-ms 40
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from upsert_buffer import UpsertBuffer  # noqa: E402
+
+DIMENSION = 1408
+
+
+class FakeIndex:
+    """Stand-in for `pinecone.Index` with a round-trip latency per upsert request."""
+
+    def __init__(self, round_trip_ms, per_vector_ms):
+        self.round_trip_sec = round_trip_ms / 1000
+        self.per_vector_sec = per_vector_ms / 1000
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors):
+        time.sleep(self.round_trip_sec + self.per_vector_sec * len(vectors))
+        with self._lock:
+            self.requests += 1
+
+
+def make_vector(i):
+    return {
+        'id': f'vector-{i}',
+        'values': [0.001 * (i % 1000)] * DIMENSION,
+        'metadata': {'file_type': 'image', 'gcs_file_path': 'bucket/folder/', 'gcs_file_name': f'{i}.jpg'},
+    }
+
+
+def run_unbatched(index, vectors, workers):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda vector: index.upsert([vector]), vectors))
+    return time.perf_counter() - start
+
+
+def run_batched(index, vectors, workers, batch_size, upsert_workers):
+    start = time.perf_counter()
+    with UpsertBuffer(index, batch_size=batch_size, max_workers=upsert_workers) as buffer:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda vector: buffer.add([vector]), vectors))
+    return time.perf_counter() - start
+
+
+def main(total, workers, round_trip_ms, per_vector_ms, batch_size, upsert_workers):
+    vectors = [make_vector(i) for i in range(total)]
+    results = {}
+
+    index = FakeIndex(round_trip_ms, per_vector_ms)
+    elapsed = run_unbatched(index, vectors, workers)
+    results['unbatched'] = {'vectors_per_sec': round(total / elapsed, 1), 'requests': index.requests, 'seconds': round(elapsed, 2)}
+
+    index = FakeIndex(round_trip_ms, per_vector_ms)
+    elapsed = run_batched(index, vectors, workers, batch_size, upsert_workers)
+    results['batched'] = {'vectors_per_sec': round(total / elapsed, 1), 'requests': index.requests, 'seconds': round(elapsed, 2)}
+
+    results['config'] = {
+        'vectors': total, 'workers': workers, 'round_trip_ms': round_trip_ms, 'per_vector_ms': per_vector_ms,
+        'batch_size': batch_size, 'upsert_workers': upsert_workers,
+    }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark batched vs. per-vector upserts against a fake index.')
+    parser.add_argument('--vectors', type=int, default=2000, help='Number of vectors to upsert.')
+    parser.add_argument('--workers', type=int, default=8, help='Producer threads (the ingestion worker pool).')
+    parser.add_argument('--round-trip-ms', type=float, default=40.0, help='Fake latency per upsert request.')
+    parser.add_argument('--per-vector-ms', type=float, default=0.2, help='Fake additional latency per vector.')
+    parser.add_argument('--batch-size', type=int, default=100, help='UpsertBuffer batch size.')
+    parser.add_argument('--upsert-workers', type=int, default=4, help='UpsertBuffer concurrent upserts.')
+
+    args = parser.parse_args()
+    main(args.vectors, args.workers, args.round_trip_ms, args.per_vector_ms, args.batch_size, args.upsert_workers)
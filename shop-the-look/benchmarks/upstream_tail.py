@@ -0,0 +1,116 @@
+"""
+Upstream tail latency benchmark.
+
+Runs the API against the fake Vertex endpoint and the fake Pinecone data plane (through the real
+Pinecone client), both of which slow down a fraction `--tail-rate` of their calls by `--tail-ms`,
+and sends `--requests` text searches from `--concurrency` clients. Reports the latency of every
+response (successful or not) and the status codes, for each mode:
+
+- `none`: no deadline and no hedging, as before
+- `deadline`: a `--deadline-sec` budget per search, so a stalled call fails the search with a 504
+- `hedged`: the deadline, and hedged Vertex AI and Pinecone calls
+
+    python -m benchmarks.upstream_tail --requests 1000 --tail-rate 0.02 --tail-ms 5000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+
+import httpx
+
+from benchmarks import app_under_test, fake_pinecone, fake_vertex
+from benchmarks.common import configure_app_env, free_port, percentile, serve_in_process
+
+MODES = ('none', 'deadline', 'hedged')
+
+
+async def drive(url, concurrency, total):
+    latencies = []
+    statuses = Counter()
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker(client):
+        while not queue.empty():
+            i = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, json={'query': f'linen shirt {i}'})
+                statuses[response.status_code] += 1
+            except httpx.HTTPError:
+                statuses['client_error'] += 1
+            latencies.append(time.perf_counter() - start)
+
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=concurrency), timeout=120) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return latencies, statuses
+
+
+def run(mode, vertex_port, pinecone_port, concurrency, total, deadline_sec):
+    overrides = {
+        # Every search embeds and queries, and is admitted straight away
+        'TEXT_CACHE_MAX_SIZE': 0,
+        'ADMISSION_TEXT_CONCURRENCY': 0,
+        'SLOW_REQUEST_MS': 0,
+        'LOG_LEVEL': 'ERROR',
+        'SEARCH_DEADLINE_TEXT_SEC': deadline_sec if mode != 'none' else 0,
+        'VERTEX_TIMEOUT_SEC': 60,
+        'PINECONE_TIMEOUT_SEC': 60,
+        'HEDGE_VERTEX': str(mode == 'hedged').lower(),
+        'HEDGE_PINECONE': str(mode == 'hedged').lower(),
+    }
+    configure_app_env(f'http://127.0.0.1:{vertex_port}', f'http://127.0.0.1:{pinecone_port}', **overrides)
+    api_port = free_port()
+    process = serve_in_process(app_under_test.create_app, api_port, 0.0, False)
+    try:
+        url = f'http://127.0.0.1:{api_port}/api/search/text'
+        # Enough calls for the hedging delay to be known
+        asyncio.run(drive(url, concurrency, 50))
+        latencies, statuses = asyncio.run(drive(url, concurrency, total))
+    finally:
+        process.terminate()
+        process.join()
+
+    return {
+        'mode': mode,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'p999_ms': round(percentile(latencies, 99.9) * 1000, 1),
+        'max_ms': round(max(latencies) * 1000, 1),
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+def main(modes, concurrency, total, vertex_latency_ms, pinecone_latency_ms, tail_rate, tail_ms, deadline_sec):
+    vertex_port = free_port()
+    serve_in_process(fake_vertex.create_app, vertex_port, vertex_latency_ms, 0.0, 0.0, 1, 0.0, tail_rate, tail_ms)
+    pinecone_port = free_port()
+    serve_in_process(fake_pinecone.create_app, pinecone_port, pinecone_latency_ms, 0.0, 1000, tail_rate, tail_ms)
+
+    report = {'requests': total, 'concurrency': concurrency, 'tail_rate': tail_rate, 'tail_ms': tail_ms, 'runs': []}
+    for mode in modes:
+        report['runs'].append(run(mode, vertex_port, pinecone_port, concurrency, total, deadline_sec))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark text search tail latency against slow upstream calls.')
+    parser.add_argument('--modes', type=str, default=','.join(MODES), help='Comma-separated modes to run: none, deadline, hedged.')
+    parser.add_argument('--requests', type=int, default=1000, help='Text searches per mode.')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients.')
+    parser.add_argument('--vertex-latency-ms', type=float, default=100.0, help='Fake Vertex predict latency.')
+    parser.add_argument('--pinecone-latency-ms', type=float, default=20.0, help='Fake Pinecone latency.')
+    parser.add_argument('--tail-rate', type=float, default=0.02, help='Fraction of upstream calls slowed down.')
+    parser.add_argument('--tail-ms', type=float, default=5000.0, help='Extra latency of the slowed calls.')
+    parser.add_argument('--deadline-sec', type=float, default=2.0, help='Text search deadline of the deadline and hedged modes.')
+
+    args = parser.parse_args()
+    modes = [mode for mode in args.modes.split(',') if mode in MODES]
+    os.environ.setdefault('WARMUP', 'false')
+    main(modes, args.concurrency, args.requests, args.vertex_latency_ms, args.pinecone_latency_ms,
+         args.tail_rate, args.tail_ms, args.deadline_sec)
@@ -0,0 +1,105 @@
+"""
+Embedding quota benchmark.
+
+Runs the embedding stage of the ingestion pipeline against the fake Vertex endpoint with a
+quota that rejects requests beyond `--quota-rps` with 429s and a Retry-After, and with a few
+corrupt files that are rejected with a 400. Reports the goodput relative to the quota, how many
+requests were throttled, and how many files failed:
+
+    python -m benchmarks.vertex_quota --files 3000 --quota-rps 100 --workers 32
+
+`--mode legacy` runs the same load with the previous retry loop: no rate limiting, every error
+retried with `5 ** attempt` seconds of backoff, up to 5 attempts. `--mode unlimited` keeps the
+new error handling and backoff but disables the rate limiter.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from benchmarks import fake_vertex  # noqa: E402
+from benchmarks.common import free_port, serve_in_process  # noqa: E402
+from pipeline import DeadLetterFile, Pipeline, Stage  # noqa: E402
+from rate_limiter import AdaptiveRateLimiter  # noqa: E402
+
+PREDICT_PATH = '/v1/projects/benchmark/locations/us-central1/publishers/google/models/multimodalembedding@001:predict'
+
+
+class LegacyStage(Stage):
+    """The retry loop of the former processors."""
+
+    def process(self, item):
+        for attempt in range(5):
+            try:
+                return self.fn(item)
+            except Exception:
+                if attempt < 4:
+                    self.retries += 1
+                    time.sleep(5 ** (attempt + 1))
+                else:
+                    raise
+
+
+def main(mode, files, workers, quota_rps, latency_ms, corrupt_every, max_rate):
+    vertex_port = free_port()
+    serve_in_process(fake_vertex.create_app, vertex_port, latency_ms, 0.0, quota_rps)
+    client = httpx.Client(base_url=f'http://127.0.0.1:{vertex_port}', timeout=30,
+                          limits=httpx.Limits(max_connections=workers, max_keepalive_connections=workers))
+
+    def embed(name):
+        response = client.post(PREDICT_PATH, json={'instances': [{'image': {'bytesBase64Encoded': name}}]})
+        response.raise_for_status()
+        return name
+
+    names = [f'corrupt-{i}.jpg' if corrupt_every and i % corrupt_every == 0 else f'{i}.jpg' for i in range(1, files + 1)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        dead_letter = DeadLetterFile(os.path.join(directory, 'dead-letter.jsonl'))
+        if mode == 'legacy':
+            stage = LegacyStage('embed', embed, workers)
+        else:
+            limiter = AdaptiveRateLimiter(max_rate=max_rate) if mode == 'adaptive' else None
+            stage = Stage('embed', embed, workers, max_retries=8, limiter=limiter, dead_letter=dead_letter)
+
+        start = time.perf_counter()
+        Pipeline(names, [stage], progress_interval_sec=5).run()
+        elapsed = time.perf_counter() - start
+        dead_letter.close()
+
+    upstream = client.get('/stats').json()
+    client.close()
+    print(json.dumps({
+        'mode': mode,
+        'files': files,
+        'succeeded': stage.processed,
+        'failed': stage.failed,
+        'dead_lettered': dead_letter.count,
+        'seconds': round(elapsed, 2),
+        'goodput_rps': round(stage.processed / elapsed, 1),
+        'quota_rps': quota_rps,
+        'quota_utilization': round(stage.processed / elapsed / quota_rps, 3),
+        'throttled_requests': upstream['throttled'],
+        'retries': stage.retries,
+        'final_rate': round(stage.limiter.rate, 1) if stage.limiter else None,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark embedding calls against a fake Vertex endpoint with a quota.')
+    parser.add_argument('--mode', choices=['adaptive', 'unlimited', 'legacy'], default='adaptive', help='Retry and rate limiting strategy.')
+    parser.add_argument('--files', type=int, default=3000, help='Number of files to embed.')
+    parser.add_argument('--workers', type=int, default=32, help='Embedding threads.')
+    parser.add_argument('--quota-rps', type=float, default=100.0, help='Requests per second the fake endpoint accepts.')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Fake Vertex predict latency.')
+    parser.add_argument('--corrupt-every', type=int, default=500, help='Make every n-th file corrupt (0 for none).')
+    parser.add_argument('--max-rate', type=float, default=200.0, help='Rate limiter ceiling.')
+
+    args = parser.parse_args()
+    main(args.mode, args.files, args.workers, args.quota_rps, args.latency_ms, args.corrupt_every, args.max_rate)
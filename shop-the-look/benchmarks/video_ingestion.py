@@ -0,0 +1,134 @@
+"""
+Full-length video ingestion benchmark.
+
+Ingests a fake bucket of `--videos` videos of `--duration-sec` seconds with the streaming
+ingestion pipeline, either embedding only their first two minutes in one request per video
+(`--mode first-window`, the former behavior) or splitting every video into windows that are
+embedded concurrently (`--mode full-length`). The fake model takes a fixed latency per request
+plus a latency per segment. Reports the wall-clock time, the vectors upserted and the share of
+the video duration they cover, and checks that the stitched segments of every video are
+contiguous:
+
+    python -m benchmarks.video_ingestion --videos 20 --duration-sec 600 --workers 1,4,16
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+
+from benchmarks.fake_storage import FakeBlob  # noqa: E402
+from ingest_manifest import vector_id  # noqa: E402
+from pipeline import Modality, PipelineConfig, run_ingestion  # noqa: E402
+from video_windows import MAX_WINDOW_SEC, plan_windows  # noqa: E402
+
+DIMENSION = 1408
+INTERVAL_SEC = 15
+
+
+class FakeVideoStorage:
+    def __init__(self, videos):
+        self.videos = videos
+
+    def list_blobs(self, bucket_name, prefix=None, page_size=1000):
+        for i in range(self.videos):
+            yield FakeBlob(f'{prefix}/{i}.mp4')
+
+
+class FakeVideoModel:
+    """Returns one segment embedding per `interval_sec` of the requested offsets, clipped to the video."""
+
+    def __init__(self, duration_sec, request_latency_ms, segment_latency_ms):
+        self.duration_sec = duration_sec
+        self.request_latency_sec = request_latency_ms / 1000
+        self.segment_latency_sec = segment_latency_ms / 1000
+
+    def get_embeddings(self, video, start_offset_sec, end_offset_sec, interval_sec):
+        end_offset_sec = min(end_offset_sec, self.duration_sec)
+        starts = range(start_offset_sec, end_offset_sec, interval_sec)
+        time.sleep(self.request_latency_sec + self.segment_latency_sec * len(starts))
+        return [(start, min(start + interval_sec, end_offset_sec)) for start in starts]
+
+
+class FakeIndex:
+    def __init__(self):
+        self.segments = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def upsert(self, vectors):
+        with self._lock:
+            for vector in vectors:
+                metadata = vector['metadata']
+                self.segments[metadata['gcs_file_name']].append((metadata['start_offset_sec'], metadata['end_offset_sec']))
+
+    def delete(self, ids):
+        pass
+
+
+def embed(model, item):
+    start_offset_sec, end_offset_sec = item.window or (0, MAX_WINDOW_SEC)
+    segments = model.get_embeddings(item.content, start_offset_sec, end_offset_sec, INTERVAL_SEC)
+    return [{
+        'id': vector_id(item.bucket_name, item.blob.name, start),
+        'values': [0.01] * DIMENSION,
+        'metadata': {'file_type': 'video', 'gcs_file_name': item.file_name, 'segment': start // INTERVAL_SEC,
+                     'start_offset_sec': start, 'end_offset_sec': end},
+    } for start, end in segments]
+
+
+def run(mode, videos, duration_sec, window_sec, workers, request_latency_ms, segment_latency_ms):
+    split = (lambda item: plan_windows(duration_sec, window_sec, INTERVAL_SEC)) if mode == 'full-length' else None
+    modality = Modality('video', ('mp4',), lambda item: item.gcs_uri, embed, split)
+    model = FakeVideoModel(duration_sec, request_latency_ms, segment_latency_ms)
+    index = FakeIndex()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # No rate limit: this measures the pipeline itself
+        config = PipelineConfig(embed_workers=workers, manifest_path=os.path.join(directory, 'manifest.jsonl'),
+                                dead_letter_path=os.path.join(directory, 'dead-letter.jsonl'),
+                                progress_interval_sec=60, initial_rate=1e6, max_rate=1e6)
+        start = time.perf_counter()
+        run_ingestion(FakeVideoStorage(videos), model, index, 'bucket', 'folder', [modality], config)
+        elapsed = time.perf_counter() - start
+
+    covered = sum(end - start for segments in index.segments.values() for start, end in segments)
+    contiguous = all(
+        sorted(segments)[0][0] == 0 and all(a[1] == b[0] for a, b in zip(sorted(segments), sorted(segments)[1:]))
+        for segments in index.segments.values()
+    )
+    return {
+        'mode': mode,
+        'workers': workers,
+        'seconds': round(elapsed, 2),
+        'vectors': sum(len(segments) for segments in index.segments.values()),
+        'coverage': round(covered / (videos * duration_sec), 3),
+        'contiguous': contiguous,
+    }
+
+
+def main(mode, videos, duration_sec, window_sec, workers, request_latency_ms, segment_latency_ms):
+    report = {'videos': videos, 'duration_sec': duration_sec, 'window_sec': window_sec, 'runs': []}
+    for count in workers:
+        report['runs'].append(run(mode, videos, duration_sec, window_sec, count, request_latency_ms, segment_latency_ms))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark full-length video ingestion against a fake bucket, model and index.')
+    parser.add_argument('--mode', choices=['full-length', 'first-window'], default='full-length', help='Embed whole videos in windows, or only their first window.')
+    parser.add_argument('--videos', type=int, default=20, help='Number of videos in the fake bucket.')
+    parser.add_argument('--duration-sec', type=int, default=600, help='Duration of every video.')
+    parser.add_argument('--window-sec', type=int, default=MAX_WINDOW_SEC, help='Window length with --mode full-length.')
+    parser.add_argument('--workers', type=str, default='1,4,16', help='Comma-separated embedding thread counts to run with.')
+    parser.add_argument('--request-latency-ms', type=float, default=200.0, help='Fake latency per embedding request.')
+    parser.add_argument('--segment-latency-ms', type=float, default=50.0, help='Fake latency per embedded segment.')
+
+    args = parser.parse_args()
+    workers = [int(value) for value in args.workers.split(',') if value.strip()]
+    main(args.mode, args.videos, args.duration_sec, args.window_sec, workers, args.request_latency_ms, args.segment_latency_ms)
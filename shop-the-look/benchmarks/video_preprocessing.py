@@ -0,0 +1,118 @@
+"""
+Query video preprocessing benchmark.
+
+For each sample video, reports the size of the predict payload, the preprocessing time and the
+end-to-end latency of `/api/search/video` when the whole upload is sent (`original`), when it is
+trimmed to the embedded window (`trimmed`) and when it is also downscaled and re-encoded
+(`transcoded`), against the fake Vertex endpoint with a simulated upload bandwidth. Without
+`--videos`, a set of synthetic clips is generated. Requires ffmpeg:
+
+    python -m benchmarks.video_preprocessing --videos path/to/clips --upload-mbps 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import httpx
+
+from benchmarks import app_under_test, fake_vertex
+from benchmarks.common import configure_app_env, free_port, serve_in_process, serve_in_thread
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.webm', '.mkv', '.avi')
+MODES = ('original', 'trimmed', 'transcoded')
+
+
+def synthetic_videos(directory):
+    """Phone-like clips with audio: noisy test patterns compress about as badly as real footage."""
+    paths = {}
+    for name, size, duration, bitrate in [('phone-1080p-30s.mp4', '1920x1080', 30, '4M'),
+                                          ('product-720p-60s.mp4', '1280x720', 60, '2M'),
+                                          ('short-480p-10s.mp4', '854x480', 10, '1M')]:
+        path = os.path.join(directory, name)
+        subprocess.run([
+            'ffmpeg', '-v', 'error', '-y',
+            '-f', 'lavfi', '-i', f'testsrc2=size={size}:rate=30:duration={duration}',
+            '-f', 'lavfi', '-i', f'sine=duration={duration}',
+            '-vf', 'noise=alls=20:allf=t', '-c:v', 'libx264', '-preset', 'ultrafast', '-b:v', bitrate,
+            '-c:a', 'aac', '-shortest', path,
+        ], check=True)
+        paths[name] = path
+    return paths
+
+
+def list_videos(directory):
+    return {name: os.path.join(directory, name) for name in sorted(os.listdir(directory))
+            if name.lower().endswith(VIDEO_EXTENSIONS)}
+
+
+async def search_latency(client, url, name, path, repeats):
+    with open(path, 'rb') as f:
+        contents = f.read()
+    latencies = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        response = await client.post(url, files={'file': (name, contents)})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+    return sorted(latencies)[len(latencies) // 2]
+
+
+def set_mode(preprocessor, mode):
+    preprocessor.enabled = mode != 'original'
+    preprocessor.transcode = mode == 'transcoded'
+
+
+def run(samples, vertex_latency_ms, upload_mbps, repeats):
+    vertex_port = free_port()
+    serve_in_process(fake_vertex.create_app, vertex_port, vertex_latency_ms, upload_mbps)
+    # Disable the upload cache so every request is embedded
+    configure_app_env(f'http://127.0.0.1:{vertex_port}', UPLOAD_CACHE_MAX_BYTES=0)
+    from api.config import settings
+    from api.videos import video_preprocessor
+
+    app = app_under_test.create_app()
+    api_port = free_port()
+    serve_in_thread(app, api_port)
+    url = f'http://127.0.0.1:{api_port}/api/search/video'
+
+    async def run_samples():
+        results = []
+        async with httpx.AsyncClient(timeout=300) as client:
+            for name, path in samples.items():
+                entry = {'video': name, 'window_sec': video_preprocessor.window_sec}
+                for mode in MODES:
+                    set_mode(video_preprocessor, mode)
+                    start = time.perf_counter()
+                    prepared, _ = await video_preprocessor.prepare(path, settings.upload_tmp_dir)
+                    preprocess_ms = (time.perf_counter() - start) * 1000
+                    size = os.path.getsize(prepared)
+                    if prepared != path:
+                        os.remove(prepared)
+                    entry[mode] = {
+                        'payload_bytes': 4 * ((size + 2) // 3),
+                        'preprocess_ms': round(preprocess_ms, 1),
+                        'latency_ms': round(await search_latency(client, url, name, path, repeats) * 1000, 1),
+                    }
+                results.append(entry)
+        return results
+
+    return asyncio.run(run_samples())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark query video trimming and transcoding before embedding.')
+    parser.add_argument('--videos', type=str, help='Directory of sample videos (default: generated samples).')
+    parser.add_argument('--vertex-latency-ms', type=float, default=150.0, help='Fake Vertex predict latency.')
+    parser.add_argument('--upload-mbps', type=float, default=50.0, help='Simulated upload bandwidth to Vertex.')
+    parser.add_argument('--repeats', type=int, default=3, help='Searches per video and mode (the median is reported).')
+
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        samples = list_videos(args.videos) if args.videos else synthetic_videos(directory)
+        output = run(samples, args.vertex_latency_ms, args.upload_mbps, args.repeats)
+    print(json.dumps(output, indent=2))
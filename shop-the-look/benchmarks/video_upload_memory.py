@@ -0,0 +1,109 @@
+"""
+Video upload memory benchmark.
+
+Runs the API in its own process against the fake Vertex endpoint, sends `--uploads` concurrent
+video uploads of `--size-mb` each and reports the peak resident memory of the API process
+(Linux only, read from /proc). It finally sends one oversized upload to check how quickly it is
+rejected:
+
+    python -m benchmarks.video_upload_memory --uploads 50 --size-mb 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from benchmarks import app_under_test, fake_vertex
+from benchmarks.common import configure_app_env, free_port, serve_in_process, summarize_latencies
+
+BOUNDARY = 'stl-benchmark-boundary'
+CHUNK_SIZE = 1024 * 1024
+
+
+def memory_kb(pid, field):
+    """Reads a memory field (e.g. VmRSS, VmHWM) of a process from /proc, in kB."""
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    return 0
+
+
+def multipart_upload(unique_prefix, payload, filename='clip.mp4'):
+    """Returns (content_length, async byte iterator) for a multipart upload streamed from `payload`."""
+    head = (f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f'Content-Type: video/mp4\r\n\r\n').encode() + unique_prefix
+    tail = f'\r\n--{BOUNDARY}--\r\n'.encode()
+    view = memoryview(payload)
+
+    async def stream():
+        yield head
+        for start in range(0, len(view), CHUNK_SIZE):
+            yield bytes(view[start:start + CHUNK_SIZE])
+        yield tail
+
+    return len(head) + len(payload) + len(tail), stream()
+
+
+async def upload(client, url, unique_prefix, payload):
+    length, body = multipart_upload(unique_prefix, payload)
+    headers = {'Content-Type': f'multipart/form-data; boundary={BOUNDARY}', 'Content-Length': str(length)}
+    start = time.perf_counter()
+    response = await client.post(url, content=body, headers=headers)
+    return response.status_code, time.perf_counter() - start
+
+
+async def drive(url, pid, uploads, size_mb):
+    payload = os.urandom(int(size_mb * 1_000_000) - 16)
+    idle_rss_kb = memory_kb(pid, 'VmRSS')
+
+    async with httpx.AsyncClient(timeout=600, limits=httpx.Limits(max_connections=uploads)) as client:
+        start = time.perf_counter()
+        results = await asyncio.gather(*(upload(client, url, i.to_bytes(16, 'big'), payload) for i in range(uploads)))
+        elapsed = time.perf_counter() - start
+
+        oversized = os.urandom(25 * 1_000_000)
+        status, oversized_latency = await upload(client, url, b'x' * 16, oversized)
+
+    latencies = [latency for status_code, latency in results if status_code == 200]
+    peak_rss_kb = memory_kb(pid, 'VmHWM')
+    summary = summarize_latencies(latencies, elapsed)
+    summary.update({
+        'uploads': uploads,
+        'size_mb': size_mb,
+        'errors': sum(1 for status_code, _ in results if status_code != 200),
+        'idle_rss_mb': round(idle_rss_kb / 1024, 1),
+        'peak_rss_mb': round(peak_rss_kb / 1024, 1),
+        'peak_rss_per_upload_mb': round((peak_rss_kb - idle_rss_kb) / 1024 / uploads, 2),
+        'oversized_status': status,
+        'oversized_latency_ms': round(oversized_latency * 1000, 2),
+    })
+    return summary
+
+
+def main(uploads, size_mb, vertex_latency_ms):
+    vertex_port = free_port()
+    serve_in_process(fake_vertex.create_app, vertex_port, vertex_latency_ms)
+    # Distinct uploads would miss the cache anyway, disabling it keeps the disk out of the picture
+    configure_app_env(f'http://127.0.0.1:{vertex_port}', UPLOAD_CACHE_MAX_BYTES=0)
+
+    api_port = free_port()
+    api_process = serve_in_process(app_under_test.create_app, api_port)
+
+    result = asyncio.run(drive(f'http://127.0.0.1:{api_port}/api/search/video', api_process.pid, uploads, size_mb))
+    result['vertex_latency_ms'] = vertex_latency_ms
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure API memory under concurrent video uploads.')
+    parser.add_argument('--uploads', type=int, default=50, help='Number of concurrent uploads.')
+    parser.add_argument('--size-mb', type=float, default=20.0, help='Size of each upload in MB.')
+    parser.add_argument('--vertex-latency-ms', type=float, default=500.0, help='Fake Vertex predict latency.')
+
+    args = parser.parse_args()
+    main(args.uploads, args.size_mb, args.vertex_latency_ms)
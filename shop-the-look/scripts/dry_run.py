@@ -0,0 +1,58 @@
+"""
+Dry-Run Backends
+
+Stand-ins for the embedding model and the Pinecone index, used by `--dry-run`: the pipeline
+lists and loads the files for real, but embedding returns constant vectors and upserts are
+dropped, after a simulated latency. No Vertex AI quota is spent and nothing is written to the
+index, so a dry run measures the throughput ceiling of listing and loading, and how many
+workers it takes to reach it.
+"""
+
+import time
+from types import SimpleNamespace
+
+# Dimension of the multimodalembedding@001 vectors
+DIMENSION = 1408
+
+
+class StubEmbeddingModel:
+    """Answers `get_embeddings` like MultiModalEmbeddingModel, with constant vectors, after `latency_ms`."""
+
+    def __init__(self, latency_ms=0.0, dimension=DIMENSION):
+        self.latency_sec = latency_ms / 1000
+        self.values = [0.0] * (dimension - 1) + [1.0]
+
+    def get_embeddings(self, image=None, video=None, contextual_text=None, video_segment_config=None, **kwargs):
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        video_embeddings = []
+        if video is not None:
+            # One segment per interval of the requested window, as the model reports them
+            start = getattr(video_segment_config, 'start_offset_sec', None) or 0
+            end = getattr(video_segment_config, 'end_offset_sec', None) or start + 120
+            interval = getattr(video_segment_config, 'interval_sec', None) or 16
+            for offset in range(start, end, interval):
+                video_embeddings.append(SimpleNamespace(start_offset_sec=offset, end_offset_sec=min(offset + interval, end),
+                                                        embedding=list(self.values)))
+        return SimpleNamespace(
+            image_embedding=list(self.values) if image is not None else None,
+            text_embedding=list(self.values) if contextual_text is not None else None,
+            video_embeddings=video_embeddings,
+        )
+
+
+class StubIndex:
+    """Accepts upserts and deletes like a Pinecone index, after `latency_ms` per request, and keeps nothing."""
+
+    def __init__(self, latency_ms=0.0):
+        self.latency_sec = latency_ms / 1000
+
+    def upsert(self, vectors, **kwargs):
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        return {'upserted_count': len(vectors)}
+
+    def delete(self, ids=None, **kwargs):
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        return {}
@@ -0,0 +1,125 @@
+"""
+Local Replica Exporter
+
+This script exports the vectors and metadata of a Pinecone index into a local replica snapshot
+(see replica_snapshot.py), which the API can search in memory instead of querying Pinecone when
+it is started with `REPLICA_DIR` pointing at the same directory.
+
+The first run exports the whole index. Later runs are incremental: they list the index IDs,
+fetch only the vectors the current snapshot does not have and drop the ones no longer in the
+index. Vectors overwritten in place (re-ingested files keep their IDs) are refreshed by running
+the ingestion scripts with `--replica-dir`, or by exporting again with `--full`.
+
+Every namespace of the index is exported into its own subdirectory of the replica directory,
+so searches in any of them (e.g. the image and video namespaces) are served locally. Pass
+--namespace, once per namespace, to export only some of them.
+
+The replica ranks vectors by dot product, so it supports indexes with the cosine and dotproduct
+metrics. The metric is read from the index description, or given with --metric when the index
+is addressed by --host.
+
+Usage:
+python export_replica.py -i your-pinecone-index-name -o /path/to/replica [--dtype int8] [--full] [--namespace image]
+"""
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pinecone import Pinecone
+
+from replica_snapshot import SUPPORTED_METRICS, Snapshot, SnapshotWriter, merge_snapshot, namespace_dir
+
+# Fetch requests carry the IDs in the URL, so they are kept to a moderate number per request
+FETCH_BATCH_SIZE = 100
+LIST_PAGE_SIZE = 100
+DEFAULT_FETCH_WORKERS = 8
+
+
+def list_ids(index, namespace=None):
+    ids = []
+    for page in index.list(limit=LIST_PAGE_SIZE, namespace=namespace or ''):
+        ids.extend(page)
+    return ids
+
+
+def fetch_vectors(index, ids, namespace=None, workers=DEFAULT_FETCH_WORKERS):
+    """Yields `(id, values, metadata)` for `ids`, fetched in batches by `workers` concurrent requests."""
+    def fetch(start):
+        # Skipping the client's per-value type checks halves the time to parse a response
+        response = index.fetch(ids=ids[start:start + FETCH_BATCH_SIZE], namespace=namespace or '', _check_return_type=False)
+        return [(id, vector['values'], vector.get('metadata') or {}) for id, vector in response['vectors'].items()]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for vectors in executor.map(fetch, range(0, len(ids), FETCH_BATCH_SIZE)):
+            yield from vectors
+
+
+def export(index, replica_dir, dtype=None, full=False, namespace=None, source=None, workers=DEFAULT_FETCH_WORKERS,
+           metric='cosine'):
+    """
+    Exports a namespace of the index into a new snapshot in its subdirectory of `replica_dir`,
+    incrementally unless `full` or there is no snapshot yet.
+    """
+    if metric not in SUPPORTED_METRICS:
+        raise ValueError(f"The replica ranks by dot product and cannot serve an index with the {metric} metric")
+    start = time.perf_counter()
+    ids = list_ids(index, namespace)
+    replica_dir = namespace_dir(replica_dir, namespace)
+    current = None if full else Snapshot.open_current(replica_dir)
+    if current is not None and current.manifest['metric'] != metric:
+        print(f"The current snapshot was made for the {current.manifest['metric']} metric, exporting the {metric} index in full")
+        current = None
+
+    if current is None:
+        dimension = index.describe_index_stats()['dimension']
+        with SnapshotWriter(replica_dir, dimension, dtype or 'float32', metric, source=source, namespace=namespace or '') as writer:
+            for id, values, metadata in fetch_vectors(index, ids, namespace, workers):
+                writer.add(id, values, metadata)
+        count = len(writer.ids)
+        print(f"Exported {count} vectors of namespace '{namespace or ''}' to {writer.path} in {time.perf_counter() - start:.1f}s")
+        return count
+
+    listed = set(ids)
+    known = set(current.ids)
+    added = [id for id in ids if id not in known]
+    removed = known - listed
+    count = merge_snapshot(replica_dir, fetch_vectors(index, added, namespace, workers), removed, dtype, source)
+    print(f"Refreshed namespace '{namespace or ''}' of the replica in {time.perf_counter() - start:.1f}s: {len(added)} vectors added, "
+          f"{len(removed)} removed, {count} in total")
+    return count
+
+
+def main(pinecone_index_name, replica_dir, dtype=None, full=False, namespaces=None, host=None, workers=DEFAULT_FETCH_WORKERS,
+         metric=None):
+    api_key = os.getenv('PINECONE_API_KEY')
+    if not api_key:
+        raise ValueError("PINECONE_API_KEY environment variable is not set.")
+    pc = Pinecone(api_key=api_key, source_tag="pinecone:stl_sample_app")
+    if metric is None:
+        if not pinecone_index_name:
+            raise ValueError("The index metric is looked up by name, pass --index or --metric.")
+        metric = pc.describe_index(pinecone_index_name).metric
+    index = pc.Index(host=host) if host else pc.Index(pinecone_index_name)
+    if not namespaces:
+        # An empty index has no namespaces yet, its default namespace is exported empty
+        namespaces = sorted(index.describe_index_stats()['namespaces']) or ['']
+    for namespace in namespaces:
+        export(index, replica_dir, dtype, full, namespace, pinecone_index_name or host, workers, metric)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a Pinecone index into a local replica snapshot for the API.')
+    parser.add_argument('-i', '--index', type=str, help='The Pinecone Index name.')
+    parser.add_argument('--host', type=str, help='The Pinecone index host, instead of looking it up by name.')
+    parser.add_argument('-o', '--output', type=str, required=True, help='Replica directory (the API\'s REPLICA_DIR).')
+    parser.add_argument('--dtype', choices=['float32', 'int8'], help='Store vectors as float32, or as int8 at a quarter of the memory (default: float32, or that of the current snapshot).')
+    parser.add_argument('--namespace', type=str, action='append', help='Index namespace to export, repeat for several (default: every namespace of the index).')
+    parser.add_argument('--full', action='store_true', help='Export every vector again instead of refreshing the current snapshot.')
+    parser.add_argument('--workers', type=int, default=DEFAULT_FETCH_WORKERS, help='Fetch requests sent concurrently.')
+    parser.add_argument('--metric', choices=SUPPORTED_METRICS, help='The index metric (default: read from the index description).')
+
+    args = parser.parse_args()
+    if not args.index and not args.host:
+        parser.error("Either --index or --host is required")
+    main(args.index, args.output, args.dtype, args.full, args.namespace, args.host, args.workers, args.metric)
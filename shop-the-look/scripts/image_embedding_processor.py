@@ -24,69 +24,51 @@ python image_embedding_processor.py -p your-gc-project-id -b your-gcs-bucket-nam
 """
 
 import base64
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 import vertexai
 from pinecone import Pinecone
 import os
-import uuid
-import vertexai
 from datetime import datetime
-import time
 from vertexai.vision_models import MultiModalEmbeddingModel, Image
 from google.cloud import storage
+from ingest_manifest import vector_id
+from pipeline import Modality, PipelineConfig, add_pipeline_arguments, run_ingestion
 
 REGION = 'us-central1'
 FILE_TYPE = 'image'
+SUPPORTED_IMAGE_FORMATS = ('jpeg', 'jpg', 'png', 'bmp', 'gif')
 
-def process_image(image_file, bucket_name, prefix, model, index, file_path, image_index, total_images, max_retries=5):
-    gcs_uri = f'gs://{bucket_name}/{prefix}/{image_file}'
+def load_image(item):
+    return Image.load_from_file(item.gcs_uri)
 
+def embed_image(model, item):
     # TODO: TEMPORARY FILE PATH
     file_path = 'multi-modal-sample-app/pexels-clothing/' 
 
-    attempt = 0
-    while attempt < max_retries:
-        try:
-            image = Image.load_from_file(gcs_uri)
-
-            embeddings = model.get_embeddings(
-                image=image,
-            )
-
-            print(f"Received embeddings for: {image_file} ({image_index}/{total_images})")
-
-            date_added = datetime.now().isoformat()
-            embedding_id = str(uuid.uuid4())
-            
-            vector = [
-                {
-                    'id': embedding_id,
-                    'values': embeddings.image_embedding,
-                    'metadata': {
-                        'date_added': date_added,
-                        'file_type': FILE_TYPE,
-                        'gcs_file_path': file_path,
-                        'gcs_file_name': image_file,
-                    }
-                }
-            ]
-            index.upsert(vector)
-            print(f"Processed and upserted: {image_file} ({image_index}/{total_images})")
-            break  # Exit loop if successful
-        except Exception as e:
-            print(f"Error processing file {image_file}: {e}")
-            attempt += 1
-            if attempt < max_retries:
-                wait_time = 5 ** attempt  # Exponential backoff
-                print(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                print(f"Failed to process file {image_file} after {max_retries} attempts.")
-
-def main(gc_project_id, gcs_bucket_name, gcs_folder_name, pinecone_index_name):
+    embeddings = model.get_embeddings(
+        image=item.content,
+    )
+
+    date_added = datetime.now().isoformat()
+    embedding_id = vector_id(item.bucket_name, item.blob.name)
+
+    return [
+        {
+            'id': embedding_id,
+            'values': embeddings.image_embedding,
+            'metadata': {
+                'date_added': date_added,
+                'file_type': FILE_TYPE,
+                'gcs_file_path': file_path,
+                'gcs_file_name': item.file_name,
+            }
+        }
+    ]
+
+IMAGE_MODALITY = Modality(FILE_TYPE, SUPPORTED_IMAGE_FORMATS, load_image, embed_image)
+
+def main(gc_project_id, gcs_bucket_name, gcs_folder_name, pinecone_index_name, config=None):
     api_key = os.getenv('PINECONE_API_KEY')  # Pinecone API key
-    file_path = f'{gcs_bucket_name}/{gcs_folder_name}/'  # GCS bucket path
 
     google_credentials_base64 = os.getenv('GOOGLE_CREDENTIALS_BASE64')
     credentials_path = '/tmp/google-credentials.json'
@@ -97,22 +79,18 @@ def main(gc_project_id, gcs_bucket_name, gcs_folder_name, pinecone_index_name):
             f.write(google_credentials)
         os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = credentials_path
 
-    pc = Pinecone(api_key=api_key, source_tag="pinecone:stl_sample_app")
-    index = pc.Index(pinecone_index_name)
-
+    config = config or PipelineConfig()
     vertexai.init(project=gc_project_id, location=REGION)
 
-    model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding@001")
+    # A dry run embeds and upserts with stubs, so it needs neither Pinecone nor the model
+    model = index = None
+    if not config.dry_run:
+        pc = Pinecone(api_key=api_key, source_tag="pinecone:stl_sample_app")
+        index = pc.Index(pinecone_index_name)
+        model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding@001")
 
     client = storage.Client()
-    blobs = client.list_blobs(gcs_bucket_name, prefix=gcs_folder_name)
-    image_files = [blob.name.replace(gcs_folder_name + '/', '') for blob in blobs if blob.name.endswith(('jpeg', 'jpg', 'png', 'bmp', 'gif'))]
-
-    total_images = len(image_files)
-    with ThreadPoolExecutor() as executor:
-        futures = [executor.submit(process_image, image_file, gcs_bucket_name, gcs_folder_name, model, index, file_path, i + 1, total_images) for i, image_file in enumerate(image_files)]
-        for future in as_completed(futures):
-            future.result()  # This will re-raise any exceptions that occurred during processing
+    run_ingestion(client, model, index, gcs_bucket_name, gcs_folder_name, [IMAGE_MODALITY], config, pinecone_index_name)
 
 if __name__ == '__main__':
     import argparse
@@ -122,9 +100,10 @@ if __name__ == '__main__':
     parser.add_argument('-b', '--bucket', type=str, required=True, help='The Google Cloud Storage bucket.')
     parser.add_argument('-f', '--folder', type=str, required=True, help='The GCS folder containing images in the bucket.')
     parser.add_argument('-i', '--index', type=str, required=True, help='The Pinecone Index name.')
+    add_pipeline_arguments(parser)
 
     args = parser.parse_args()
-    main(args.project, args.bucket, args.folder, args.index)
+    main(args.project, args.bucket, args.folder, args.index, PipelineConfig.from_args(args))
 
 """
 Setup Instructions:
@@ -165,5 +144,27 @@ $ python image_embedding_processor.py -p my-gcp-project -b my-image-bucket -f pr
 Notes:
 - Ensure that your Google Cloud service account has the necessary permissions to access the GCS bucket and use Vertex AI.
 - The script supports the following image formats: jpeg, jpg, png, bmp, gif.
-- The script uses exponential backoff for retrying failed operations, with a maximum of 5 attempts per image.
+- Embedding requests are paced by an adaptive rate limiter that starts at --initial-rate
+  requests/sec, speeds up while requests succeed and slows down on quota errors (HTTP 429),
+  honoring Retry-After, up to --max-rate. Quota and transient errors are retried with capped,
+  jittered exponential backoff, up to --max-retries attempts per image. Other errors (e.g. an
+  unreadable file) are not retried; failed images are listed in a dead-letter file (--dead-letter)
+  and processed again on the next run.
+- Vectors are upserted in batches of up to --batch-size vectors (and at most 2 MB per request), with
+  --upsert-workers batches sent concurrently. Failed batches are retried on their own.
+- Files are processed by a streaming pipeline (list -> load -> embed -> upsert) whose stages
+  are connected by bounded queues (--queue-size) and run --load-workers and --embed-workers
+  threads. Listing is paged, upserts start as soon as the first images are embedded, and progress
+  is printed every --progress-interval seconds. Use ingest.py for folders with both images and videos.
+- Vector IDs are derived from the bucket and image path, so re-running the script overwrites
+  vectors instead of duplicating them. A checkpoint manifest (--manifest) records the GCS
+  generation of every upserted image, and re-runs only embed new or changed images; an
+  interrupted run resumes where it stopped. Use --full to re-embed everything and --prune to
+  delete the vectors of images that were removed from the bucket.
+- With --profile, the latency histograms, throughput, retries and worker utilization of every
+  stage (and of the upsert requests) are written to a JSON and a CSV report at the end, showing
+  whether loading, embedding or upserting is the bottleneck. With --dry-run, the images are listed
+  and loaded, but embedded and upserted by stubs (with --dry-run-embed-ms and --dry-run-upsert-ms
+  of simulated latency), so thread counts can be sized without spending quota or touching the
+  index and manifest.
 """
@@ -0,0 +1,73 @@
+"""
+Mixed Image and Video Embedding Generator and Upserter
+
+This script processes the images and videos of a Google Cloud Storage (GCS) folder in a single
+run, generates embeddings using Vertex AI, and upserts them to a Pinecone index. It uses the same
+streaming pipeline and embedding settings as the image and video processors.
+
+Usage:
+python ingest.py -p your-gc-project-id -b your-gcs-bucket-name -f your-gcs-folder-name -i your-pinecone-index-name
+
+See image_embedding_processor.py and video_embedding_processor.py for the setup instructions.
+"""
+
+import argparse
+import os
+
+import vertexai
+from vertexai.vision_models import MultiModalEmbeddingModel
+from google.cloud import storage
+from pinecone import Pinecone
+
+from image_embedding_processor import IMAGE_MODALITY
+from video_embedding_processor import (REGION, VIDEO_MODALITY, add_video_arguments, setup_google_credentials,
+                                       video_modality_from_args)
+from pipeline import PipelineConfig, add_pipeline_arguments, run_ingestion
+
+MODALITIES = {
+    'image': IMAGE_MODALITY,
+    'video': VIDEO_MODALITY,
+}
+
+def main(gc_project_id, gcs_bucket_name, gcs_folder_name, pinecone_index_name, file_types=tuple(MODALITIES), config=None,
+         video_modality=VIDEO_MODALITY):
+    """Process the images and videos of a GCS folder and upsert their embeddings to Pinecone."""
+    setup_google_credentials()
+
+    config = config or PipelineConfig()
+
+    # Initialize Vertex AI
+    vertexai.init(project=gc_project_id, location=REGION)
+
+    # A dry run embeds and upserts with stubs, so it needs neither Pinecone nor the model
+    model = index = None
+    if not config.dry_run:
+        # Initialize Pinecone
+        api_key = os.getenv('PINECONE_API_KEY')
+        if not api_key:
+            raise ValueError("PINECONE_API_KEY environment variable is not set.")
+        pc = Pinecone(api_key=api_key, source_tag="pinecone:stl_sample_app")
+        index = pc.Index(pinecone_index_name)
+        model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding@001")
+
+    client = storage.Client()
+    modalities = [video_modality if file_type == 'video' else MODALITIES[file_type] for file_type in file_types]
+    run_ingestion(client, model, index, gcs_bucket_name, gcs_folder_name, modalities, config, pinecone_index_name)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Process images and videos from a GCS bucket and upsert embeddings to Pinecone.')
+    parser.add_argument('-p', '--project', type=str, required=True, help='The Google Cloud project ID.')
+    parser.add_argument('-b', '--bucket', type=str, required=True, help='The Google Cloud Storage bucket name.')
+    parser.add_argument('-f', '--folder', type=str, required=True, help='The GCS folder containing images and videos in the bucket.')
+    parser.add_argument('-i', '--index', type=str, required=True, help='The Pinecone Index name.')
+    parser.add_argument('-t', '--types', type=str, default=','.join(MODALITIES), help='Comma-separated file types to ingest (image, video).')
+    add_pipeline_arguments(parser)
+    add_video_arguments(parser)
+
+    args = parser.parse_args()
+    file_types = [file_type.strip() for file_type in args.types.split(',') if file_type.strip()]
+    for file_type in file_types:
+        if file_type not in MODALITIES:
+            parser.error(f"Unknown file type: {file_type}")
+    video_modality = video_modality_from_args(parser, args) if 'video' in file_types else VIDEO_MODALITY
+    main(args.project, args.bucket, args.folder, args.index, file_types, PipelineConfig.from_args(args), video_modality)
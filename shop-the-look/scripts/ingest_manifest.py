@@ -0,0 +1,198 @@
+"""
+Ingestion Checkpoint Manifest
+
+Shared by the image and video embedding processors. Vector IDs are derived from the bucket,
+object path and segment offset, so re-ingesting an object overwrites its vectors instead of
+duplicating them. The manifest is a local JSON Lines file recording, for every object, the
+generation and etag it was processed at, the vector IDs it produced and how far it got:
+
+- "embedded": its vectors were handed to the upsert buffer
+- "upserted": all of its vectors were confirmed upserted
+
+On the next run, objects already upserted at their current generation are skipped, so only new
+and changed objects are embedded again and an interrupted run picks up where it stopped.
+"""
+
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+# Pinecone deletes at most 1000 IDs per request
+DELETE_BATCH_SIZE = 1000
+
+EMBEDDED = 'embedded'
+UPSERTED = 'upserted'
+DELETED = 'deleted'
+
+
+def object_key(bucket_name, object_name):
+    return f'gs://{bucket_name}/{object_name}'
+
+
+def vector_id(bucket_name, object_name, start_offset_sec=None):
+    """Deterministic vector ID for an object, or for the segment of a video starting at `start_offset_sec`."""
+    name = object_key(bucket_name, object_name)
+    if start_offset_sec is not None:
+        name = f'{name}#{start_offset_sec}'
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, name))
+
+
+def delete_vectors(index, ids, namespace=None):
+    """Deletes vectors by ID, logging instead of raising so a failed cleanup does not stop ingestion."""
+    ids = list(ids)
+    kwargs = {'namespace': namespace} if namespace else {}
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        batch = ids[start:start + DELETE_BATCH_SIZE]
+        try:
+            index.delete(ids=batch, **kwargs)
+        except Exception as e:
+            print(f"Error deleting {len(batch)} vectors: {e}")
+            return False
+    return True
+
+
+def default_manifest_path(bucket_name, folder_name, index_name, kind='manifest'):
+    folder = folder_name.strip('/').replace('/', '_') or 'root'
+    return f'{kind}-{index_name}-{bucket_name}-{folder}.jsonl'
+
+
+def default_dead_letter_path(bucket_name, folder_name, index_name):
+    return default_manifest_path(bucket_name, folder_name, index_name, kind='dead-letter')
+
+
+class IngestManifest:
+    """
+    Thread-safe checkpoint of processed objects, appended to as objects progress.
+
+    `record_upserted_ids` is meant to be passed to `UpsertBuffer` as its `on_upserted` callback:
+    an object is marked upserted once every one of its vectors has been.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._pending = {}
+        self._id_keys = {}
+        self._load()
+        self._file = open(self.path, 'a')
+        self.skipped = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A run killed mid-write leaves a partial last line
+                    continue
+                if record.get('state') == DELETED:
+                    self._entries.pop(record['key'], None)
+                else:
+                    self._entries[record['key']] = record
+
+        # Compact the log to one line per object
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            for record in self._entries.values():
+                f.write(json.dumps(record) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+
+    def is_current(self, key, generation, etag=None):
+        """True if the object was fully upserted at this generation (or etag, if it has no generation)."""
+        with self._lock:
+            record = self._entries.get(key)
+        if record is None or record['state'] != UPSERTED:
+            return False
+        if generation is not None:
+            return record.get('generation') == generation
+        return etag is not None and record.get('etag') == etag
+
+    def previous_ids(self, key):
+        with self._lock:
+            record = self._entries.get(key)
+        return list(record['ids']) if record else []
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries)
+
+    def is_changed(self, bucket_name, blob, full=False):
+        """True if the blob is new or changed since it was last upserted (always, if `full`)."""
+        if full or not self.is_current(object_key(bucket_name, blob.name), blob.generation, blob.etag):
+            return True
+        self.skipped += 1
+        return False
+
+    def remove_missing(self, index, bucket_name, prefix, listed_keys, extensions, namespace=None):
+        """
+        Deletes the vectors of objects under `prefix` with one of `extensions` that are in the
+        manifest but not in `listed_keys`, i.e. no longer in the bucket, from `namespace`.
+        """
+        key_prefix = object_key(bucket_name, prefix)
+        removed = [key for key in self.keys()
+                   if key.startswith(key_prefix) and key.lower().endswith(extensions) and key not in listed_keys]
+        for key in removed:
+            if delete_vectors(index, self.previous_ids(key), namespace):
+                self.record_deleted(key)
+        return len(removed)
+
+    def record_embedded(self, key, generation, etag, ids):
+        """Records the vector IDs of an object before they are handed to the upsert buffer."""
+        record = {
+            'key': key,
+            'generation': generation,
+            'etag': etag,
+            'state': EMBEDDED if ids else UPSERTED,
+            'ids': list(ids),
+            'updated': datetime.now().isoformat(),
+        }
+        with self._lock:
+            self._entries[key] = record
+            self._write(record)
+            if ids:
+                self._pending[key] = set(ids)
+                for id in ids:
+                    self._id_keys[id] = key
+
+    def record_upserted_ids(self, ids):
+        with self._lock:
+            for id in ids:
+                key = self._id_keys.pop(id, None)
+                if key is None:
+                    continue
+                pending = self._pending.get(key)
+                pending.discard(id)
+                if not pending:
+                    del self._pending[key]
+                    record = dict(self._entries[key], state=UPSERTED, updated=datetime.now().isoformat())
+                    self._entries[key] = record
+                    self._write(record)
+
+    def record_deleted(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._write({'key': key, 'state': DELETED})
+
+    def close(self):
+        with self._lock:
+            incomplete = len(self._pending)
+            upserted = sum(1 for record in self._entries.values() if record['state'] == UPSERTED)
+            self._file.close()
+        print(f"Manifest {self.path}: {upserted} objects upserted, {self.skipped} unchanged objects skipped, "
+              f"{incomplete} objects incomplete (they will be processed again on the next run).")
@@ -0,0 +1,224 @@
+"""
+Ingestion Profile
+
+Records where the time of an ingestion run goes, for `--profile`. For every pipeline stage
+(list, load, embed, upsert) and for the calls to the index, it keeps the latency of each call
+and how the stage's worker threads spent their time:
+
+- busy: running the stage (e.g. loading a file, calling the embedding model)
+- throttled: waiting for the rate limiter or backing off before a retry
+- blocked: waiting for room in the next stage's queue, i.e. held back by a slower stage
+- idle: waiting for input, i.e. starved by a slower stage before it
+
+Utilization is the busy time over the time of all the stage's threads, saturation also counts
+the throttled time. The stage with the highest saturation is the bottleneck: give it more
+workers if it is mostly busy, or raise the rate limit (quota) if it is mostly throttled.
+
+At the end of the run, the report is printed and written as JSON (latency percentiles and
+histograms, throughput, retries, failures and utilization per stage) and as CSV (one row per
+stage, without the histograms).
+"""
+
+import csv
+import json
+import threading
+import time
+from array import array
+from datetime import datetime
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BOUNDS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+CSV_FIELDS = ('stage', 'workers', 'items', 'items_per_sec', 'calls', 'retries', 'failed', 'p50_ms', 'p90_ms', 'p99_ms',
+              'max_ms', 'mean_ms', 'busy_sec', 'throttled_sec', 'blocked_sec', 'idle_sec', 'utilization',
+              'saturation')
+
+
+def _percentile(ordered, percent):
+    if not ordered:
+        return None
+    rank = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+    return ordered[rank]
+
+
+class StageProfile:
+    """Thread-safe latency samples and time accounting of one stage."""
+
+    def __init__(self, name, workers=1):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.calls = 0
+        self.retries = 0
+        self.failed = 0
+        self.busy_sec = 0.0
+        self.throttled_sec = 0.0
+        self.blocked_sec = 0.0
+        self.idle_sec = 0.0
+        # Seconds per call, as doubles so a long run stays small
+        self._latencies = array('d')
+        self._lock = threading.Lock()
+
+    def record_call(self, seconds, items=1):
+        """Records one call taking `seconds`, which handled `items` items (e.g. the vectors of an upsert)."""
+        with self._lock:
+            self._latencies.append(seconds)
+            self.calls += 1
+            self.items += items
+            self.busy_sec += seconds
+
+    def add_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def add_time(self, kind, seconds):
+        """Adds `seconds` to the throttled, blocked or idle time."""
+        with self._lock:
+            setattr(self, f'{kind}_sec', getattr(self, f'{kind}_sec') + seconds)
+
+    def report(self, elapsed_sec, processed=None, retries=None, failed=None):
+        """Summary of the stage over `elapsed_sec`, with the pipeline's own counts when given."""
+        with self._lock:
+            ordered = sorted(self._latencies)
+            busy_sec = self.busy_sec
+            throttled_sec = self.throttled_sec
+            times = {kind: round(getattr(self, f'{kind}_sec'), 3) for kind in ('busy', 'throttled', 'blocked', 'idle')}
+        items = self.items if processed is None else processed
+
+        histogram = []
+        position = 0
+        for bound in HISTOGRAM_BOUNDS_MS:
+            start = position
+            while position < len(ordered) and ordered[position] * 1000 <= bound:
+                position += 1
+            histogram.append({'le_ms': bound, 'count': position - start})
+        histogram.append({'le_ms': None, 'count': len(ordered) - position})
+
+        def ms(seconds):
+            return None if seconds is None else round(seconds * 1000, 2)
+
+        thread_sec = self.workers * elapsed_sec
+        return {
+            'stage': self.name,
+            'workers': self.workers,
+            'items': items,
+            'items_per_sec': round(items / elapsed_sec, 2) if elapsed_sec else 0.0,
+            'calls': len(ordered),
+            'retries': self.retries if retries is None else retries,
+            'failed': self.failed if failed is None else failed,
+            'p50_ms': ms(_percentile(ordered, 50)),
+            'p90_ms': ms(_percentile(ordered, 90)),
+            'p99_ms': ms(_percentile(ordered, 99)),
+            'max_ms': ms(ordered[-1] if ordered else None),
+            'mean_ms': ms(sum(ordered) / len(ordered) if ordered else None),
+            **{f'{kind}_sec': seconds for kind, seconds in times.items()},
+            'utilization': round(min(1.0, busy_sec / thread_sec), 3) if thread_sec else 0.0,
+            'saturation': round(min(1.0, (busy_sec + throttled_sec) / thread_sec), 3) if thread_sec else 0.0,
+            'histogram_ms': histogram,
+        }
+
+
+class PipelineProfile:
+    """The StageProfile of every stage of a run, created on first use."""
+
+    def __init__(self):
+        self.stages = {}
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def stage(self, name, workers=1):
+        with self._lock:
+            if name not in self.stages:
+                self.stages[name] = StageProfile(name, workers)
+            return self.stages[name]
+
+    def start(self):
+        self.started_at = time.perf_counter()
+
+    def finish(self):
+        self.finished_at = time.perf_counter()
+
+    def report(self, pipeline=None, limiter=None, settings=None):
+        """
+        The report of the run: one entry per stage, the bottleneck and, when given, the
+        pipeline's counts, the rate limiter's state and the settings the run used.
+        """
+        elapsed = (self.finished_at or time.perf_counter()) - (self.started_at or time.perf_counter())
+        counts = {}
+        if pipeline is not None:
+            counts[pipeline.source_name] = (pipeline.listed, None, None)
+            for stage in pipeline.stages:
+                counts[stage.name] = (stage.processed, stage.retries, stage.failed)
+
+        # The pipeline's stages in their order, then the others (e.g. the index calls) that were used
+        names = [name for name in counts if name in self.stages]
+        names += [name for name, profile in self.stages.items() if name not in counts and profile.calls]
+        stages = [self.stages[name].report(elapsed, *counts.get(name, ())) for name in names]
+        pipeline_stages = [stage for stage in stages if stage['stage'] in counts]
+        bottleneck = max(pipeline_stages or stages, key=lambda stage: stage['saturation'], default=None)
+        report = {
+            'generated_at': datetime.now().isoformat(),
+            'elapsed_sec': round(elapsed, 3),
+            'bottleneck': bottleneck['stage'] if bottleneck else None,
+            'settings': settings or {},
+            'stages': stages,
+        }
+        if limiter is not None:
+            report['rate_limiter'] = {'rate': round(limiter.rate, 2), 'requests': limiter.requests, 'throttled': limiter.throttled}
+        return report
+
+
+def print_report(report):
+    print(f"Profile of {report['elapsed_sec']:.1f}s, bottleneck: {report['bottleneck']}")
+    for stage in report['stages']:
+        print(f"  {stage['stage']:<13} {stage['items']:>8} items {stage['items_per_sec']:>9.1f}/s  "
+              f"p50 {stage['p50_ms'] or 0:>8.1f}ms  p99 {stage['p99_ms'] or 0:>8.1f}ms  "
+              f"util {stage['utilization']:>5.0%}  throttled {stage['throttled_sec']:.1f}s  "
+              f"blocked {stage['blocked_sec']:.1f}s  idle {stage['idle_sec']:.1f}s")
+
+
+def write_report(report, base_path):
+    """Writes the report to `<base_path>.json` and its per-stage rows to `<base_path>.csv`, returns both paths."""
+    json_path, csv_path = f'{base_path}.json', f'{base_path}.csv'
+    with open(json_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(report['stages'])
+    return json_path, csv_path
+
+
+class ProfilingIndex:
+    """
+    Wraps an index and records the latency of its `upsert` and `delete` calls (with the number of
+    vectors as items), so the time spent in Pinecone shows apart from the upsert stage, which
+    only hands vectors to the UpsertBuffer. Other attributes are the wrapped index's.
+    """
+
+    def __init__(self, index, profile, workers=1):
+        self.index = index
+        self.upserts = profile.stage('index.upsert', workers)
+        self.deletes = profile.stage('index.delete')
+
+    def upsert(self, vectors, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.index.upsert(vectors=vectors, **kwargs)
+        except Exception:
+            # Retried by the UpsertBuffer, counted as a call without items
+            self.upserts.record_call(time.perf_counter() - start, 0)
+            self.upserts.add_failure()
+            raise
+        self.upserts.record_call(time.perf_counter() - start, len(vectors))
+        return response
+
+    def delete(self, ids, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.index.delete(ids=ids, **kwargs)
+        finally:
+            self.deletes.record_call(time.perf_counter() - start, len(ids))
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
@@ -0,0 +1,574 @@
+"""
+Streaming Ingestion Pipeline
+
+Shared by the image, video and mixed embedding processors. Objects flow through four stages
+connected by bounded queues:
+
+    list -> load -> embed -> upsert
+
+- list: pages through the bucket listing and skips objects the manifest marks as unchanged
+- load: prepares each object for the embedding model, and may split it into windows (e.g. the
+  parts of a long video) that go through the next stages as items of their own
+- embed: calls Vertex AI and builds the vectors
+- upsert: records the object in the manifest and hands its vectors to the UpsertBuffer
+
+Every stage has its own number of worker threads. Because the queues are bounded, a slow stage
+holds back the ones before it instead of letting work pile up in memory, and upserts start as
+soon as the first objects are embedded instead of after the whole bucket is listed. Progress
+(items and throughput per stage, queue depths) is printed while the pipeline runs.
+
+Calls to the embedding model are paced by an AdaptiveRateLimiter. Failures are retried only if
+they are throttling or transient errors; files that fail for good are written to a dead-letter
+file and, as they are not marked upserted in the manifest, are processed again on the next run.
+
+With `--profile`, the latency of every call and the time each stage spends working, throttled,
+blocked on the next stage and waiting for input are recorded (see ingest_profile.py) and written
+as a report at the end. With `--dry-run`, the embedding model and the index are replaced by stubs
+(see dry_run.py), so listing and loading can be measured without spending quota.
+"""
+
+import copy
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+import urllib.request
+from contextlib import ExitStack
+from datetime import datetime
+
+from dry_run import StubEmbeddingModel, StubIndex
+from ingest_manifest import IngestManifest, default_dead_letter_path, default_manifest_path, delete_vectors, object_key
+from ingest_profile import PipelineProfile, ProfilingIndex, print_report, write_report
+from rate_limiter import (AdaptiveRateLimiter, DEFAULT_INITIAL_RATE, DEFAULT_MAX_RATE, FATAL, THROTTLED,
+                          backoff_delay, classify_error, retry_after_seconds)
+from upsert_buffer import UpsertBuffer, DEFAULT_BATCH_SIZE, DEFAULT_UPSERT_WORKERS
+
+DEFAULT_LOAD_WORKERS = 8
+DEFAULT_EMBED_WORKERS = 16
+DEFAULT_QUEUE_SIZE = 100
+DEFAULT_PROGRESS_INTERVAL_SEC = 10
+LIST_PAGE_SIZE = 1000
+MAX_RETRIES = 8
+
+# Marks the end of a stage's input
+_DONE = object()
+
+
+def _timed(profile, kind, wait, *args):
+    """Returns `wait(*args)`, adding the time it took to the `kind` time of `profile`, if any."""
+    if profile is None:
+        return wait(*args)
+    start = time.perf_counter()
+    try:
+        return wait(*args)
+    finally:
+        profile.add_time(kind, time.perf_counter() - start)
+
+
+class Stage:
+    """
+    A pipeline stage: `workers` threads applying `fn` to the items of a bounded input queue.
+
+    `fn` returns the item to pass on to the next stage, a list of items to pass on each of them,
+    or None to drop it. Throttled and
+    transient errors are retried up to `max_retries` attempts with capped, jittered backoff;
+    other errors fail at once. Failed items are counted and written to `dead_letter`, if given.
+    With a `limiter`, every call to `fn` waits for it and reports back whether it was throttled.
+    With a `profile` (a StageProfile), the latency of every call and the time spent waiting are recorded.
+    """
+
+    def __init__(self, name, fn, workers=1, queue_size=DEFAULT_QUEUE_SIZE, max_retries=1, limiter=None, dead_letter=None):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.max_retries = max_retries
+        self.limiter = limiter
+        self.dead_letter = dead_letter
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.failed = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+        self._running = workers
+        self.profile = None
+
+    def process(self, item):
+        for attempt in range(self.max_retries):
+            if self.limiter:
+                _timed(self.profile, 'throttled', self.limiter.acquire)
+            start = time.perf_counter()
+            try:
+                result = self.fn(item)
+            except Exception as e:
+                if self.profile is not None:
+                    self.profile.record_call(time.perf_counter() - start)
+                kind = classify_error(e)
+                retry_after = retry_after_seconds(e)
+                if self.limiter and kind == THROTTLED:
+                    self.limiter.record_throttled(retry_after)
+                if kind == FATAL or attempt == self.max_retries - 1:
+                    print(f"Failed to {self.name} {item} after {attempt + 1} attempts ({kind}): {e}")
+                    if self.dead_letter:
+                        self.dead_letter.write(self.name, item, e, kind, attempt + 1)
+                    raise
+                with self._lock:
+                    self.retries += 1
+                if kind != THROTTLED:
+                    print(f"Error in {self.name} stage for {item}: {e}, retrying...")
+                _timed(self.profile, 'throttled', time.sleep, backoff_delay(attempt, retry_after))
+                continue
+
+            if self.profile is not None:
+                self.profile.record_call(time.perf_counter() - start)
+            if self.limiter:
+                self.limiter.record_success()
+            return result
+
+
+class DeadLetterFile:
+    """Thread-safe JSON Lines file of the items that failed for good, and why."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def write(self, stage_name, item, error, kind, attempts):
+        record = {
+            'key': getattr(item, 'key', str(item)),
+            'stage': stage_name,
+            'error_type': kind,
+            'error': f'{type(error).__name__}: {error}',
+            'attempts': attempts,
+            'failed_at': datetime.now().isoformat(),
+        }
+        with self._lock:
+            # Only created once something fails
+            if self._file is None:
+                self._file = open(self.path, 'a')
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+            self.count += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                print(f"{self.count} files failed, see {self.path}.")
+
+
+class Pipeline:
+    """
+    Runs `source` (any iterable, consumed lazily in its own thread) through `stages`.
+
+    `run()` blocks until every item has gone through every stage, printing progress every
+    `progress_interval_sec` seconds. With a `profile` (a PipelineProfile), every stage, the
+    source included, records its latencies and waits in it.
+    """
+
+    def __init__(self, source, stages, source_name='list', progress_interval_sec=DEFAULT_PROGRESS_INTERVAL_SEC,
+                 profile=None):
+        self.source = source
+        self.stages = stages
+        self.source_name = source_name
+        self.progress_interval_sec = progress_interval_sec
+        self._source_profile = None
+        if profile is not None:
+            self._source_profile = profile.stage(source_name)
+            for stage in stages:
+                stage.profile = profile.stage(stage.name, stage.workers)
+        self.listed = 0
+        self._source_error = None
+        self._started_at = None
+        self._finished = threading.Event()
+        self._last_counts = None
+        self._last_report_at = None
+
+    def run(self):
+        self._started_at = time.perf_counter()
+        threads = [threading.Thread(target=self._produce, name=self.source_name, daemon=True)]
+        for position, stage in enumerate(self.stages):
+            next_stage = self.stages[position + 1] if position + 1 < len(self.stages) else None
+            for i in range(stage.workers):
+                threads.append(threading.Thread(target=self._work, args=(stage, next_stage), name=f'{stage.name}-{i}', daemon=True))
+        reporter = threading.Thread(target=self._report_progress, name='progress', daemon=True)
+
+        for thread in threads:
+            thread.start()
+        reporter.start()
+        for thread in threads:
+            thread.join()
+        self._finished.set()
+        reporter.join()
+        self.print_progress()
+
+        if self._source_error is not None:
+            raise self._source_error
+
+    def _produce(self):
+        first_queue = self.stages[0].queue
+        try:
+            items = iter(self.source)
+            while True:
+                start = time.perf_counter()
+                item = next(items, _DONE)
+                if item is _DONE:
+                    break
+                if self._source_profile is not None:
+                    self._source_profile.record_call(time.perf_counter() - start)
+                _timed(self._source_profile, 'blocked', first_queue.put, item)
+                self.listed += 1
+        except Exception as e:
+            print(f"Error in {self.source_name} stage: {e}")
+            self._source_error = e
+        finally:
+            first_queue.put(_DONE)
+
+    def _work(self, stage, next_stage):
+        while True:
+            item = _timed(stage.profile, 'idle', stage.queue.get)
+            if item is _DONE:
+                # Let the other workers of this stage see it too; the last one passes it on
+                stage.queue.put(_DONE)
+                with stage._lock:
+                    stage._running -= 1
+                    last = stage._running == 0
+                if last:
+                    stage.queue.get_nowait()
+                    if next_stage is not None:
+                        next_stage.queue.put(_DONE)
+                return
+
+            try:
+                result = stage.process(item)
+            except Exception:
+                with stage._lock:
+                    stage.failed += 1
+                continue
+            with stage._lock:
+                stage.processed += 1
+            if result is not None and next_stage is not None:
+                # A list fans the item out into several items for the next stage (e.g. video windows)
+                for part in (result if isinstance(result, list) else [result]):
+                    _timed(stage.profile, 'blocked', next_stage.queue.put, part)
+
+    def _report_progress(self):
+        while not self._finished.wait(self.progress_interval_sec):
+            self.print_progress()
+
+    def print_progress(self):
+        now = time.perf_counter()
+        counts = [self.listed] + [stage.processed for stage in self.stages]
+        if self._last_counts is None:
+            since, previous = self._started_at, [0] * len(counts)
+        else:
+            since, previous = self._last_report_at, self._last_counts
+        interval = max(now - since, 1e-9)
+        self._last_counts, self._last_report_at = counts, now
+
+        parts = [f"{self.source_name} {counts[0]} ({(counts[0] - previous[0]) / interval:.1f}/s)"]
+        for stage, count, before in zip(self.stages, counts[1:], previous[1:]):
+            part = f"{stage.name} {count} ({(count - before) / interval:.1f}/s) q={stage.queue.qsize()}"
+            if stage.limiter:
+                part += f" {stage.limiter}"
+            if stage.retries:
+                part += f" retries={stage.retries}"
+            if stage.failed:
+                part += f" failed={stage.failed}"
+            parts.append(part)
+        print(f"[{now - self._started_at:7.1f}s] " + " | ".join(parts))
+
+
+class Modality:
+    """
+    How to ingest one kind of file: the file extensions it handles, `load(item)` returning the
+    object passed to the embedding model, and `embed(model, item)` returning the vectors.
+
+    With `split(item)`, called after `load`, a file can be embedded in parts: it returns the
+    `(start_offset_sec, end_offset_sec)` windows of the file, which are embedded concurrently as
+    separate items (`item.window` is set for `embed`) and gathered back before the upsert.
+    """
+
+    def __init__(self, file_type, extensions, load, embed, split=None):
+        self.file_type = file_type
+        self.extensions = extensions
+        self.load = load
+        self.embed = embed
+        self.split = split
+
+    def handles(self, object_name):
+        return object_name.lower().endswith(self.extensions)
+
+
+class IngestItem:
+    """An object from the bucket on its way through the pipeline."""
+
+    def __init__(self, blob, bucket_name, folder_name, modality):
+        self.blob = blob
+        self.bucket_name = bucket_name
+        self.folder_name = folder_name
+        self.key = object_key(bucket_name, blob.name)
+        self.gcs_uri = f'gs://{bucket_name}/{blob.name}'
+        self.file_name = blob.name.replace(f'{folder_name}/', '', 1)
+        self.modality = modality
+        self.content = None
+        self.vectors = None
+        # Set on the parts of a file that is embedded in windows
+        self.window = None
+        self.parent = None
+        self._window_vectors = None
+        self._pending_windows = 0
+
+    def __str__(self):
+        if self.window is not None and self.parent is not None:
+            return f'{self.file_name} [{self.window[0]}-{self.window[1]}s]'
+        return self.file_name
+
+    def split(self, windows):
+        """Returns one item per `(start_offset_sec, end_offset_sec)` window, to be gathered back with `gather`."""
+        self._window_vectors = [None] * len(windows)
+        self._pending_windows = len(windows)
+        parts = []
+        for position, window in enumerate(windows):
+            part = copy.copy(self)
+            part.window = window
+            part.parent = self
+            part.position = position
+            parts.append(part)
+        self.content = None
+        return parts
+
+    def gather(self, part):
+        """Collects the vectors of a window, returns True once every window of the file has been embedded."""
+        self._window_vectors[part.position] = part.vectors
+        self._pending_windows -= 1
+        if self._pending_windows:
+            return False
+        self.vectors = [vector for vectors in self._window_vectors for vector in vectors]
+        self._window_vectors = None
+        return True
+
+
+class PipelineConfig:
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, upsert_workers=DEFAULT_UPSERT_WORKERS,
+                 load_workers=DEFAULT_LOAD_WORKERS, embed_workers=DEFAULT_EMBED_WORKERS,
+                 queue_size=DEFAULT_QUEUE_SIZE, progress_interval_sec=DEFAULT_PROGRESS_INTERVAL_SEC,
+                 manifest_path=None, full=False, prune=False, initial_rate=DEFAULT_INITIAL_RATE,
+                 max_rate=DEFAULT_MAX_RATE, max_retries=MAX_RETRIES, dead_letter_path=None, replica_dir=None,
+                 namespaces=None, refresh_url=None, profile=None, dry_run=False, dry_run_embed_ms=0.0,
+                 dry_run_upsert_ms=0.0):
+        self.batch_size = batch_size
+        self.upsert_workers = upsert_workers
+        self.load_workers = load_workers
+        self.embed_workers = embed_workers
+        self.queue_size = queue_size
+        self.progress_interval_sec = progress_interval_sec
+        self.manifest_path = manifest_path
+        self.full = full
+        self.prune = prune
+        self.initial_rate = initial_rate
+        self.max_rate = max_rate
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path
+        self.replica_dir = replica_dir
+        # Index namespace per file type, the default namespace for the ones not in it
+        self.namespaces = namespaces or {}
+        self.refresh_url = refresh_url
+        # Base path of the profile report, '' for the default one, None not to profile
+        self.profile = profile
+        self.dry_run = dry_run
+        self.dry_run_embed_ms = dry_run_embed_ms
+        self.dry_run_upsert_ms = dry_run_upsert_ms
+
+    @classmethod
+    def from_args(cls, args):
+        return cls(args.batch_size, args.upsert_workers, args.load_workers, args.embed_workers,
+                   args.queue_size, args.progress_interval, args.manifest, args.full, args.prune,
+                   args.initial_rate, args.max_rate, args.max_retries, args.dead_letter, args.replica_dir,
+                   {'image': args.image_namespace, 'video': args.video_namespace}, args.refresh_url,
+                   args.profile, args.dry_run, args.dry_run_embed_ms, args.dry_run_upsert_ms)
+
+
+def add_pipeline_arguments(parser):
+    """Adds the command-line options shared by the processors."""
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Maximum number of vectors per upsert request.')
+    parser.add_argument('--upsert-workers', type=int, default=DEFAULT_UPSERT_WORKERS, help='Number of upsert requests sent concurrently.')
+    parser.add_argument('--load-workers', type=int, default=DEFAULT_LOAD_WORKERS, help='Threads loading files.')
+    parser.add_argument('--embed-workers', type=int, default=DEFAULT_EMBED_WORKERS, help='Threads calling the embedding model.')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help='Maximum files waiting between two stages.')
+    parser.add_argument('--progress-interval', type=float, default=DEFAULT_PROGRESS_INTERVAL_SEC, help='Seconds between progress lines.')
+    parser.add_argument('--manifest', type=str, help='Checkpoint manifest file (default: manifest-<index>-<bucket>-<folder>.jsonl).')
+    parser.add_argument('--full', action='store_true', help='Re-embed every file, including unchanged ones.')
+    parser.add_argument('--prune', action='store_true', help='Delete the vectors of files removed from the bucket since the last run.')
+    parser.add_argument('--initial-rate', type=float, default=DEFAULT_INITIAL_RATE, help='Embedding requests/sec to start at.')
+    parser.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE, help='Maximum embedding requests/sec (e.g. your Vertex AI quota).')
+    parser.add_argument('--max-retries', type=int, default=MAX_RETRIES, help='Attempts per file for throttled and transient errors.')
+    parser.add_argument('--dead-letter', type=str, help='File listing the files that failed (default: dead-letter-<index>-<bucket>-<folder>.jsonl).')
+    parser.add_argument('--replica-dir', type=str, help='Local replica (see export_replica.py) to refresh with the upserted and deleted vectors.')
+    parser.add_argument('--image-namespace', type=str, default=os.getenv('PINECONE_IMAGE_NAMESPACE', ''), help='Index namespace for image vectors (default: $PINECONE_IMAGE_NAMESPACE, or the default namespace).')
+    parser.add_argument('--video-namespace', type=str, default=os.getenv('PINECONE_VIDEO_NAMESPACE', ''), help='Index namespace for video vectors (default: $PINECONE_VIDEO_NAMESPACE, or the default namespace).')
+    parser.add_argument('--refresh-url', type=str, default=os.getenv('INDEX_REFRESH_URL'), help='API endpoint to call when ingestion finishes, e.g. http://localhost:8000/api/index/refresh (default: $INDEX_REFRESH_URL).')
+    parser.add_argument('--profile', type=str, nargs='?', const='', help='Record per-stage latencies, throughput, retries and utilization, and write them to PROFILE.json and PROFILE.csv (default: profile-<index>-<bucket>-<folder>).')
+    parser.add_argument('--dry-run', action='store_true', help='List and load the files, but embed and upsert with stubs: no quota is spent and the index and manifest are left untouched.')
+    parser.add_argument('--dry-run-embed-ms', type=float, default=0.0, help='Simulated latency of the stub embedding calls in a dry run.')
+    parser.add_argument('--dry-run-upsert-ms', type=float, default=0.0, help='Simulated latency of the stub upsert requests in a dry run.')
+
+
+def notify_api(refresh_url):
+    """Asks the API to refresh its cached index statistics (and replica snapshot) at once."""
+    try:
+        with urllib.request.urlopen(urllib.request.Request(refresh_url, data=b'', method='POST'), timeout=30) as response:
+            stats = json.load(response)
+        print(f"Refreshed the API's index statistics: {stats.get('total_vectors')} vectors.")
+    except Exception as e:
+        print(f"Could not refresh the API's index statistics at {refresh_url}: {e}")
+
+
+def write_profile(profile, pipeline, limiter, config, bucket_name, folder_name, index_name=None):
+    """Prints the profile report of a run and writes it to `config.profile` (or the default path) as JSON and CSV."""
+    base_path = config.profile
+    if not base_path:
+        base_path = os.path.splitext(default_manifest_path(bucket_name, folder_name, index_name or 'index', kind='profile'))[0]
+    elif base_path.endswith(('.json', '.csv')):
+        base_path = os.path.splitext(base_path)[0]
+    settings = {name: getattr(config, name) for name in (
+        'load_workers', 'embed_workers', 'upsert_workers', 'batch_size', 'queue_size', 'initial_rate', 'max_rate',
+        'max_retries', 'dry_run', 'dry_run_embed_ms', 'dry_run_upsert_ms')}
+    report = profile.report(pipeline, limiter, settings)
+    print_report(report)
+    json_path, csv_path = write_report(report, base_path)
+    print(f"Wrote the profile to {json_path} and {csv_path}.")
+
+
+def run_ingestion(storage_client, model, index, bucket_name, folder_name, modalities, config, index_name=None):
+    """
+    Lists `folder_name` in the bucket and ingests every file one of `modalities` handles.
+
+    The storage client, model and index are passed in, so the pipeline can also run against
+    other implementations of their `list_blobs`, `get_embeddings` and `upsert`/`delete` methods.
+    In a dry run, the model and index are replaced by stubs and may be None, and every file is
+    processed against an empty, temporary manifest.
+    """
+    manifest_path = config.manifest_path or default_manifest_path(bucket_name, folder_name, index_name or 'index')
+    dead_letter_path = config.dead_letter_path or default_dead_letter_path(bucket_name, folder_name, index_name or 'index')
+    dry_run_dir = None
+    if config.dry_run:
+        print("Dry run: embedding and upserting with stubs, the index and the manifest are not changed.")
+        model, index = StubEmbeddingModel(config.dry_run_embed_ms), StubIndex(config.dry_run_upsert_ms)
+        dry_run_dir = tempfile.TemporaryDirectory(prefix='dry-run-')
+        manifest_path = os.path.join(dry_run_dir.name, 'manifest.jsonl')
+        if not config.dead_letter_path:
+            dead_letter_path = f'dry-run-{dead_letter_path}'
+    dead_letter = DeadLetterFile(dead_letter_path)
+    limiter = AdaptiveRateLimiter(initial_rate=config.initial_rate, max_rate=config.max_rate)
+    namespaces = {modality.file_type: config.namespaces.get(modality.file_type, '') for modality in modalities}
+    listed_keys = set()
+
+    # The replica capture of each namespace written to that has a snapshot
+    captures = {}
+    if config.replica_dir and not config.dry_run:
+        # Requires numpy, so it is only imported when a replica is refreshed
+        from replica_snapshot import CapturingIndex, ReplicaCapture, current_snapshot_path, namespace_dir
+        for namespace in sorted(set(namespaces.values())):
+            directory = namespace_dir(config.replica_dir, namespace)
+            if current_snapshot_path(directory) is None:
+                print(f"No replica snapshot of namespace '{namespace}' in {config.replica_dir}, create one with "
+                      f"export_replica.py. It is not refreshed.")
+            else:
+                captures[namespace] = ReplicaCapture(directory)
+        if captures:
+            index = CapturingIndex(index, captures)
+
+    profile = None
+    if config.profile is not None:
+        profile = PipelineProfile()
+        index = ProfilingIndex(index, profile, config.upsert_workers)
+
+    with IngestManifest(manifest_path) as manifest:
+        def list_changed():
+            # Iterating the listing fetches one page at a time
+            for blob in storage_client.list_blobs(bucket_name, prefix=folder_name, page_size=LIST_PAGE_SIZE):
+                modality = next((modality for modality in modalities if modality.handles(blob.name)), None)
+                if modality is None:
+                    continue
+                listed_keys.add(object_key(bucket_name, blob.name))
+                if manifest.is_changed(bucket_name, blob, config.full):
+                    yield IngestItem(blob, bucket_name, folder_name, modality)
+
+        def load(item):
+            item.content = item.modality.load(item)
+            if item.modality.split is not None:
+                windows = item.modality.split(item)
+                if len(windows) > 1:
+                    return item.split(windows)
+                item.window = windows[0] if windows else None
+            return item
+
+        def embed(item):
+            item.vectors = item.modality.embed(model, item)
+            item.content = None
+            return item
+
+        with ExitStack() as stack:
+            # One buffer per namespace, modalities sharing a namespace share its batches
+            upsert_buffers = {}
+            for namespace in sorted(set(namespaces.values())):
+                upsert_buffers[namespace] = stack.enter_context(UpsertBuffer(
+                    index, batch_size=config.batch_size, max_workers=config.upsert_workers,
+                    on_upserted=manifest.record_upserted_ids, namespace=namespace))
+
+            def upsert(item):
+                if item.parent is not None:
+                    # Windows are upserted together once the whole file is embedded (this stage has a
+                    # single worker). A file with a failed window is not recorded in the manifest, so
+                    # it is embedded again on the next run.
+                    if not item.parent.gather(item):
+                        return
+                    item = item.parent
+                namespace = namespaces[item.modality.file_type]
+                ids = [vector['id'] for vector in item.vectors]
+                # IDs the object no longer produces (e.g. segments of a shortened video) are deleted
+                stale_ids = set(manifest.previous_ids(item.key)) - set(ids)
+                manifest.record_embedded(item.key, item.blob.generation, item.blob.etag, ids)
+                upsert_buffers[namespace].add(item.vectors)
+                if stale_ids:
+                    delete_vectors(index, stale_ids, namespace)
+
+            pipeline = Pipeline(list_changed(), [
+                Stage('load', load, config.load_workers, config.queue_size, config.max_retries, dead_letter=dead_letter),
+                Stage('embed', embed, config.embed_workers, config.queue_size, config.max_retries, limiter, dead_letter),
+                Stage('upsert', upsert, 1, config.queue_size, dead_letter=dead_letter),
+            ], progress_interval_sec=config.progress_interval_sec, profile=profile)
+            if profile is not None:
+                profile.start()
+            try:
+                pipeline.run()
+            finally:
+                dead_letter.close()
+
+        if profile is not None:
+            # After the upsert buffers are flushed, so the last upserts are in the report
+            profile.finish()
+            write_profile(profile, pipeline, limiter, config, bucket_name, folder_name, index_name)
+
+        if config.prune and not config.dry_run:
+            removed = sum(manifest.remove_missing(index, bucket_name, f'{folder_name}/', listed_keys, modality.extensions,
+                                                  namespaces[modality.file_type]) for modality in modalities)
+            print(f"Deleted the vectors of {removed} files no longer in the bucket.")
+
+    for namespace, capture in captures.items():
+        count = capture.apply()
+        if count is not None:
+            print(f"Refreshed namespace '{namespace}' of the replica in {config.replica_dir}: {capture.upserted} vectors "
+                  f"upserted, {len(capture.deleted_ids)} deleted, {count} in total.")
+
+    if config.refresh_url and not config.dry_run:
+        notify_api(config.refresh_url)
+
+    if dry_run_dir is not None:
+        dry_run_dir.cleanup()
+    return pipeline
+
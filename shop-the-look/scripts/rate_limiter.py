@@ -0,0 +1,142 @@
+"""
+Adaptive Rate Limiting for Vertex AI Calls
+
+Shared by the embedding stage of the ingestion pipeline. `AdaptiveRateLimiter` paces requests
+to a target rate and adjusts it with AIMD (additive increase, multiplicative decrease): every
+success raises the rate a little, every quota rejection (HTTP 429) cuts it, and a Retry-After
+pauses all workers. Until the first rejection the rate doubles every second (slow start), so it
+finds the quota quickly. The rate then settles just under the quota instead of workers
+hammering it and retrying in lockstep.
+
+Errors are classified so that only throttling and transient failures are retried (with capped,
+jittered exponential backoff); everything else fails fast.
+"""
+
+import random
+import threading
+import time
+
+THROTTLED = 'throttled'
+RETRYABLE = 'retryable'
+FATAL = 'fatal'
+
+RETRYABLE_STATUS_CODES = (408, 500, 502, 503, 504)
+THROTTLED_MESSAGES = ('quota', 'rate limit', 'resource exhausted', 'resource_exhausted', 'too many requests')
+
+DEFAULT_INITIAL_RATE = 20.0
+DEFAULT_MIN_RATE = 1.0
+DEFAULT_MAX_RATE = 200.0
+ADDITIVE_INCREASE = 5.0
+MULTIPLICATIVE_DECREASE = 0.7
+# 429s for requests already in flight when the quota was hit arrive together, and only count once
+DECREASE_COOLDOWN_SEC = 1.0
+BACKOFF_BASE_SEC = 1.0
+MAX_BACKOFF_SEC = 60.0
+
+
+def status_code(error):
+    """The HTTP status of an error raised by the Google client libraries or an HTTP client, if any."""
+    for value in (getattr(error, 'code', None), getattr(error, 'status_code', None),
+                  getattr(getattr(error, 'response', None), 'status_code', None)):
+        if isinstance(value, int):
+            return int(value)
+    return None
+
+
+def retry_after_seconds(error):
+    """The delay the server asked for, from a Retry-After header or a gRPC RetryInfo detail."""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if headers:
+        value = headers.get('Retry-After')
+        try:
+            return max(0.0, float(value))
+        except (TypeError, ValueError):
+            pass
+    for detail in getattr(error, 'details', None) or []:
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+    return None
+
+
+def classify_error(error):
+    """Returns THROTTLED, RETRYABLE or FATAL for an exception raised by an embedding call."""
+    code = status_code(error)
+    if code == 429:
+        return THROTTLED
+    if code in RETRYABLE_STATUS_CODES:
+        return RETRYABLE
+    if code is not None and 400 <= code < 500:
+        return FATAL
+    message = str(error).lower()
+    if any(text in message for text in THROTTLED_MESSAGES):
+        return THROTTLED
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return RETRYABLE
+    if isinstance(error, (ValueError, TypeError, KeyError, FileNotFoundError)):
+        return FATAL
+    return RETRYABLE
+
+
+def backoff_delay(attempt, retry_after=None, base_sec=BACKOFF_BASE_SEC, max_sec=MAX_BACKOFF_SEC):
+    """Capped exponential backoff with full jitter, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(max_sec, base_sec * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, max_sec))
+    return delay
+
+
+class AdaptiveRateLimiter:
+    """
+    Thread-safe AIMD rate limiter.
+
+    `acquire()` blocks until the caller may send its next request. Report the outcome with
+    `record_success()` or `record_throttled(retry_after)`. Until the first 429 the rate doubles
+    every second; after that it grows by about `additive_increase` requests/sec every second
+    while requests succeed. It is multiplied by `decrease_factor` on a 429, at most once per
+    `DECREASE_COOLDOWN_SEC`, and a Retry-After holds back every caller until it has passed.
+    """
+
+    def __init__(self, initial_rate=DEFAULT_INITIAL_RATE, min_rate=DEFAULT_MIN_RATE, max_rate=DEFAULT_MAX_RATE,
+                 additive_increase=ADDITIVE_INCREASE, decrease_factor=MULTIPLICATIVE_DECREASE):
+        self.rate = min(max(initial_rate, min_rate), max_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.additive_increase = additive_increase
+        self.decrease_factor = decrease_factor
+        self._lock = threading.Lock()
+        self._next_send_at = 0.0
+        self._paused_until = 0.0
+        self._last_decrease_at = 0.0
+        self._slow_start = True
+        self.requests = 0
+        self.throttled = 0
+
+    def acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            send_at = max(now, self._next_send_at, self._paused_until)
+            self._next_send_at = send_at + 1.0 / self.rate
+            self.requests += 1
+        if send_at > now:
+            time.sleep(send_at - now)
+
+    def record_success(self):
+        with self._lock:
+            # About `rate` successes per second, so this adds `rate` (slow start) or `additive_increase` per second
+            increase = 1.0 if self._slow_start else self.additive_increase / self.rate
+            self.rate = min(self.max_rate, self.rate + increase)
+
+    def record_throttled(self, retry_after=None):
+        with self._lock:
+            now = time.monotonic()
+            self.throttled += 1
+            self._slow_start = False
+            if now - self._last_decrease_at >= DECREASE_COOLDOWN_SEC:
+                self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+                self._last_decrease_at = now
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def __str__(self):
+        return f"rate={self.rate:.1f}/s throttled={self.throttled}"
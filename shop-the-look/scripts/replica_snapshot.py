@@ -0,0 +1,346 @@
+"""
+Local Vector Replica Snapshots
+
+Snapshots of the index that the API can search in memory instead of querying Pinecone (see
+`api/replica.py`, which reads the same format). A replica directory holds one subdirectory
+per index namespace (`__default__` for the default namespace), each with its snapshot
+directories and a `CURRENT` file naming the one in use, so a new snapshot is switched to
+atomically while the API keeps serving from the previous one. A snapshot holds:
+
+- manifest.json: format version, row count, dimension, dtype, metric, index namespace and creation time
+- vectors.f32 or vectors.i8: the row-major vector matrix, L2-normalized for a cosine index so a
+  dot product is the cosine similarity, as they are for a dotproduct index; int8 snapshots also have scales.f32 with the dequantization scale of each row
+- metadata.json: the vector IDs and their metadata as columns, with repetitive string columns
+  (such as `gcs_file_path` and `file_type`) dictionary-encoded
+
+Snapshots are written by `export_replica.py` and refreshed with the vectors the ingestion
+pipeline upserts and deletes (`--replica-dir`).
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+FORMAT_VERSION = 1
+CURRENT_FILE = 'CURRENT'
+# Subdirectory of the default namespace, whose name is empty
+DEFAULT_NAMESPACE_DIR = '__default__'
+MANIFEST_FILE = 'manifest.json'
+METADATA_FILE = 'metadata.json'
+SCALES_FILE = 'scales.f32'
+VECTOR_FILES = {'float32': 'vectors.f32', 'int8': 'vectors.i8'}
+# Index metrics the replica ranks like Pinecone, both by dot product
+SUPPORTED_METRICS = ('cosine', 'dotproduct')
+# Snapshots kept besides the current one, for API workers still reading an older one
+KEEP_PREVIOUS = 1
+
+
+def namespace_dir(replica_dir, namespace):
+    """Returns the directory holding the snapshots of an index namespace."""
+    return os.path.join(replica_dir, namespace or DEFAULT_NAMESPACE_DIR)
+
+
+def current_snapshot_path(replica_dir):
+    """Returns the directory of the current snapshot, or None if there is none."""
+    try:
+        with open(os.path.join(replica_dir, CURRENT_FILE)) as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return os.path.join(replica_dir, name) if name else None
+
+
+def encode_columns(rows):
+    """Turns a list of metadata dicts into columns, dictionary-encoding the repetitive string ones."""
+    keys = sorted({key for row in rows for key in row})
+    columns = {}
+    for key in keys:
+        values = [row.get(key) for row in rows]
+        distinct = set(value for value in values if value is not None)
+        if all(isinstance(value, str) for value in distinct) and 0 < len(distinct) <= len(values) // 2:
+            dictionary = sorted(distinct)
+            codes = {value: i for i, value in enumerate(dictionary)}
+            columns[key] = {'dictionary': dictionary, 'codes': [codes.get(value, -1) for value in values]}
+        else:
+            columns[key] = {'values': values}
+    return columns
+
+
+def decode_columns(columns, count):
+    """Inverse of `encode_columns`, returns one metadata dict per row without the missing values."""
+    rows = [{} for _ in range(count)]
+    for key, column in columns.items():
+        if 'dictionary' in column:
+            dictionary = column['dictionary']
+            values = (dictionary[code] if code >= 0 else None for code in column['codes'])
+        else:
+            values = column['values']
+        for row, value in zip(rows, values):
+            if value is not None:
+                row[key] = value
+    return rows
+
+
+class SnapshotWriter:
+    """
+    Writes a new snapshot row by row, and makes it current when closed without an error.
+
+    Vectors are normalized and, with `dtype='int8'`, quantized per row as they are added, and
+    streamed to disk so the matrix is never held in memory as a whole.
+    """
+
+    def __init__(self, replica_dir, dimension, dtype='float32', metric='cosine', source=None, namespace=''):
+        if dtype not in VECTOR_FILES:
+            raise ValueError(f"Unsupported replica dtype: {dtype}")
+        if metric not in SUPPORTED_METRICS:
+            raise ValueError(f"The replica does not support the {metric} metric, only {', '.join(SUPPORTED_METRICS)}")
+        os.makedirs(replica_dir, exist_ok=True)
+        self.replica_dir = replica_dir
+        self.dimension = dimension
+        self.dtype = dtype
+        self.metric = metric
+        self.source = source
+        self.namespace = namespace
+        self.name = 'snapshot-' + datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+        self.path = os.path.join(replica_dir, self.name)
+        os.makedirs(self.path)
+        self._vectors = open(os.path.join(self.path, VECTOR_FILES[dtype]), 'wb')
+        self._scales = open(os.path.join(self.path, SCALES_FILE), 'wb') if dtype == 'int8' else None
+        self.ids = []
+        self.metadata = []
+
+    def add(self, id, values, metadata=None):
+        vector = np.asarray(values, dtype=np.float32)
+        if vector.shape != (self.dimension,):
+            raise ValueError(f"Vector {id} has {vector.size} dimensions, expected {self.dimension}")
+        norm = float(np.linalg.norm(vector))
+        if self.metric == 'cosine' and norm > 0:
+            vector = vector / norm
+        if self.dtype == 'int8':
+            scale = float(np.abs(vector).max()) / 127 or 1.0
+            self._vectors.write(np.round(vector / scale).astype(np.int8).tobytes())
+            self._scales.write(np.float32(scale).tobytes())
+        else:
+            self._vectors.write(vector.tobytes())
+        self.ids.append(id)
+        self.metadata.append(metadata or {})
+
+    def add_rows(self, ids, vectors, metadata):
+        """Adds rows already normalized (and, for int8, quantized) by another snapshot of the same dtype."""
+        self._vectors.write(np.ascontiguousarray(vectors).tobytes())
+        self.ids.extend(ids)
+        self.metadata.extend(metadata)
+
+    def add_scales(self, scales):
+        self._scales.write(np.ascontiguousarray(scales, dtype=np.float32).tobytes())
+
+    def close(self):
+        self._vectors.close()
+        if self._scales is not None:
+            self._scales.close()
+        with open(os.path.join(self.path, METADATA_FILE), 'w') as f:
+            json.dump({'ids': self.ids, 'columns': encode_columns(self.metadata)}, f, separators=(',', ':'))
+        with open(os.path.join(self.path, MANIFEST_FILE), 'w') as f:
+            json.dump({
+                'format': FORMAT_VERSION,
+                'count': len(self.ids),
+                'dimension': self.dimension,
+                'dtype': self.dtype,
+                'metric': self.metric,
+                'source': self.source,
+                'namespace': self.namespace,
+                'created_at': datetime.now(timezone.utc).isoformat(),
+            }, f, indent=2)
+
+        # Switch atomically, readers see either the old or the new snapshot
+        fd, temp_path = tempfile.mkstemp(dir=self.replica_dir, prefix='.current-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(self.name)
+        os.replace(temp_path, os.path.join(self.replica_dir, CURRENT_FILE))
+        remove_old_snapshots(self.replica_dir, self.name)
+
+    def abort(self):
+        self._vectors.close()
+        if self._scales is not None:
+            self._scales.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def remove_old_snapshots(replica_dir, current_name):
+    snapshots = sorted(name for name in os.listdir(replica_dir) if name.startswith('snapshot-') and name != current_name)
+    for name in snapshots[:max(0, len(snapshots) - KEEP_PREVIOUS)]:
+        shutil.rmtree(os.path.join(replica_dir, name), ignore_errors=True)
+
+
+class Snapshot:
+    """A snapshot opened for reading, with its vectors memory-mapped."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        if self.manifest['format'] != FORMAT_VERSION:
+            raise ValueError(f"Unsupported replica snapshot format {self.manifest['format']} in {path}")
+        self.count = self.manifest['count']
+        self.dimension = self.manifest['dimension']
+        self.dtype = self.manifest['dtype']
+        self.namespace = self.manifest.get('namespace', '')
+        self.vectors = np.memmap(os.path.join(path, VECTOR_FILES[self.dtype]), dtype=self.dtype, mode='r',
+                                 shape=(self.count, self.dimension)) if self.count else np.zeros((0, self.dimension), self.dtype)
+        self.scales = None
+        if self.dtype == 'int8':
+            self.scales = np.fromfile(os.path.join(path, SCALES_FILE), dtype=np.float32)
+        with open(os.path.join(path, METADATA_FILE)) as f:
+            table = json.load(f)
+        self.ids = table['ids']
+        self.metadata = decode_columns(table['columns'], self.count)
+
+    @classmethod
+    def open_current(cls, replica_dir):
+        path = current_snapshot_path(replica_dir)
+        return cls(path) if path else None
+
+
+def merge_snapshot(replica_dir, upserts, deleted_ids, dtype=None, source=None):
+    """
+    Writes a new snapshot from the current one with `upserts` applied and `deleted_ids` removed.
+
+    :param upserts: An iterable of `(id, values, metadata)`, later ones win for repeated IDs
+    :param deleted_ids: IDs to remove, including from `upserts`
+    :param dtype: The dtype of the new snapshot, by default that of the current one
+    :return: The number of rows in the new snapshot
+    """
+    current = Snapshot.open_current(replica_dir)
+    if current is None:
+        raise FileNotFoundError(f"There is no replica snapshot in {replica_dir}, create one with export_replica.py")
+
+    latest = {}
+    for id, values, metadata in upserts:
+        latest[id] = (values, metadata)
+    deleted_ids = set(deleted_ids)
+    dropped = deleted_ids | set(latest)
+    dtype = dtype or current.dtype
+
+    with SnapshotWriter(replica_dir, current.dimension, dtype, current.manifest['metric'],
+                        source or current.manifest.get('source'), current.namespace) as writer:
+        keep = np.array([id not in dropped for id in current.ids], dtype=bool)
+        if dtype == current.dtype:
+            # Unchanged rows are copied as they are, in blocks
+            block = 65536
+            for start in range(0, current.count, block):
+                mask = keep[start:start + block]
+                rows = np.flatnonzero(mask) + start
+                writer.add_rows([current.ids[i] for i in rows], current.vectors[rows], [current.metadata[i] for i in rows])
+                if current.scales is not None:
+                    writer.add_scales(current.scales[rows])
+        else:
+            for i in np.flatnonzero(keep):
+                values = current.vectors[i].astype(np.float32)
+                if current.scales is not None:
+                    values = values * current.scales[i]
+                writer.add(current.ids[i], values, current.metadata[i])
+        for id, (values, metadata) in latest.items():
+            if id not in deleted_ids:
+                writer.add(id, values, metadata)
+    return len(writer.ids)
+
+
+class ReplicaCapture:
+    """
+    Records the vectors the ingestion pipeline upserts and deletes, to refresh the replica with.
+
+    Upserted vectors are spilled to temporary files as they arrive, so a large run does not keep
+    them in memory. `apply` merges them into the current snapshot once ingestion is done. A
+    capture refreshes the snapshot of one namespace directory (see `namespace_dir`).
+    """
+
+    def __init__(self, replica_dir, spill_dir=None):
+        self.replica_dir = replica_dir
+        self.namespace = ''
+        path = current_snapshot_path(replica_dir)
+        if path:
+            with open(os.path.join(path, MANIFEST_FILE)) as f:
+                self.namespace = json.load(f).get('namespace', '')
+        self._dir = tempfile.mkdtemp(prefix='replica-capture-', dir=spill_dir)
+        self._vectors = open(os.path.join(self._dir, 'vectors.f32'), 'wb')
+        self._records = open(os.path.join(self._dir, 'records.jsonl'), 'w')
+        self._lock = threading.Lock()
+        self.dimension = None
+        self.upserted = 0
+        self.deleted_ids = set()
+
+    def record_upserted(self, vectors):
+        with self._lock:
+            for vector in vectors:
+                values = np.asarray(vector['values'], dtype=np.float32)
+                self.dimension = self.dimension or values.size
+                self._vectors.write(values.tobytes())
+                self._records.write(json.dumps({'id': vector['id'], 'metadata': vector.get('metadata') or {}}) + '\n')
+                self.deleted_ids.discard(vector['id'])
+                self.upserted += 1
+
+    def record_deleted(self, ids):
+        with self._lock:
+            self.deleted_ids.update(ids)
+
+    def _captured(self):
+        vectors = np.memmap(os.path.join(self._dir, 'vectors.f32'), dtype=np.float32, mode='r', shape=(self.upserted, self.dimension))
+        with open(os.path.join(self._dir, 'records.jsonl')) as f:
+            for i, line in enumerate(f):
+                record = json.loads(line)
+                yield record['id'], vectors[i], record['metadata']
+
+    def apply(self):
+        """Merges the captured changes into the current snapshot and returns its new row count."""
+        self._vectors.close()
+        self._records.close()
+        try:
+            if not self.upserted and not self.deleted_ids:
+                return None
+            upserts = self._captured() if self.upserted else []
+            return merge_snapshot(self.replica_dir, upserts, self.deleted_ids)
+        finally:
+            shutil.rmtree(self._dir, ignore_errors=True)
+
+
+class CapturingIndex:
+    """
+    Wraps an index so the vectors upserted and deleted through it are recorded in the
+    `ReplicaCapture` of their namespace. `captures` maps namespaces to captures, changes to other
+    namespaces are not recorded.
+    """
+
+    def __init__(self, index, captures):
+        self.index = index
+        self.captures = captures
+
+    def upsert(self, vectors, **kwargs):
+        response = self.index.upsert(vectors=vectors, **kwargs)
+        capture = self.captures.get(kwargs.get('namespace') or '')
+        if capture is not None:
+            capture.record_upserted(vectors)
+        return response
+
+    def delete(self, ids, **kwargs):
+        response = self.index.delete(ids=ids, **kwargs)
+        capture = self.captures.get(kwargs.get('namespace') or '')
+        if capture is not None:
+            capture.record_deleted(ids)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self.index, name)
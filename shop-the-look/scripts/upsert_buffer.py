@@ -0,0 +1,129 @@
+"""
+Batched Pinecone Upserts
+
+Shared by the image and video embedding processors. Worker threads add vectors to a single
+UpsertBuffer, which groups them into batches bounded by vector count and request size and
+upserts the batches concurrently through a small bounded thread pool.
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Pinecone accepts at most 1000 vectors and 2 MB per upsert request
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_BATCH_BYTES = 2 * 1024 * 1024
+DEFAULT_UPSERT_WORKERS = 4
+MAX_RETRIES = 5
+MAX_BACKOFF_SEC = 30
+
+
+def estimate_vector_bytes(vector):
+    """Rough upper bound of the JSON size of a vector in an upsert request."""
+    metadata_bytes = len(json.dumps(vector.get('metadata', {})))
+    return len(vector['id']) + 24 * len(vector['values']) + metadata_bytes + 64
+
+
+class UpsertBuffer:
+    """
+    Thread-safe buffer that upserts vectors to Pinecone in size-bounded batches.
+
+    Use it as a context manager so the last partial batch is flushed and all in-flight
+    batches are waited for on exit, including when processing stops on an error.
+    `on_upserted`, if given, is called with the IDs of every successfully upserted batch.
+    Vectors are upserted into `namespace`, or the index's default namespace if it is empty.
+    """
+
+    def __init__(self, index, batch_size=DEFAULT_BATCH_SIZE, max_batch_bytes=DEFAULT_MAX_BATCH_BYTES,
+                 max_workers=DEFAULT_UPSERT_WORKERS, max_retries=MAX_RETRIES, on_upserted=None, namespace=None):
+        self.index = index
+        self.namespace = namespace
+        self.on_upserted = on_upserted
+        self.batch_size = batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._batch = []
+        self._batch_bytes = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='upsert')
+        # Bounds the batches waiting for the pool, so producers slow down instead of piling up memory
+        self._slots = threading.BoundedSemaphore(max_workers * 2)
+        self._started_at = None
+        self.vectors_upserted = 0
+        self.batches_upserted = 0
+        self.vectors_failed = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def add(self, vectors):
+        """Adds vectors to the buffer, flushing a batch whenever it reaches the count or size bound."""
+        for vector in vectors:
+            vector_bytes = estimate_vector_bytes(vector)
+            with self._lock:
+                if self._started_at is None:
+                    self._started_at = time.perf_counter()
+                if self._batch and (len(self._batch) >= self.batch_size or self._batch_bytes + vector_bytes > self.max_batch_bytes):
+                    batch = self._take_batch()
+                else:
+                    batch = None
+                self._batch.append(vector)
+                self._batch_bytes += vector_bytes
+            if batch:
+                self._submit(batch)
+
+    def flush(self):
+        """Submits the current partial batch, if any."""
+        with self._lock:
+            batch = self._take_batch()
+        if batch:
+            self._submit(batch)
+
+    def close(self):
+        """Flushes the buffer, waits for all batches to finish and prints the upsert throughput."""
+        self.flush()
+        self._executor.shutdown(wait=True)
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        throughput = self.vectors_upserted / elapsed if elapsed else 0.0
+        target = f" into namespace '{self.namespace}'" if self.namespace else ""
+        print(f"Upserted {self.vectors_upserted} vectors{target} in {self.batches_upserted} batches "
+              f"({throughput:.1f} vectors/sec), {self.vectors_failed} vectors failed.")
+
+    def _take_batch(self):
+        batch = self._batch
+        self._batch = []
+        self._batch_bytes = 0
+        return batch
+
+    def _submit(self, batch):
+        self._slots.acquire()
+        future = self._executor.submit(self._upsert, batch)
+        future.add_done_callback(lambda _: self._slots.release())
+
+    def _upsert(self, batch):
+        kwargs = {'namespace': self.namespace} if self.namespace else {}
+        for attempt in range(self.max_retries):
+            try:
+                self.index.upsert(vectors=batch, **kwargs)
+            except Exception as e:
+                if attempt < self.max_retries - 1:
+                    wait_time = min(MAX_BACKOFF_SEC, 2 ** attempt)
+                    print(f"Error upserting batch of {len(batch)} vectors: {e}, retrying in {wait_time} seconds...")
+                    time.sleep(wait_time)
+                    continue
+                print(f"Failed to upsert batch of {len(batch)} vectors after {self.max_retries} attempts: {e}")
+                with self._lock:
+                    self.vectors_failed += len(batch)
+                return
+
+            with self._lock:
+                self.vectors_upserted += len(batch)
+                self.batches_upserted += 1
+            if self.on_upserted:
+                self.on_upserted([vector['id'] for vector in batch])
+            return
@@ -25,9 +25,7 @@ python video_embedding_processor.py -p your-gc-project-id -b your-gcs-bucket-nam
 import argparse
 import base64
 import os
-import uuid
-import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import shutil
 from datetime import datetime
 
 import vertexai
@@ -35,10 +33,13 @@ from vertexai.vision_models import MultiModalEmbeddingModel, Video
 from google.cloud import storage
 from pinecone import Pinecone
 
+from ingest_manifest import vector_id
+from pipeline import Modality, PipelineConfig, add_pipeline_arguments, run_ingestion
+from video_windows import MAX_WINDOW_SEC, plan_windows, probe_video
+
 # Constants
 REGION = 'us-central1'
 FILE_TYPE = 'video'
-MAX_RETRIES = 5
 SUPPORTED_VIDEO_FORMATS = ('mov', 'mp4', 'avi', 'flv', 'mkv', 'mpeg', 'mpg', 'webm', 'wmv')
 
 # Video embedding settings
@@ -64,98 +65,104 @@ def setup_google_credentials():
     else:
         print("Warning: GOOGLE_CREDENTIALS_BASE64 environment variable not set.")
 
-def process_video(video_file, bucket_name, prefix, model, index, file_path, video_index, total_videos):
-    """Process a single video file, generate embeddings, and upsert to Pinecone."""
-    gcs_uri = f'gs://{bucket_name}/{prefix}/{video_file}'
-
-    for attempt in range(MAX_RETRIES):
-        try:
-            video = Video.load_from_file(gcs_uri)
-            video_segment_config = VideoSegmentConfig(
-                interval_sec=INTERVAL_SEC,
-                start_offset_sec=START_OFFSET_SEC,
-                end_offset_sec=END_OFFSET_SEC
-            )
-
-            embeddings = model.get_embeddings(
-                video=video,
-                video_segment_config=video_segment_config,
-            )
-
-            print(f"Received embeddings for: {video_file} ({video_index}/{total_videos})")
-
-            for video_embedding in embeddings.video_embeddings:
-                vector = [{
-                    'id': str(uuid.uuid4()),
-                    'values': video_embedding.embedding,
-                    'metadata': {
-                        'date_added': datetime.now().isoformat(),
-                        'file_type': FILE_TYPE,
-                        'gcs_file_path': file_path,
-                        'gcs_file_name': video_file,
-                        'segment': video_embedding.start_offset_sec // INTERVAL_SEC,
-                        'start_offset_sec': video_embedding.start_offset_sec,
-                        'end_offset_sec': video_embedding.end_offset_sec,
-                        'interval_sec': video_embedding.end_offset_sec - video_embedding.start_offset_sec,
-                    }
-                }]
-                index.upsert(vector)
-
-            print(f"Processed and upserted: {video_file} ({video_index}/{total_videos})")
-            return  # Exit function if successful
-        except Exception as e:
-            print(f"Error processing file {video_file}: {e}")
-            if attempt < MAX_RETRIES - 1:
-                wait_time = 5 ** (attempt + 1)  # Exponential backoff
-                print(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                print(f"Failed to process file {video_file} after {MAX_RETRIES} attempts.")
-
-def main(gc_project_id, gcs_bucket_name, gcs_folder_name, pinecone_index_name):
+def load_video(item):
+    """Load a video file for the embedding model."""
+    return Video.load_from_file(item.gcs_uri)
+
+def embed_video(model, item, interval_sec=INTERVAL_SEC):
+    """Generate embeddings for the segments of a video, or of one window of it, and build their vectors."""
+    # The window is requested as offsets into the whole video, so the model reports absolute offsets
+    start_offset_sec, end_offset_sec = item.window or (START_OFFSET_SEC, END_OFFSET_SEC)
+    video_segment_config = VideoSegmentConfig(
+        interval_sec=interval_sec,
+        start_offset_sec=start_offset_sec,
+        end_offset_sec=end_offset_sec
+    )
+
+    embeddings = model.get_embeddings(
+        video=item.content,
+        video_segment_config=video_segment_config,
+    )
+
+    file_path = f'{item.bucket_name}/{item.folder_name}/'
+    vectors = []
+    for video_embedding in embeddings.video_embeddings:
+        vectors.append({
+            'id': vector_id(item.bucket_name, item.blob.name, video_embedding.start_offset_sec),
+            'values': video_embedding.embedding,
+            'metadata': {
+                'date_added': datetime.now().isoformat(),
+                'file_type': FILE_TYPE,
+                'gcs_file_path': file_path,
+                'gcs_file_name': item.file_name,
+                'segment': video_embedding.start_offset_sec // interval_sec,
+                'start_offset_sec': video_embedding.start_offset_sec,
+                'end_offset_sec': video_embedding.end_offset_sec,
+                'interval_sec': video_embedding.end_offset_sec - video_embedding.start_offset_sec,
+            }
+        })
+    return vectors
+
+def video_modality(full_length=False, window_sec=MAX_WINDOW_SEC, interval_sec=INTERVAL_SEC):
+    """
+    Returns the video Modality for the given embedding settings.
+
+    By default only the first END_OFFSET_SEC seconds of a video are embedded, in one request. With
+    `full_length`, the duration of every video is probed with ffprobe and the whole video is split
+    into windows of `window_sec`, which the pipeline embeds concurrently.
+    """
+    if not 0 < window_sec <= MAX_WINDOW_SEC:
+        raise ValueError(f"The window length must be between 1 and {MAX_WINDOW_SEC} seconds")
+    if interval_sec <= 0 or interval_sec > window_sec:
+        raise ValueError("The segment length must be positive and no longer than the window")
+    if full_length and shutil.which('ffprobe') is None:
+        raise ValueError("ffprobe was not found, install ffmpeg to embed full-length videos")
+
+    def embed(model, item):
+        return embed_video(model, item, interval_sec)
+
+    def split(item):
+        return plan_windows(probe_video(item), window_sec, interval_sec)
+
+    return Modality(FILE_TYPE, SUPPORTED_VIDEO_FORMATS, load_video, embed, split if full_length else None)
+
+VIDEO_MODALITY = video_modality()
+
+def add_video_arguments(parser):
+    """Adds the command-line options of the video embedding settings."""
+    parser.add_argument('--full-length', action='store_true', help=f'Embed whole videos, split into windows embedded concurrently, instead of their first {END_OFFSET_SEC} seconds (requires ffprobe).')
+    parser.add_argument('--window-sec', type=int, default=MAX_WINDOW_SEC, help=f'Length of the windows videos are split into with --full-length (at most {MAX_WINDOW_SEC}).')
+    parser.add_argument('--segment-sec', type=int, default=INTERVAL_SEC, help='Length of the video segments embedded as one vector.')
+
+def video_modality_from_args(parser, args):
+    try:
+        return video_modality(args.full_length, args.window_sec, args.segment_sec)
+    except ValueError as e:
+        parser.error(str(e))
+
+def main(gc_project_id, gcs_bucket_name, gcs_folder_name, pinecone_index_name, config=None, modality=VIDEO_MODALITY):
     """Main function to process videos from GCS and upsert embeddings to Pinecone."""
     setup_google_credentials()
 
-    # Initialize Pinecone
-    api_key = os.getenv('PINECONE_API_KEY')
-    if not api_key:
-        raise ValueError("PINECONE_API_KEY environment variable is not set.")
-    pc = Pinecone(api_key=api_key, source_tag="pinecone:stl_sample_app")
-    index = pc.Index(pinecone_index_name)
+    config = config or PipelineConfig()
 
     # Initialize Vertex AI
     vertexai.init(project=gc_project_id, location=REGION)
-    model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding@001")
 
-    # List video files in GCS bucket
+    # A dry run embeds and upserts with stubs, so it needs neither Pinecone nor the model
+    model = index = None
+    if not config.dry_run:
+        # Initialize Pinecone
+        api_key = os.getenv('PINECONE_API_KEY')
+        if not api_key:
+            raise ValueError("PINECONE_API_KEY environment variable is not set.")
+        pc = Pinecone(api_key=api_key, source_tag="pinecone:stl_sample_app")
+        index = pc.Index(pinecone_index_name)
+        model = MultiModalEmbeddingModel.from_pretrained("multimodalembedding@001")
+
+    # List, embed and upsert the videos in a streaming pipeline
     client = storage.Client()
-    blobs = client.list_blobs(gcs_bucket_name, prefix=gcs_folder_name)
-    video_files = [
-        blob.name.replace(f"{gcs_folder_name}/", "")
-        for blob in blobs
-        if blob.name.lower().endswith(SUPPORTED_VIDEO_FORMATS)
-    ]
-
-    # Process videos in parallel
-    total_videos = len(video_files)
-    file_path = f'{gcs_bucket_name}/{gcs_folder_name}/'
-    with ThreadPoolExecutor() as executor:
-        futures = [
-            executor.submit(
-                process_video,
-                video_file,
-                gcs_bucket_name,
-                gcs_folder_name,
-                model,
-                index,
-                file_path,
-                i + 1,
-                total_videos
-            )
-            for i, video_file in enumerate(video_files)
-        ]
-        for future in as_completed(futures):
-            future.result()  # This will re-raise any exceptions that occurred during processing
+    run_ingestion(client, model, index, gcs_bucket_name, gcs_folder_name, [modality], config, pinecone_index_name)
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Process videos from a GCS bucket and upsert embeddings to Pinecone.')
@@ -163,9 +170,12 @@ if __name__ == '__main__':
     parser.add_argument('-b', '--bucket', type=str, required=True, help='The Google Cloud Storage bucket name.')
     parser.add_argument('-f', '--folder', type=str, required=True, help='The GCS folder containing videos in the bucket.')
     parser.add_argument('-i', '--index', type=str, required=True, help='The Pinecone Index name.')
+    add_pipeline_arguments(parser)
+    add_video_arguments(parser)
 
     args = parser.parse_args()
-    main(args.project, args.bucket, args.folder, args.index)
+    modality = video_modality_from_args(parser, args)
+    main(args.project, args.bucket, args.folder, args.index, PipelineConfig.from_args(args), modality)
 
 """
 Setup Instructions:
@@ -204,6 +214,36 @@ $ python video_embedding_processor.py -p my-gcp-project -b my-video-bucket -f pr
 Notes:
 - Ensure that your Google Cloud service account has the necessary permissions to access the GCS bucket and use Vertex AI.
 - The script supports the following video formats: AVI, FLV, MKV, MOV, MP4, MPEG, MPG, WEBM, and WMV.
-- The script uses exponential backoff for retrying failed operations, with a maximum of 5 attempts per video.
+- Embedding requests are paced by an adaptive rate limiter that starts at --initial-rate
+  requests/sec, speeds up while requests succeed and slows down on quota errors (HTTP 429),
+  honoring Retry-After, up to --max-rate. Quota and transient errors are retried with capped,
+  jittered exponential backoff, up to --max-retries attempts per video. Other errors (e.g. an
+  unreadable file) are not retried; failed videos are listed in a dead-letter file (--dead-letter)
+  and processed again on the next run.
+- Vectors are upserted in batches of up to --batch-size vectors (and at most 2 MB per request), with
+  --upsert-workers batches sent concurrently. Failed batches are retried on their own.
+- Files are processed by a streaming pipeline (list -> load -> embed -> upsert) whose stages
+  are connected by bounded queues (--queue-size) and run --load-workers and --embed-workers
+  threads. Listing is paged, upserts start as soon as the first videos are embedded, and progress
+  is printed every --progress-interval seconds. Use ingest.py for folders with both images and videos.
+- Vector IDs are derived from the bucket, video path and segment start offset, so re-running the
+  script overwrites vectors instead of duplicating them. A checkpoint manifest (--manifest)
+  records the GCS generation of every upserted video, and re-runs only embed new or changed
+  videos; an interrupted run resumes where it stopped. Use --full to re-embed everything and
+  --prune to delete the vectors of videos that were removed from the bucket.
+- By default the first END_OFFSET_SEC (120) seconds of every video are embedded in segments of
+  --segment-sec seconds (default INTERVAL_SEC, 15). With --full-length, every video is downloaded
+  to a temporary file in the load stage to probe its duration with ffprobe (install ffmpeg), then
+  split into windows of --window-sec seconds (at most 120, the model's limit per request). The
+  windows are embedded concurrently by the --embed-workers threads, each paced by the rate limiter
+  and retried on its own, and their segment vectors keep their absolute offsets and segment
+  numbers. A video is upserted once all of its windows are embedded. Videos ingested before
+  without --full-length are unchanged in the manifest, run once with --full to embed the rest of them.
+- With --profile, the latency histograms, throughput, retries and worker utilization of every
+  stage (and of the upsert requests) are written to a JSON and a CSV report at the end, showing
+  whether loading, embedding or upserting is the bottleneck. With --dry-run, the videos are listed
+  and loaded, but embedded and upserted by stubs (with --dry-run-embed-ms and --dry-run-upsert-ms
+  of simulated latency), so thread counts can be sized without spending quota or touching the
+  index and manifest.
 - Video embedding settings (INTERVAL_SEC, START_OFFSET_SEC, END_OFFSET_SEC) can be adjusted at the top of the script.
 """
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""
+Video Windows for Full-Length Embedding
+
+Used by the video processor's `--full-length` mode. The embedding model covers at most
+MAX_WINDOW_SEC seconds of a video per request, so longer videos are split into windows that are
+embedded as separate requests: `probe_video` reads a video's duration with ffprobe (from a
+temporary download, so ffmpeg must be installed) and `plan_windows` splits that duration into
+windows aligned on the segment length.
+"""
+
+import math
+import os
+import subprocess
+import tempfile
+
+# Longest part of a video the model embeds in one request
+MAX_WINDOW_SEC = 120
+
+
+def probe_duration(path):
+    """Returns the duration in seconds of a local video file, read with ffprobe."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', path],
+        capture_output=True, text=True,
+    )
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        # A ValueError is not retried, the file is unreadable
+        raise ValueError(f"ffprobe could not read the duration of the video: {result.stderr.strip() or result.stdout.strip()}")
+
+
+def probe_video(item):
+    """Downloads the video of a pipeline item to a temporary file and returns its duration."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, os.path.basename(item.blob.name))
+        item.blob.download_to_filename(path)
+        return probe_duration(path)
+
+
+def plan_windows(duration_sec, window_sec, interval_sec):
+    """
+    Splits a video of `duration_sec` into `(start_offset_sec, end_offset_sec)` windows of at most `window_sec`.
+
+    Windows start on multiples of `interval_sec`, so they produce the same segments, with the same
+    offsets and vector IDs, as a single request over the whole video would.
+    """
+    window_sec = max(interval_sec, window_sec - window_sec % interval_sec)
+    end = math.ceil(duration_sec)
+    return [(start, min(start + window_sec, end)) for start in range(0, end, window_sec)]